@@ -0,0 +1,268 @@
+"""
+App FastAPI completa della Vercel Function (adattamento di main.py)
+
+Caricata da api/index.py alla prima richiesta che non si serve dallo
+snapshot del catalogo (ares.coldstart).
+"""
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import List
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.middleware.cors import CORSMiddleware
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ares.activity import ActivityLog
+from ares.catalog import CatalogCache, cached_response
+from ares.coldstart import config_payload, health_payload
+from ares.counters import METRICS, RESOLUTIONS, AnalyticsCounters
+from ares.geo import GeoCache
+from ares.log import get_logger
+from ares.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from ares.search import SearchCache
+from ares.storage import BookingError, open_store
+
+app = FastAPI(title="Ares Travel API", version="5.2")
+
+log = get_logger("ares.api")
+
+# CORS per Vercel
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(MetricsMiddleware)
+
+# Storage SQLite (Vercel read-only: database in /tmp, seed da data.json)
+DATA_FILE = os.path.join(os.path.dirname(__file__), "..", "data.json")
+TEMP_DATA_FILE = "/tmp/data.json"
+DB_FILE = os.getenv("ARES_DB", "/tmp/ares.db")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    # Apertura lazy: migrazione one-shot al primo accesso
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_store(DB_FILE, TEMP_DATA_FILE, DATA_FILE)
+    return _store
+
+_activity = None
+_activity_lock = threading.Lock()
+
+def get_activity():
+    # Log attività sullo stesso database; alla prima apertura importa visit_history/live_activity
+    global _activity
+    if _activity is None:
+        with _activity_lock:
+            if _activity is None:
+                activity = ActivityLog(get_store())
+                imported = activity.import_legacy()
+                if imported:
+                    log.info("activity_imported", **imported)
+                _activity = activity
+    return _activity
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+def get_analytics():
+    # Contatori write-behind su database separato (/tmp), flush in background e all'uscita
+    global _analytics
+    if _analytics is None:
+        with _analytics_lock:
+            if _analytics is None:
+                analytics = AnalyticsCounters(os.getenv("ANALYTICS_DB", "/tmp/analytics.db"),
+                                              flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5")))
+                try:
+                    with open(DATA_FILE, "r", encoding="utf-8") as f:
+                        analytics.seed(json.load(f).get("analytics", []))
+                except (OSError, ValueError):
+                    pass
+                analytics.start()
+                atexit.register(analytics.stop)
+                _analytics = analytics
+    return _analytics
+
+# Catalogo serializzato una volta per revisione dello store
+destinations_cache = CatalogCache(
+    build=lambda: {"destinations": get_store().documents("destinations")},
+    version=lambda: get_store().revision("destinations"),
+)
+
+# Indice geografico dei viaggi, ricostruito solo quando cambia la tabella trips
+geo_cache = GeoCache(
+    load=lambda: get_store().trips(),
+    version=lambda: get_store().revision("trips"),
+)
+
+# Indici di ricerca a faccette sui viaggi, stessa invalidazione
+search_cache = SearchCache(
+    load=lambda: get_store().trips(),
+    version=lambda: get_store().revision("trips"),
+)
+
+@app.get("/")
+async def health_check():
+    return JSONResponse(health_payload(get_store().count("destinations")))
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Valori della singola istanza serverless
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/destinations")
+async def get_destinations(request: Request):
+    return cached_response(request, destinations_cache.get())
+
+@app.get("/search")
+def search_trips(
+    interests: List[str] = Query(None), origin: List[str] = Query(None), month: List[int] = Query(None),
+    q: str = Query(None, max_length=200),
+    min_price: float = Query(None, ge=0), max_price: float = Query(None, ge=0),
+    date_from: str = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"), date_to: str = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    guests: int = Query(1, ge=1, le=20), sort: str = Query("price", pattern="^(price|date)$"),
+    limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)
+):
+    return JSONResponse(search_cache.get().find(
+        q, interests=interests or [], origins=origin or [], months=month or [],
+        min_price=min_price, max_price=max_price, date_from=date_from, date_to=date_to,
+        guests=guests, sort=sort, limit=limit, offset=offset
+    ))
+
+@app.get("/geo/bbox")
+def geo_bbox(
+    south: float = Query(..., ge=-90, le=90), west: float = Query(..., ge=-540, le=540),
+    north: float = Query(..., ge=-90, le=90), east: float = Query(..., ge=-540, le=540),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    items = geo_cache.get().bbox(south, west, north, east, limit=limit)
+    return JSONResponse({"count": len(items), "items": items})
+
+@app.get("/geo/nearest")
+def geo_nearest(
+    lat: float = Query(..., ge=-90, le=90), lng: float = Query(..., ge=-540, le=540),
+    k: int = Query(10, ge=1, le=100), max_km: float = Query(None, gt=0)
+):
+    results = geo_cache.get().nearest(lat, lng, k=k, max_km=max_km)
+    return JSONResponse({"results": [dict(item, distance_km=round(d, 1)) for d, item in results]})
+
+@app.get("/geo/clusters")
+def geo_clusters(
+    zoom: int = Query(..., ge=0, le=16),
+    south: float = Query(-90, ge=-90, le=90), west: float = Query(-180, ge=-540, le=540),
+    north: float = Query(90, ge=-90, le=90), east: float = Query(180, ge=-540, le=540)
+):
+    return JSONResponse({"zoom": zoom, "clusters": geo_cache.get().clusters(zoom, south, west, north, east)})
+
+@app.post("/activity")
+def record_activity(event: dict):
+    user_id, action = event.get("user_id"), event.get("action")
+    if not user_id or not action:
+        return JSONResponse({"success": False, "error": "user_id e action obbligatori"}, status_code=400)
+    trip_id = event.get("trip_id")
+    if trip_id is not None and not isinstance(trip_id, int):
+        return JSONResponse({"success": False, "error": "trip_id non valido"}, status_code=400)
+    recorded = get_activity().record(str(user_id), str(action), trip_id, event.get("details"))
+    if recorded and action == "view_trip" and trip_id is not None:
+        get_analytics().incr(trip_id, "views")
+    return JSONResponse({"success": True, "recorded": recorded})
+
+@app.get("/activity/live")
+def live_activity():
+    activity = get_activity()
+    viewers = activity.live_viewers()
+    return JSONResponse({"viewers": viewers, "total": sum(viewers.values()), "ttl": activity.viewer_ttl})
+
+@app.get("/activity/trips/{trip_id}")
+def trip_activity(trip_id: int, minutes: int = Query(60, ge=1, le=48 * 60)):
+    return JSONResponse(get_activity().trip_views(trip_id, minutes))
+
+@app.get("/profiles/{user_id}")
+def get_profile(user_id: str):
+    # Profilo + aggregati precalcolati: costo indipendente dalla lunghezza della cronologia
+    activity = get_activity().profile(user_id)
+    profile = get_store().get_profile(user_id)
+    if profile is None and activity is None:
+        return JSONResponse({"error": "Profilo non trovato"}, status_code=404)
+    return JSONResponse({**(profile or {"user_id": user_id}), "activity": activity})
+
+@app.get("/admin/analytics")
+def analytics_totals():
+    analytics = get_analytics()
+    return JSONResponse({"trips": list(analytics.totals().values()), "stats": analytics.stats()})
+
+@app.get("/admin/analytics/{trip_id}")
+def analytics_series(
+    trip_id: int,
+    metric: str = Query("views", pattern="^(" + "|".join(METRICS) + ")$"),
+    resolution: str = Query("hour", pattern="^(" + "|".join(RESOLUTIONS) + ")$"),
+    hours: int = Query(24, ge=1, le=24 * 365)
+):
+    analytics = get_analytics()
+    return JSONResponse({
+        "trip_id": trip_id,
+        "metric": metric,
+        "resolution": resolution,
+        "series": analytics.series(trip_id, metric, resolution, since=time.time() - hours * 3600),
+        "totals": analytics.totals(trip_id).get(trip_id)
+    })
+
+@app.get("/config")
+async def get_config():
+    return JSONResponse(config_payload())
+
+@app.post("/bookings")
+def create_booking(booking_data: dict):
+    # Handler sync: FastAPI lo esegue nel threadpool, SQLite serializza le scritture
+    store = get_store()
+    
+    new_booking = {
+        "tripId": booking_data.get("tripId"),
+        "customerName": booking_data.get("customerName"),
+        "customerEmail": booking_data.get("customerEmail"),
+        "guests": booking_data.get("guests", 1),
+        "notes": booking_data.get("notes", ""),
+        "bookingDate": datetime.now().isoformat(),
+        "status": "confirmed"
+    }
+    
+    # ID monotono, controllo posti e insert in un'unica transazione
+    try:
+        new_booking = store.reserve_booking(new_booking)
+    except BookingError as e:
+        return JSONResponse({
+            "success": False,
+            "error": e.message
+        }, status_code=e.status)
+    except sqlite3.Error as e:
+        # Database bloccato oltre il busy_timeout (o vincolo violato): il client riprova
+        log.warning("booking_store_error", trip_id=new_booking["tripId"], error=str(e))
+        return JSONResponse({
+            "success": False,
+            "error": "Prenotazione temporaneamente non disponibile, riprova tra poco"
+        }, status_code=503)
+    
+    trip = store.get_trip(new_booking["tripId"]) or {}
+    analytics = get_analytics()
+    analytics.incr(new_booking["tripId"], "bookings")
+    analytics.incr(new_booking["tripId"], "revenue", (trip.get("price_chf") or 0) * new_booking["guests"])
+    
+    booking_id = new_booking["id"]
+    return JSONResponse({
+        "success": True,
+        "booking": new_booking,
+        "message": f"Prenotazione {booking_id} creata con successo!"
+    })
@@ -0,0 +1,3 @@
+"""
+ARES TRAVEL - moduli condivisi tra main.py (Replit) e api/index.py (Vercel)
+"""
@@ -0,0 +1,272 @@
+"""
+Log attività utenti fuori dal documento principale
+
+Prima ogni evento (es. view_trip) veniva appeso a user_profiles[].visit_history
+e i viewer live restavano in live_activity per sempre. Qui:
+
+    activity_log       append-only (utente, azione, viaggio, ts), indicizzato per utente
+    activity_summary   aggregati per utente aggiornati ad ogni evento (lettura O(1))
+    activity_minutes   viste per viaggio per minuto (rollup a finestra)
+    activity_days      viste per viaggio per giorno (minuti compattati)
+    live_viewers       heartbeat per utente con TTL
+
+Eventi identici ravvicinati (stessa azione e viaggio entro DEDUPE_SECONDS)
+aggiornano solo last_seen. compact() scade i viewer, ripiega i minuti
+vecchi nei giorni e taglia il log grezzo per età e per utente.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from .log import get_logger
+from .storage import Store, _dumps
+
+log = get_logger("ares.activity")
+
+ACTIVITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    trip_id INTEGER,
+    ts REAL NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_log(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_activity_ts ON activity_log(ts);
+CREATE TABLE IF NOT EXISTS activity_summary (
+    user_id TEXT PRIMARY KEY,
+    events INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_action TEXT,
+    last_trip_id INTEGER,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS activity_minutes (
+    trip_id INTEGER NOT NULL,
+    minute INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    PRIMARY KEY (trip_id, minute)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS activity_days (
+    trip_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    views INTEGER NOT NULL,
+    PRIMARY KEY (trip_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS live_viewers (
+    user_id TEXT PRIMARY KEY,
+    trip_id INTEGER,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_viewers_trip ON live_viewers(trip_id, last_seen);
+"""
+
+VIEW_ACTION = "view_trip"
+DEDUPE_SECONDS = 30
+VIEWER_TTL = 120
+RECENT_EVENTS = 20
+MINUTE_RETENTION = 48 * 3600
+RAW_RETENTION = 30 * 86400
+MAX_EVENTS_PER_USER = 500
+COMPACT_INTERVAL = 600
+
+
+def _timestamp(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ActivityLog:
+    def __init__(self, store: Store, dedupe_seconds: float = DEDUPE_SECONDS,
+                 viewer_ttl: float = VIEWER_TTL, compact_interval: float = COMPACT_INTERVAL):
+        self.store = store
+        self.dedupe_seconds = dedupe_seconds
+        self.viewer_ttl = viewer_ttl
+        self.compact_interval = compact_interval
+        self.store._conn().executescript(ACTIVITY_SCHEMA)
+        self._compact_lock = threading.Lock()
+        self._last_compact = store.get_meta("activity_compacted_at", 0)
+
+    # === SCRITTURA ===
+    def record(self, user_id: str, action: str, trip_id: Optional[int] = None,
+               details: Optional[dict] = None, now: Optional[float] = None) -> bool:
+        """Registra un evento; False se era un duplicato ravvicinato (solo last_seen aggiornato)"""
+        now = time.time() if now is None else now
+        with self.store.transaction() as conn:
+            recorded = self._record(conn, user_id, action, trip_id, details, now)
+        self.maybe_compact(now)
+        return recorded
+
+    def _record(self, conn, user_id: str, action: str, trip_id: Optional[int],
+                details: Optional[dict], now: float) -> bool:
+        if action == VIEW_ACTION and trip_id is not None:
+            conn.execute(
+                "INSERT INTO live_viewers (user_id, trip_id, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET trip_id = excluded.trip_id, "
+                "last_seen = MAX(last_seen, excluded.last_seen)",
+                (user_id, trip_id, now),
+            )
+        row = conn.execute(
+            "SELECT events, first_seen, last_seen, last_action, last_trip_id, body "
+            "FROM activity_summary WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row and row[3] == action and row[4] == trip_id and 0 <= now - row[2] < self.dedupe_seconds:
+            conn.execute("UPDATE activity_summary SET last_seen = ? WHERE user_id = ?", (now, user_id))
+            return False
+
+        conn.execute(
+            "INSERT INTO activity_log (user_id, action, trip_id, ts, details) VALUES (?, ?, ?, ?, ?)",
+            (user_id, action, trip_id, now, _dumps(details) if details else None),
+        )
+        if action == VIEW_ACTION and trip_id is not None:
+            conn.execute(
+                "INSERT INTO activity_minutes (trip_id, minute, views) VALUES (?, ?, 1) "
+                "ON CONFLICT(trip_id, minute) DO UPDATE SET views = views + 1",
+                (trip_id, int(now // 60)),
+            )
+
+        events, first_seen, last_seen = (row[0], row[1], max(row[2], now)) if row else (0, now, now)
+        body = json.loads(row[5]) if row else {"actions": {}, "trips": {}, "recent": []}
+        body["actions"][action] = body["actions"].get(action, 0) + 1
+        if trip_id is not None:
+            body["trips"][str(trip_id)] = body["trips"].get(str(trip_id), 0) + 1
+        body["recent"] = ([{"action": action, "trip_id": trip_id, "ts": now}] + body["recent"])[:RECENT_EVENTS]
+        conn.execute(
+            "INSERT OR REPLACE INTO activity_summary "
+            "(user_id, events, first_seen, last_seen, last_action, last_trip_id, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, events + 1, min(first_seen, now), last_seen, action, trip_id, _dumps(body)),
+        )
+        return True
+
+    # === LETTURA (aggregati precalcolati) ===
+    def profile(self, user_id: str) -> Optional[dict]:
+        row = self.store._conn().execute(
+            "SELECT events, first_seen, last_seen, body FROM activity_summary WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        body = json.loads(row[3])
+        top = sorted(body["trips"].items(), key=lambda kv: -kv[1])[:5]
+        return {
+            "events": row[0],
+            "first_seen": datetime.fromtimestamp(row[1]).isoformat(),
+            "last_seen": datetime.fromtimestamp(row[2]).isoformat(),
+            "actions": body["actions"],
+            "top_trips": [{"trip_id": int(t), "events": n} for t, n in top],
+            "recent": [{"action": e["action"], "trip_id": e["trip_id"],
+                        "timestamp": datetime.fromtimestamp(e["ts"]).isoformat()} for e in body["recent"]],
+        }
+
+    def live_viewers(self, now: Optional[float] = None) -> Dict[int, int]:
+        """Viewer attivi per viaggio (heartbeat entro il TTL)"""
+        now = time.time() if now is None else now
+        rows = self.store._conn().execute(
+            "SELECT trip_id, COUNT(*) FROM live_viewers WHERE last_seen >= ? GROUP BY trip_id",
+            (now - self.viewer_ttl,),
+        ).fetchall()
+        return {trip_id: n for trip_id, n in rows}
+
+    def trip_views(self, trip_id: int, minutes: int = 60, now: Optional[float] = None) -> dict:
+        """Viste per minuto nella finestra richiesta (dal rollup, non dal log)"""
+        now = time.time() if now is None else now
+        current = int(now // 60)
+        rows = self.store._conn().execute(
+            "SELECT minute, views FROM activity_minutes WHERE trip_id = ? AND minute > ? ORDER BY minute",
+            (trip_id, current - minutes),
+        ).fetchall()
+        return {
+            "trip_id": trip_id,
+            "minutes": minutes,
+            "views": sum(v for _, v in rows),
+            "per_minute": [[datetime.fromtimestamp(m * 60).isoformat(timespec="minutes"), v] for m, v in rows],
+        }
+
+    # === COMPATTAZIONE ===
+    def maybe_compact(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if now - self._last_compact >= self.compact_interval and self._compact_lock.acquire(blocking=False):
+            try:
+                self.compact(now)
+            finally:
+                self._compact_lock.release()
+
+    def compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        now = time.time() if now is None else now
+        cutoff_minute = int((now - MINUTE_RETENTION) // 60)
+        with self.store.transaction() as conn:
+            counts = {
+                "viewers_expired": conn.execute(
+                    "DELETE FROM live_viewers WHERE last_seen < ?", (now - self.viewer_ttl,)
+                ).rowcount,
+            }
+            conn.execute(
+                "INSERT INTO activity_days (trip_id, day, views) "
+                "SELECT trip_id, date(minute * 60, 'unixepoch'), SUM(views) FROM activity_minutes "
+                "WHERE minute < ? GROUP BY 1, 2 "
+                "ON CONFLICT(trip_id, day) DO UPDATE SET views = views + excluded.views",
+                (cutoff_minute,),
+            )
+            counts["minutes_folded"] = conn.execute(
+                "DELETE FROM activity_minutes WHERE minute < ?", (cutoff_minute,)
+            ).rowcount
+            counts["events_expired"] = conn.execute(
+                "DELETE FROM activity_log WHERE ts < ?", (now - RAW_RETENTION,)
+            ).rowcount
+            trimmed = 0
+            heavy = conn.execute(
+                "SELECT user_id FROM activity_log GROUP BY user_id HAVING COUNT(*) > ?", (MAX_EVENTS_PER_USER,)
+            ).fetchall()
+            for (user_id,) in heavy:
+                trimmed += conn.execute(
+                    "DELETE FROM activity_log WHERE user_id = ? AND id <= ("
+                    "SELECT id FROM activity_log WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (user_id, user_id, MAX_EVENTS_PER_USER),
+                ).rowcount
+            counts["events_trimmed"] = trimmed
+            self.store.set_meta("activity_compacted_at", now, conn)
+        self._last_compact = now
+        if any(counts.values()):
+            log.info("activity_compacted", **counts)
+        return counts
+
+    # === IMPORT DAL LAYOUT PRECEDENTE ===
+    def import_legacy(self) -> Dict[str, int]:
+        """Sposta visit_history e live_activity dal documento al log (una sola volta)"""
+        if self.store.get_meta("activity_imported_at") is not None:
+            return {}
+        counts = {"events": 0, "duplicates": 0, "viewers": 0}
+        with self.store.transaction() as conn:
+            if self.store.get_meta("activity_imported_at") is not None:
+                return {}
+            rows = conn.execute("SELECT body FROM user_profiles").fetchall()
+            for (body,) in rows:
+                profile = json.loads(body)
+                history = profile.pop("visit_history", None)
+                if history is None:
+                    continue
+                events = sorted((e for e in history if _timestamp(e.get("timestamp")) is not None),
+                                key=lambda e: _timestamp(e["timestamp"]))
+                for event in events:
+                    recorded = self._record(conn, profile["user_id"], event.get("action", "unknown"),
+                                            event.get("trip_id"), event.get("details"),
+                                            _timestamp(event["timestamp"]))
+                    counts["events" if recorded else "duplicates"] += 1
+                self.store.put_profile(profile, conn)
+            live = self.store.get_meta("live_activity") or {}
+            for user_id, viewer in (live.get("viewers") or {}).items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO live_viewers (user_id, trip_id, last_seen) VALUES (?, ?, ?)",
+                    (user_id, viewer.get("trip_id"), viewer.get("last_seen") or 0),
+                )
+                counts["viewers"] += 1
+            conn.execute("DELETE FROM meta WHERE key = 'live_activity'")
+            self.store.set_meta("activity_imported_at", datetime.now().isoformat(), conn)
+        return counts
@@ -0,0 +1,209 @@
+"""
+Cache risposte AI con coalescing delle richieste
+
+- chiave = prompt normalizzato (minuscole, accenti rimossi, punteggiatura e spazi compressi)
+- LRU limitata con TTL
+- opzionale: match di quasi-duplicati via indice di trigrammi (Jaccard)
+- single-flight: N domande identiche concorrenti -> una sola chiamata upstream;
+  se chi calcola viene cancellato, chi era in attesa riprova invece di fallire
+- versione opzionale (es. catalogo): quando cambia la cache viene svuotata
+"""
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+# Risultato per chi attende una chiamata il cui leader è stato cancellato: riprovare
+_RETRY = object()
+
+
+def fold_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_prompt(text: str) -> str:
+    text = fold_accents(text.lower())
+    text = _PUNCT.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class ResponseCache:
+    """LRU + TTL in memoria davanti a una funzione async costosa"""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600.0, similarity: float = 0.0, ngram: int = 3,
+                 version: Optional[Callable[[], Hashable]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity = similarity
+        self.ngram = ngram
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._grams: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._version = version or (lambda: 0)
+        self._seen_version = self._version()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # === VERSIONE ===
+    def version(self) -> Hashable:
+        """Versione corrente dei dati da cui dipendono le risposte; se è cambiata svuota la cache"""
+        version = self._version()
+        if version != self._seen_version:
+            self._seen_version = version
+            if self._entries:
+                self.clear()
+                self.invalidations += 1
+        return version
+
+    # === LOOKUP ===
+    def get(self, prompt: str, count: bool = False) -> Optional[dict]:
+        """Lookup esatto (più quasi-duplicati se abilitati); count aggiorna hits/misses"""
+        self.version()
+        key = normalize_prompt(prompt)
+        value = self._lookup(key)
+        if value is None and self.similarity > 0:
+            near = self._nearest(key)
+            if near is not None:
+                value = self._lookup(near)
+                if value is not None:
+                    self.near_hits += 1
+        if count:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _nearest(self, key: str) -> Optional[str]:
+        grams = ngrams(key, self.ngram)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        best, best_score = None, self.similarity
+        for candidate, common in shared.items():
+            union = len(grams) + len(self._grams[candidate]) - common
+            score = common / union if union else 0.0
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    # === STORE ===
+    def put(self, prompt: str, value: dict, version: Optional[Hashable] = None):
+        """Memorizza; con `version` (letta prima del calcolo) scarta risposte su dati ormai cambiati"""
+        current = self.version()
+        if version is not None and version != current:
+            return
+        key = normalize_prompt(prompt)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        if self.similarity > 0:
+            grams = ngrams(key, self.ngram)
+            self._grams[key] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        for gram in self._grams.pop(key, ()):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def clear(self):
+        self._entries.clear()
+        self._grams.clear()
+        self._postings.clear()
+
+    # === SINGLE-FLIGHT ===
+    async def get_or_compute(self, prompt: str, compute: Callable[[], Awaitable[dict]],
+                             cacheable: Callable[[dict], bool] = lambda r: not r.get("error")) -> dict:
+        """Ritorna dalla cache, si accoda a una chiamata identica in volo, o calcola"""
+        key = normalize_prompt(prompt)
+        # Il leader cancellato sveglia i follower con _RETRY: uno di loro ricalcola
+        while True:
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            result = await asyncio.shield(pending)
+            if result is not _RETRY:
+                return result
+
+        cached = self.get(prompt, count=True)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        version = self.version()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            # La cancellazione riguarda solo questo chiamante, non chi era in coda
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "exception never retrieved" se nessuno era in attesa
+            future.exception()
+            raise
+        else:
+            if cacheable(result):
+                self.put(prompt, result, version)
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "inflight": len(self._inflight),
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
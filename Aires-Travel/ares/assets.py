@@ -0,0 +1,223 @@
+"""
+Pipeline asset statici (texture della Terra)
+
+Build offline (richiede Pillow, non serve a runtime):
+
+    python -m ares.assets build [public/assets/earth] [public/assets/build]
+
+Per ogni immagine produce livelli ridotti (512/1k/2k/4k, mai oltre la
+risoluzione sorgente) in JPG/WebP/AVIF con nome hashato sul contenuto,
+più un manifest.json che il client usa per scegliere risoluzione e
+formato. A runtime AssetFiles serve gli URL hashati come immutabili,
+con supporto Range e invio zero-copy dove il server ASGI lo consente.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from typing import Iterable, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+SIZES = (512, 1024, 2048, 4096)
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MANIFEST = "manifest.json"
+
+# formato -> (nome Pillow, opzioni encoder)
+FORMATS = {
+    "avif": ("AVIF", {"quality": 55, "speed": 4}),
+    "webp": ("WEBP", {"quality": 80, "method": 6}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+HASHED_NAME = re.compile(r"\.[0-9a-f]{10}\.[a-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+
+# === BUILD OFFLINE ===
+def _encode(image, fmt: str) -> bytes:
+    pil_format, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def available_formats() -> Tuple[str, ...]:
+    from PIL import features
+    return tuple(fmt for fmt in FORMATS if fmt == "jpg" or features.check(fmt))
+
+
+def build_levels(width: int, sizes: Iterable[int] = SIZES) -> list:
+    """Larghezze da generare: mai upscaling, sempre anche la sorgente"""
+    levels = sorted(size for size in set(sizes) if size < width)
+    return levels + [width]
+
+
+def build(src_dir: str, out_dir: str, url_prefix: str = "/assets/build",
+          sizes: Iterable[int] = SIZES) -> dict:
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("❌ Pillow non installato: pip install Pillow")
+
+    os.makedirs(out_dir, exist_ok=True)
+    formats = available_formats()
+    manifest = {"formats": list(formats), "assets": {}}
+    written = set()
+
+    for filename in sorted(os.listdir(src_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in SOURCE_EXTENSIONS:
+            continue
+        with Image.open(os.path.join(src_dir, filename)) as source:
+            source = source.convert("RGB")
+            levels = []
+            for width in build_levels(source.width, sizes):
+                height = round(source.height * width / source.width)
+                image = source if width == source.width else source.resize(
+                    (width, height), Image.LANCZOS, reducing_gap=3.0)
+                level = {"width": width, "height": height}
+                for fmt in formats:
+                    data = _encode(image, fmt)
+                    name = f"{stem}.{width}.{hashlib.sha256(data).hexdigest()[:10]}.{fmt}"
+                    path = os.path.join(out_dir, name)
+                    if not os.path.exists(path):
+                        with open(path, "wb") as f:
+                            f.write(data)
+                    written.add(name)
+                    level[fmt] = f"{url_prefix}/{name}"
+                    level[f"{fmt}_bytes"] = len(data)
+                levels.append(level)
+        manifest["assets"][stem] = levels
+        print(f"🖼️  {filename}: {len(levels)} livelli x {len(formats)} formati")
+
+    # Rimuove le varianti di build precedenti non più referenziate
+    for name in os.listdir(out_dir):
+        if HASHED_NAME.search(name) and name not in written:
+            os.unlink(os.path.join(out_dir, name))
+
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+# === SERVING ===
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Singolo range `bytes=a-b` -> (start, end) inclusivi; None = risposta intera"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multi-range non supportato: si serve il file intero (consentito da RFC 9110)
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class AssetFileResponse(FileResponse):
+    """FileResponse con range opzionale e invio zero-copy (estensione ASGI pathsend)"""
+
+    def __init__(self, *args, byte_range: Optional[Tuple[int, int]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.byte_range = byte_range
+        self.headers["accept-ranges"] = "bytes"
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        if self.byte_range is None and (self.send_header_only or "http.response.pathsend" not in extensions):
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif self.byte_range is None:
+            # Il server invia il file direttamente (sendfile), senza passare dall'app
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+        else:
+            start, end = self.byte_range
+            remaining = end - start + 1
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk,
+                                "more_body": remaining > 0 and bool(chunk)})
+                    if not chunk:
+                        break
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles con Cache-Control per URL hashati e supporto Range"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        response = AssetFileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                     method=scope["method"])
+        response.headers["cache-control"] = IMMUTABLE if HASHED_NAME.search(os.fspath(full_path)) else REVALIDATE
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if range_header is None or status_code != 200 or not self._if_range_matches(response, request_headers):
+            return response
+        try:
+            byte_range = parse_range(range_header, stat_result.st_size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={
+                "content-range": f"bytes */{stat_result.st_size}",
+                "accept-ranges": "bytes",
+            })
+        if byte_range is None:
+            return response
+        partial = AssetFileResponse(full_path, stat_result=stat_result, method=scope["method"],
+                                    byte_range=byte_range)
+        partial.headers["cache-control"] = response.headers["cache-control"]
+        return partial
+
+    @staticmethod
+    def _if_range_matches(response: Response, request_headers: Headers) -> bool:
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        return if_range.strip('" ') in (response.headers["etag"].strip('"'), response.headers["last-modified"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Uso: python -m ares.assets build [src_dir] [out_dir]")
+        sys.exit(1)
+    src = sys.argv[2] if len(sys.argv) > 2 else "public/assets/earth"
+    out = sys.argv[3] if len(sys.argv) > 3 else "public/assets/build"
+    result = build(src, out)
+    print(f"✅ Manifest scritto in {os.path.join(out, MANIFEST)} ({len(result['assets'])} asset)")
@@ -0,0 +1,116 @@
+"""
+Cache di processo per il catalogo viaggi
+
+Il catalogo (piccolo, cambia raramente) viene serializzato una sola volta
+per versione: le richieste successive ricevono gli stessi bytes già pronti
+con un ETag forte, oppure 304 se il client ha già quella versione.
+
+Starlette viene importato solo da cached_response(): ares.coldstart usa
+gli helper di questo modulo senza pagarne l'import al cold start.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Optional
+
+if TYPE_CHECKING:
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+
+@dataclass(frozen=True)
+class CachedPayload:
+    body: bytes
+    etag: str
+    version: Hashable
+
+
+def etag_for(body: bytes) -> str:
+    """ETag forte derivato dal contenuto"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def encode_json(payload: Any) -> bytes:
+    # Stessa forma compatta di JSONResponse
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def etag_in(header: Optional[str], etag: str) -> bool:
+    """True se l'header If-None-Match contiene l'ETag (o è *)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def etag_matches(request: "Request", etag: str) -> bool:
+    return etag_in(request.headers.get("if-none-match"), etag)
+
+
+def cached_response(request: "Request", payload: CachedPayload,
+                    media_type: str = "application/json",
+                    cache_control: str = "public, max-age=0, must-revalidate") -> "Response":
+    """Risponde con i bytes precomputati o con 304 se l'ETag coincide"""
+    from starlette.responses import Response
+
+    headers = {"ETag": payload.etag, "Cache-Control": cache_control}
+    if etag_matches(request, payload.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload.body, media_type=media_type, headers=headers)
+
+
+class CatalogCache:
+    """Payload JSON precomputato, ricostruito solo quando cambia la versione
+
+    `build` produce il payload (dict/list), `version` ritorna un valore
+    economico da calcolare (revisione nello store, stat del file, costante)
+    che viene confrontato ad ogni get().
+    """
+
+    def __init__(self, build: Callable[[], Any], version: Optional[Callable[[], Hashable]] = None):
+        self._build = build
+        self._version = version or (lambda: 0)
+        self._lock = threading.Lock()
+        self._payload: Optional[CachedPayload] = None
+        self._bumps = 0
+
+    def get(self) -> CachedPayload:
+        version = (self._bumps, self._version())
+        payload = self._payload
+        if payload is not None and payload.version == version:
+            return payload
+        with self._lock:
+            payload = self._payload
+            if payload is None or payload.version != version:
+                body = encode_json(self._build())
+                payload = CachedPayload(body=body, etag=etag_for(body), version=version)
+                self._payload = payload
+        return payload
+
+    def bump(self):
+        """Invalidazione esplicita (es. dopo una modifica del catalogo)"""
+        self._bumps += 1
+
+
+class IndexCache:
+    """Struttura derivata dal catalogo (indici di ricerca, geo...), ricostruita solo quando cambia la versione"""
+
+    def __init__(self, build: Callable[[], Any], version: Optional[Callable[[], Hashable]] = None):
+        self._build = build
+        self._version = version or (lambda: 0)
+        self._lock = threading.Lock()
+        self._value: Any = None
+        self._value_version: Optional[Hashable] = None
+
+    def get(self) -> Any:
+        version = self._version()
+        if self._value is not None and self._value_version == version:
+            return self._value
+        with self._lock:
+            if self._value is None or self._value_version != version:
+                self._value = self._build()
+                self._value_version = version
+        return self._value
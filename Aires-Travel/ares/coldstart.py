@@ -0,0 +1,214 @@
+"""
+Avvio rapido della function serverless (api/index.py)
+
+Al cold start la prima richiesta pagava import di FastAPI (~0.8 s),
+costruzione dell'app e migrazione di data.json in SQLite. Qui:
+
+    snapshot   blob marshal precompilato al build con le risposte del
+               catalogo già serializzate (body + ETag), letto in una sola
+               lettura e valido finché data.json non cambia
+    ColdStartApp  dispatcher ASGI minimale: /, /config e /destinations
+               rispondono dallo snapshot senza importare FastAPI né
+               aprire il database; tutto il resto (e ogni richiesta
+               cross-origin o condizionata da CORS) passa all'app FastAPI
+               completa, importata alla prima richiesta che ne ha bisogno
+
+Build (insieme alle texture, prima del deploy):
+
+    python -m ares.coldstart build [data.json] [api/catalog.snapshot]
+"""
+import asyncio
+import marshal
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Optional
+
+from .catalog import encode_json, etag_for, etag_in
+from .log import get_logger
+from .metrics import HTTP_REQUESTS, HTTP_SECONDS
+
+log = get_logger("ares.coldstart")
+
+# Il formato marshal cambia tra versioni di Python: header con major.minor
+MAGIC = b"ARESNAP1" + bytes(sys.version_info[:2])
+CACHE_CONTROL = b"public, max-age=0, must-revalidate"
+VERSION = "5.2"
+
+
+def _source_signature(path: str) -> list:
+    with open(path, "rb") as f:
+        data = f.read()
+    return [len(data), zlib.crc32(data)]
+
+
+# === RISPOSTE CONDIVISE CON L'APP FASTAPI ===
+def health_payload(destinations: int) -> dict:
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "destinations": destinations,
+        "connections": 0,  # WebSocket gestito separatamente su Vercel
+        "ws": False,
+        "globe": "cesium",
+        "globe_details": {
+            "cesium_token": bool(os.getenv("CESIUM_TOKEN")),
+            "destinations_loaded": destinations
+        },
+        "openai": "vercel",
+        "openai_details": {
+            "mode": "vercel",
+            "enabled": bool(os.getenv("OPENAI_API_KEY"))
+        },
+        "version": VERSION
+    }
+
+
+def config_payload() -> dict:
+    return {
+        "cesiumToken": os.getenv("CESIUM_TOKEN", ""),
+        "openaiEnabled": bool(os.getenv("OPENAI_API_KEY")),
+        "version": VERSION
+    }
+
+
+# === SNAPSHOT ===
+def build_snapshot(data_path: str, out_path: str) -> dict:
+    """Migra data.json in uno store temporaneo e salva le risposte di catalogo
+
+    Passare dallo store garantisce gli stessi contenuti (e ordinamento)
+    che l'app FastAPI servirebbe dopo la migrazione.
+    """
+    import tempfile
+    from .storage import open_store
+
+    with tempfile.TemporaryDirectory(prefix="ares-snapshot-") as tmp:
+        store = open_store(os.path.join(tmp, "snapshot.db"), data_path)
+        destinations = store.documents("destinations")
+        store.close()
+    body = encode_json({"destinations": destinations})
+    snapshot = {
+        "source": _source_signature(data_path),
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "destination_count": len(destinations),
+        "destinations": (body, etag_for(body).encode("ascii")),
+    }
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + marshal.dumps(snapshot))
+    os.replace(tmp_path, out_path)
+    return {"path": out_path, "bytes": len(MAGIC) + len(marshal.dumps(snapshot)),
+            "destinations": len(destinations)}
+
+
+def load_snapshot(path: str, data_path: str) -> Optional[dict]:
+    """Snapshot se esiste, è di questa versione di Python e corrisponde a data.json"""
+    try:
+        with open(path, "rb") as f:
+            blob = f.read()
+        if not blob.startswith(MAGIC):
+            log.warning("snapshot_incompatible", path=path)
+            return None
+        snapshot = marshal.loads(blob[len(MAGIC):])
+        if snapshot["source"] != _source_signature(data_path):
+            log.warning("snapshot_stale", path=path, built_at=snapshot.get("built_at"))
+            return None
+        return snapshot
+    except FileNotFoundError:
+        log.info("snapshot_missing", path=path)
+    except (OSError, ValueError, EOFError, TypeError, KeyError) as e:
+        log.warning("snapshot_invalid", path=path, error=str(e))
+    return None
+
+
+# === DISPATCHER ASGI ===
+class ColdStartApp:
+    """Route di catalogo dallo snapshot, il resto all'app completa caricata on demand"""
+
+    def __init__(self, load_app: Callable[[], Callable], snapshot_path: str, data_path: str):
+        self._load_app = load_app
+        self._app: Optional[Callable] = None
+        self._lock = threading.Lock()
+        self.snapshot = load_snapshot(snapshot_path, data_path)
+        self.routes = {"/": self._health, "/config": self._config, "/destinations": self._destinations}
+        self.served = 0
+
+    def full_app(self) -> Callable:
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    start = time.perf_counter()
+                    self._app = self._load_app()
+                    log.info("full_app_loaded", ms=round((time.perf_counter() - start) * 1000, 1))
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            # L'app completa non ha hook di startup: niente import anticipato
+            await self._lifespan(receive, send)
+            return
+        handler = self._fast_handler(scope)
+        if handler is None:
+            app = self._app or await asyncio.to_thread(self.full_app)
+            await app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = await handler(scope, send)
+        self.served += 1
+        HTTP_SECONDS.observe(time.perf_counter() - start, method="GET", route=scope["path"])
+        HTTP_REQUESTS.inc(method="GET", route=scope["path"], status=status)
+
+    def _fast_handler(self, scope):
+        if scope["type"] != "http" or scope["method"] != "GET" or self.snapshot is None:
+            return None
+        # Richieste cross-origin: header CORS dal middleware dell'app completa
+        if any(name == b"origin" for name, _ in scope["headers"]):
+            return None
+        return self.routes.get(scope["path"])
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes = b"", headers: tuple = ()) -> int:
+        head = [(b"content-length", str(len(body)).encode("ascii"))]
+        if status != 304:
+            head.append((b"content-type", b"application/json"))
+        await send({"type": "http.response.start", "status": status, "headers": head + list(headers)})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+    async def _health(self, scope, send) -> int:
+        return await self._respond(send, 200, encode_json(health_payload(self.snapshot["destination_count"])))
+
+    async def _config(self, scope, send) -> int:
+        return await self._respond(send, 200, encode_json(config_payload()))
+
+    async def _destinations(self, scope, send) -> int:
+        body, etag = self.snapshot["destinations"]
+        headers = ((b"etag", etag), (b"cache-control", CACHE_CONTROL))
+        header = next((value for name, value in scope["headers"] if name == b"if-none-match"), None)
+        if header is not None and etag_in(header.decode("latin-1"), etag.decode("ascii")):
+            return await self._respond(send, 304, headers=headers)
+        return await self._respond(send, 200, body, headers)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Uso: python -m ares.coldstart build [data.json] [api/catalog.snapshot]")
+        sys.exit(1)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(root, "data.json")
+    out_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(root, "api", "catalog.snapshot")
+    result = build_snapshot(data_path, out_path)
+    print(f"✅ Snapshot {result['path']}: {result['bytes']} bytes, {result['destinations']} destinazioni")
@@ -0,0 +1,213 @@
+"""
+Memoria di conversazione per sessione (chat /ws)
+
+Ogni sessione (una connessione WebSocket, o un user_id se abilitato)
+tiene gli ultimi turni in un ring buffer (deque a lunghezza fissa) con
+i token già contati all'inserimento. I turni che escono dal ring
+confluiscono in un riepilogo estrattivo (prime frasi, troncate) limitato
+a sua volta in token: nessuna chiamata al modello per riassumere.
+
+    history()   riepilogo + turni più recenti che stanno nel budget di
+                token, da inserire tra il system prompt e la domanda
+    eviction    TTL di inattività e LRU sul numero di sessioni e sulla
+                memoria totale stimata (OrderedDict per ultimo uso)
+"""
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from .prompts import TOKENS_PER_MESSAGE, make_token_counter
+
+USER, ASSISTANT = "user", "assistant"
+SUMMARY_TITLE = "Riepilogo della conversazione precedente:"
+SUMMARY_LABELS = {USER: "Utente", ASSISTANT: "Ares"}
+
+# Stima memoria: tupla del turno + intero dei token, oggetto sessione + deque vuota
+TURN_OVERHEAD = sys.getsizeof((None, None, None)) + sys.getsizeof(2 ** 20)
+SESSION_OVERHEAD = 1024
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+Turn = Tuple[str, str, int]  # (ruolo, testo, token)
+
+
+def first_sentence(text: str, max_chars: int) -> str:
+    sentence = _SENTENCE.split(" ".join(text.split()), 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 1].rstrip() + "…"
+
+
+class Conversation:
+    __slots__ = ("key", "turns", "summary", "summary_tokens", "bytes", "last_used", "total_turns")
+
+    def __init__(self, key: str, max_turns: int, now: float):
+        self.key = key
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        # Righe del riepilogo: (testo, token), le più vecchie escono per prime
+        self.summary: Deque[Tuple[str, int]] = deque()
+        self.summary_tokens = 0
+        self.bytes = SESSION_OVERHEAD
+        self.last_used = now
+        self.total_turns = 0
+
+
+class ConversationStore:
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800.0, max_turns: int = 12,
+                 token_budget: int = 600, summary_tokens: int = 150, max_turn_chars: int = 2000,
+                 max_bytes: int = 64 * 1024 * 1024, count_tokens: Optional[Callable[[str], int]] = None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.max_turn_chars = max_turn_chars
+        self.max_bytes = max_bytes
+        self.count_tokens = count_tokens or make_token_counter()
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = {"ttl": 0, "lru": 0, "memory": 0}
+        self.summarized_turns = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    # === SESSIONI ===
+    def _session(self, key: str, now: float, create: bool) -> Optional[Conversation]:
+        self._expire(now)
+        conversation = self._sessions.get(key)
+        if conversation is None:
+            if not create:
+                return None
+            conversation = self._sessions[key] = Conversation(key, self.max_turns, now)
+            self.bytes += conversation.bytes
+        else:
+            self._sessions.move_to_end(key)
+        conversation.last_used = now
+        return conversation
+
+    def _expire(self, now: float):
+        # Ordine di ultimo uso: le sessioni scadute sono tutte in testa
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used < self.ttl:
+                break
+            self._drop(oldest.key, "ttl")
+
+    def _enforce_limits(self, keep: str):
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)), "lru")
+        while self.bytes > self.max_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._drop(oldest, "memory")
+
+    def _drop(self, key: str, reason: Optional[str] = None):
+        conversation = self._sessions.pop(key, None)
+        if conversation is not None:
+            self.bytes -= conversation.bytes
+            if reason:
+                self.evictions[reason] += 1
+
+    def discard(self, key: str):
+        """Fine sessione (connessione chiusa): memoria liberata subito"""
+        with self._lock:
+            self._drop(key)
+
+    # === SCRITTURA ===
+    def append(self, key: str, user_text: str, reply: str, now: Optional[float] = None):
+        """Registra uno scambio domanda/risposta completato"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            conversation = self._session(key, now, create=True)
+            for role, text in ((USER, user_text), (ASSISTANT, reply)):
+                text = text[:self.max_turn_chars]
+                delta = sys.getsizeof(text) + TURN_OVERHEAD
+                if len(conversation.turns) == conversation.turns.maxlen:
+                    evicted = conversation.turns[0]
+                    self._summarize(conversation, evicted)
+                    delta -= sys.getsizeof(evicted[1]) + TURN_OVERHEAD
+                conversation.turns.append((role, text, self.count_tokens(text)))
+                conversation.total_turns += 1
+                self._grow(conversation, delta)
+            self._enforce_limits(key)
+
+    def _grow(self, conversation: Conversation, delta: int):
+        conversation.bytes += delta
+        self.bytes += delta
+
+    def _summarize(self, conversation: Conversation, turn: Turn):
+        role, text, _ = turn
+        line = f"{SUMMARY_LABELS[role]}: {first_sentence(text, 160 if role == USER else 120)}"
+        tokens = self.count_tokens(line) + 1
+        conversation.summary.append((line, tokens))
+        conversation.summary_tokens += tokens
+        delta = sys.getsizeof(line) + TURN_OVERHEAD
+        while conversation.summary_tokens > self.summary_tokens and len(conversation.summary) > 1:
+            old, old_tokens = conversation.summary.popleft()
+            conversation.summary_tokens -= old_tokens
+            delta -= sys.getsizeof(old) + TURN_OVERHEAD
+        self._grow(conversation, delta)
+        self.summarized_turns += 1
+
+    # === LETTURA ===
+    def history(self, key: str, budget: Optional[int] = None, now: Optional[float] = None) -> List[dict]:
+        """Messaggi di contesto entro `budget` token: riepilogo (system) + turni recenti"""
+        now = time.monotonic() if now is None else now
+        budget = self.token_budget if budget is None else budget
+        with self._lock:
+            conversation = self._session(key, now, create=False)
+            if conversation is None:
+                return []
+            turns = list(conversation.turns)
+            summary = list(conversation.summary)
+            summary_cost = conversation.summary_tokens + self.count_tokens(SUMMARY_TITLE) + TOKENS_PER_MESSAGE
+        if summary and summary_cost <= budget // 2:
+            budget -= summary_cost
+        else:
+            summary = []
+        selected: List[Turn] = []
+        for turn in reversed(turns):
+            cost = turn[2] + TOKENS_PER_MESSAGE
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append(turn)
+        selected.reverse()
+        # Il contesto inizia sempre da una domanda dell'utente
+        while selected and selected[0][0] != USER:
+            selected.pop(0)
+        messages = [{"role": role, "content": text} for role, text, _ in selected]
+        if summary:
+            text = SUMMARY_TITLE + "\n" + "\n".join(f"- {line}" for line, _ in summary)
+            messages.insert(0, {"role": "system", "content": text})
+        return messages
+
+    def stats(self, top: int = 5) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            sessions = list(self._sessions.values())
+            now = time.monotonic()
+            largest = sorted(sessions, key=lambda c: c.bytes, reverse=True)[:top]
+            return {
+                "sessions": len(sessions),
+                "bytes": self.bytes,
+                "avg_session_bytes": round(self.bytes / len(sessions)) if sessions else 0,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "max_turns": self.max_turns,
+                "token_budget": self.token_budget,
+                "evictions": dict(self.evictions),
+                "summarized_turns": self.summarized_turns,
+                "largest": [{
+                    "bytes": c.bytes,
+                    "turns": len(c.turns),
+                    "total_turns": c.total_turns,
+                    "summary_tokens": c.summary_tokens,
+                    "idle_s": round(now - c.last_used, 1),
+                } for c in largest],
+            }
@@ -0,0 +1,303 @@
+"""
+Contatori analytics write-behind
+
+Gli incrementi (views, ai_suggestions, bookings, revenue per viaggio)
+finiscono in shard in memoria, ognuno col proprio lock, e vengono
+scritti a lotti su un database SQLite dedicato (separato dallo store
+delle prenotazioni):
+
+    - flush ogni `flush_interval` secondi o appena i delta in attesa
+      superano `max_pending` (thread di flush in background)
+    - ogni lotto è una sola transazione: serie minuto/ora/giorno, totali
+      e checkpoint (numero lotto, istante) vengono scritti insieme,
+      quindi dopo un crash il database è sempre coerente
+    - se la scrittura fallisce il lotto torna negli shard (niente perdite
+      né doppi conteggi); al massimo si perdono i delta non ancora
+      flushati al momento del crash
+    - più worker possono condividere il database: le scritture sono
+      incrementi (UPSERT value = value + delta)
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .log import get_logger
+from .storage import STORE_SECONDS
+
+log = get_logger("ares.analytics")
+
+METRICS = ("views", "ai_suggestions", "bookings", "revenue")
+
+# risoluzione -> (secondi per bucket, retention in secondi, None = per sempre)
+RESOLUTIONS = {
+    "minute": (60, 48 * 3600),
+    "hour": (3600, 90 * 86400),
+    "day": (86400, None),
+}
+
+COUNTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_series (
+    trip_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (trip_id, metric, resolution, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_series_age ON analytics_series(resolution, bucket);
+CREATE TABLE IF NOT EXISTS analytics_totals (
+    trip_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (trip_id, metric)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS analytics_checkpoint (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+Key = Tuple[int, str, int]  # (trip_id, metrica, minuto)
+
+
+def _number(value: float):
+    return int(value) if float(value).is_integer() else round(value, 2)
+
+
+class _Shard:
+    __slots__ = ("lock", "deltas")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas: Dict[Key, float] = {}
+
+
+class AnalyticsCounters:
+    def __init__(self, path: str, shards: int = 8, flush_interval: float = 5.0, max_pending: int = 5000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._shards = [_Shard() for _ in range(shards)]
+        # Incrementi non ancora scritti (trigger del flush): letto e azzerato dal thread di flush
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._local = threading.local()
+        self.flushes = 0
+        self.flushed_deltas = 0
+        self.failures = 0
+        self.last_flush: Optional[float] = None
+        self._conn().executescript(COUNTER_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    # === SCRITTURA (in memoria) ===
+    def incr(self, trip_id: int, metric: str, amount: float = 1, now: Optional[float] = None):
+        if metric not in METRICS:
+            raise ValueError(f"Metrica sconosciuta: {metric}")
+        now = time.time() if now is None else now
+        key = (trip_id, metric, int(now // 60))
+        shard = self._shards[hash(trip_id) % len(self._shards)]
+        with shard.lock:
+            deltas = shard.deltas
+            deltas[key] = deltas.get(key, 0) + amount
+        with self._lock:
+            self._pending += 1
+            full = self._pending >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def _drain(self) -> Tuple[Dict[Key, float], int]:
+        with self._lock:
+            pending, self._pending = self._pending, 0
+        batch: Dict[Key, float] = {}
+        for shard in self._shards:
+            with shard.lock:
+                deltas, shard.deltas = shard.deltas, {}
+            for key, value in deltas.items():
+                batch[key] = batch.get(key, 0) + value
+        return batch, pending
+
+    def _restore(self, batch: Dict[Key, float], pending: int):
+        for key, value in batch.items():
+            shard = self._shards[hash(key[0]) % len(self._shards)]
+            with shard.lock:
+                shard.deltas[key] = shard.deltas.get(key, 0) + value
+        # Il trigger max_pending continua a contare anche i delta rimessi in coda
+        with self._lock:
+            self._pending += pending
+
+    # === FLUSH ===
+    def flush(self, now: Optional[float] = None) -> int:
+        """Scrive i delta accumulati in una transazione; ritorna quanti"""
+        with self._flush_lock:
+            batch, pending = self._drain()
+            if not batch:
+                return 0
+            now = time.time() if now is None else now
+            try:
+                with STORE_SECONDS.time(kind="write", op="analytics_flush"):
+                    self._write(batch, now)
+            except sqlite3.Error as e:
+                self._restore(batch, pending)
+                self.failures += 1
+                log.error("analytics_flush_failed", requeued=len(batch), error=str(e))
+                return 0
+            self.flushes += 1
+            self.flushed_deltas += len(batch)
+            self.last_flush = now
+            return len(batch)
+
+    def _write(self, batch: Dict[Key, float], now: float):
+        series: Dict[Tuple[int, str, str, int], float] = {}
+        totals: Dict[Tuple[int, str], float] = {}
+        for (trip_id, metric, minute), value in batch.items():
+            ts = minute * 60
+            for resolution, (seconds, _) in RESOLUTIONS.items():
+                key = (trip_id, metric, resolution, int(ts // seconds) * seconds)
+                series[key] = series.get(key, 0) + value
+            totals[(trip_id, metric)] = totals.get((trip_id, metric), 0) + value
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO analytics_series (trip_id, metric, resolution, bucket, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(trip_id, metric, resolution, bucket) DO UPDATE SET value = value + excluded.value",
+                [(*key, value) for key, value in series.items()],
+            )
+            conn.executemany(
+                "INSERT INTO analytics_totals (trip_id, metric, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(trip_id, metric) DO UPDATE SET value = value + excluded.value, "
+                "updated_at = excluded.updated_at",
+                [(*key, value, now) for key, value in totals.items()],
+            )
+            for resolution, (seconds, retention) in RESOLUTIONS.items():
+                if retention is not None:
+                    conn.execute("DELETE FROM analytics_series WHERE resolution = ? AND bucket < ?",
+                                 (resolution, now - retention))
+            row = conn.execute("SELECT value FROM analytics_checkpoint WHERE key = 'batch'").fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO analytics_checkpoint (key, value) VALUES ('batch', ?)",
+                (json.dumps({"seq": (json.loads(row[0])["seq"] if row else 0) + 1, "at": now,
+                             "deltas": len(batch)}),),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # === FLUSH IN BACKGROUND ===
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ferma il thread e scrive quanto rimasto in memoria"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("analytics_flush_error", error=str(e))
+
+    # === LETTURA ===
+    def _pending_totals(self, trip_id: Optional[int] = None) -> Dict[Tuple[int, str], float]:
+        pending: Dict[Tuple[int, str], float] = {}
+        for shard in self._shards:
+            with shard.lock:
+                items = list(shard.deltas.items())
+            for (trip, metric, _), value in items:
+                if trip_id is None or trip == trip_id:
+                    pending[(trip, metric)] = pending.get((trip, metric), 0) + value
+        return pending
+
+    def totals(self, trip_id: Optional[int] = None, include_pending: bool = True) -> Dict[int, dict]:
+        """Totali per viaggio nel formato delle voci `analytics` di data.json"""
+        query, args = "SELECT trip_id, metric, value, updated_at FROM analytics_totals", ()
+        if trip_id is not None:
+            query, args = query + " WHERE trip_id = ?", (trip_id,)
+        result: Dict[int, dict] = {}
+
+        def entry(trip: int) -> dict:
+            return result.setdefault(trip, {"trip_id": trip, **{m: 0 for m in METRICS}, "last_updated": None})
+
+        for trip, metric, value, updated_at in self._conn().execute(query, args):
+            item = entry(trip)
+            item[metric] = _number(value)
+            updated = datetime.fromtimestamp(updated_at).isoformat()
+            item["last_updated"] = max(item["last_updated"] or updated, updated)
+        if include_pending:
+            for (trip, metric), value in self._pending_totals(trip_id).items():
+                entry(trip)[metric] = _number(entry(trip)[metric] + value)
+        return result
+
+    def series(self, trip_id: int, metric: str, resolution: str = "hour",
+               since: Optional[float] = None, until: Optional[float] = None) -> List[list]:
+        """[[inizio bucket ISO, valore], ...] dalla rollup richiesta (solo dati flushati)"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Risoluzione sconosciuta: {resolution}")
+        rows = self._conn().execute(
+            "SELECT bucket, value FROM analytics_series WHERE trip_id = ? AND metric = ? AND resolution = ? "
+            "AND bucket >= ? AND bucket <= ? ORDER BY bucket",
+            (trip_id, metric, resolution, since or 0, until if until is not None else 2 ** 62),
+        ).fetchall()
+        return [[datetime.fromtimestamp(bucket).isoformat(), _number(value)] for bucket, value in rows]
+
+    def seed(self, entries: List[dict]) -> int:
+        """Import una tantum dei totali `analytics` esistenti (se il database è vuoto)"""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM analytics_totals LIMIT 1").fetchone():
+            return 0
+        now = time.time()
+        rows = [(e["trip_id"], metric, e.get(metric) or 0, now)
+                for e in entries if e.get("trip_id") is not None for metric in METRICS]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO analytics_totals (trip_id, metric, value, updated_at) "
+                             "VALUES (?, ?, ?, ?)", rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return len(entries)
+
+    def checkpoint(self) -> Optional[dict]:
+        row = self._conn().execute("SELECT value FROM analytics_checkpoint WHERE key = 'batch'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(len(s.deltas) for s in self._shards),
+            "flushes": self.flushes,
+            "flushed_deltas": self.flushed_deltas,
+            "failures": self.failures,
+            "flush_interval": self.flush_interval,
+            "checkpoint": self.checkpoint(),
+        }
@@ -0,0 +1,88 @@
+"""
+Dispatcher per connessione WebSocket
+
+Il loop di lettura si limita a fare parsing e routing: le richieste AI
+girano come task cancellabili, con un limite di richieste concorrenti
+per connessione e un ID per richiesta da rimandare nelle risposte.
+Le richieste accettate (in corso + in coda) sono limitate a max_pending
+e un ID già in volo viene rifiutato: ogni ID resta cancellabile.
+"""
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Dict, Optional
+
+from .log import get_logger
+
+log = get_logger("ares.dispatch")
+
+_ids = itertools.count(1)
+
+
+def new_request_id() -> str:
+    return f"r{next(_ids)}"
+
+
+class RequestRejected(Exception):
+    """Richiesta non accettata (code: duplicate_id o busy)"""
+
+    def __init__(self, code: str, request_id: str):
+        super().__init__(f"{code}: {request_id}")
+        self.code = code
+        self.request_id = request_id
+
+
+class ConnectionDispatcher:
+    def __init__(self, max_inflight: int = 2, max_pending: int = 8):
+        self.max_inflight = max_inflight
+        self.max_pending = max(max_pending, max_inflight)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.cancelled = 0
+        self.rejected = 0
+
+    def submit(self, request_id: str, job: Callable[[], Awaitable[None]],
+               on_cancel: Optional[Callable[[str], Awaitable[None]]] = None) -> asyncio.Task:
+        """Esegue job() in background appena c'è uno slot libero (RequestRejected se non accettata)"""
+        if request_id in self.tasks or len(self.tasks) >= self.max_pending:
+            self.rejected += 1
+            raise RequestRejected("duplicate_id" if request_id in self.tasks else "busy", request_id)
+
+        async def run():
+            try:
+                async with self._semaphore:
+                    await job()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                if on_cancel is not None:
+                    # Notifica fuori dal task cancellato
+                    asyncio.create_task(on_cancel(request_id))
+                raise
+            except Exception as e:
+                log.error("task_failed", id=request_id, error=str(e))
+            finally:
+                if self.tasks.get(request_id) is task:
+                    del self.tasks[request_id]
+
+        task = asyncio.create_task(run())
+        self.tasks[request_id] = task
+        return task
+
+    def cancel(self, request_id: Optional[str] = None) -> int:
+        """Cancella una richiesta (o tutte quelle in corso se request_id è None)"""
+        if request_id is not None:
+            targets = [self.tasks[request_id]] if request_id in self.tasks else []
+        else:
+            targets = list(self.tasks.values())
+        for task in targets:
+            task.cancel()
+        # Gli ID cancellati si liberano subito (riusabili, fuori dal conteggio delle pendenti)
+        for key in [key for key, task in self.tasks.items() if task in targets]:
+            del self.tasks[key]
+        return len(targets)
+
+    async def close(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,251 @@
+"""
+Indice geografico per il catalogo viaggi
+
+Griglia lat/lng a celle fisse (default 1°): ogni cella contiene gli
+indici degli elementi che vi cadono. Supporta:
+
+    bbox(south, west, north, east)   -> elementi nel rettangolo (anche a cavallo dell'antimeridiano)
+    nearest(lat, lng, k)             -> k più vicini per distanza haversine (ricerca best-first sulle celle)
+    clusters(zoom, bbox)             -> aggregati per cella di dimensione dipendente dallo zoom
+
+L'indice è immutabile: quando il catalogo cambia se ne costruisce uno
+nuovo (vedi GeoCache).
+"""
+import heapq
+import math
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .catalog import IndexCache
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_ZOOM = 16
+# Sotto questa soglia la scansione lineare batte la visita delle celle
+BRUTE_FORCE_LIMIT = 256
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def normalize_lng(lng: float) -> float:
+    if -180.0 <= lng <= 180.0:
+        return lng
+    return (lng + 180.0) % 360.0 - 180.0
+
+
+def rect_min_km(lat: float, lng: float, south: float, west: float, north: float, east: float) -> float:
+    """Distanza minima (esatta) da un punto a un rettangolo lat/lng con west <= east"""
+    dl = normalize_lng(lng - west)
+    width = east - west
+    if 0 <= dl <= width:
+        # Stessa fascia di longitudini: conta solo la latitudine
+        if lat < south:
+            return (south - lat) * math.pi / 180 * EARTH_RADIUS_KM
+        if lat > north:
+            return (lat - north) * math.pi / 180 * EARTH_RADIUS_KM
+        return 0.0
+    # Il punto più vicino sta su uno dei due meridiani di bordo
+    best = math.inf
+    for edge in (west, east):
+        delta = math.radians(normalize_lng(lng - edge))
+        candidates = [south, north]
+        if math.cos(delta) > 0:
+            # Latitudine più vicina sul cerchio massimo del meridiano
+            closest = math.degrees(math.atan(math.tan(math.radians(lat)) / math.cos(delta)))
+            candidates.append(min(north, max(south, closest)))
+        for candidate in candidates:
+            best = min(best, haversine_km(lat, lng, candidate, edge))
+    return best
+
+
+def cell_size_for_zoom(zoom: int) -> float:
+    """Zoom 0 -> celle da 45°, ogni livello dimezza (stile tile web)"""
+    return 45.0 / (2 ** max(0, min(MAX_ZOOM, zoom)))
+
+
+class GeoIndex:
+    def __init__(self, items: Iterable[dict], cell_deg: float = 1.0):
+        self.cell_deg = cell_deg
+        self.rows = math.ceil(180 / cell_deg)
+        self.cols = math.ceil(360 / cell_deg)
+        self.items: List[dict] = []
+        self.lats: List[float] = []
+        self.lngs: List[float] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for item in items:
+            lat, lng = item.get("lat"), item.get("lng")
+            if lat is None or lng is None:
+                continue
+            i = len(self.items)
+            self.items.append(item)
+            self.lats.append(float(lat))
+            self.lngs.append(normalize_lng(float(lng)))
+            self.cells.setdefault(self._cell(self.lats[i], self.lngs[i]), []).append(i)
+        self._clusters: Dict[int, Dict[Tuple[int, int], list]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = min(self.rows - 1, int((lat + 90) / self.cell_deg))
+        col = min(self.cols - 1, int((lng + 180) / self.cell_deg))
+        return row, col
+
+    # === BOUNDING BOX ===
+    @staticmethod
+    def _lng_ranges(west: float, east: float) -> List[Tuple[float, float]]:
+        if east - west >= 360:
+            return [(-180.0, 180.0)]
+        west, east = normalize_lng(west), normalize_lng(east)
+        if west <= east:
+            return [(west, east)]
+        # Il rettangolo attraversa l'antimeridiano: due fasce
+        return [(west, 180.0), (-180.0, east)]
+
+    def bbox(self, south: float, west: float, north: float, east: float,
+             limit: Optional[int] = None) -> List[dict]:
+        south, north = max(-90.0, south), min(90.0, north)
+        if south > north:
+            return []
+        result = []
+        row_lo, row_hi = self._cell(south, 0)[0], self._cell(north, 0)[0]
+        for lo, hi in self._lng_ranges(west, east):
+            col_lo, col_hi = self._cell(0, lo)[1], self._cell(0, hi)[1]
+            wanted = (row_hi - row_lo + 1) * (col_hi - col_lo + 1)
+            if wanted > len(self.cells):
+                # Rettangolo grande: più economico scorrere solo le celle occupate
+                cells = [ids for (r, c), ids in self.cells.items()
+                         if row_lo <= r <= row_hi and col_lo <= c <= col_hi]
+            else:
+                cells = [self.cells[(r, c)] for r in range(row_lo, row_hi + 1)
+                         for c in range(col_lo, col_hi + 1) if (r, c) in self.cells]
+            for ids in cells:
+                for i in ids:
+                    if south <= self.lats[i] <= north and lo <= self.lngs[i] <= hi:
+                        result.append(self.items[i])
+                        if limit is not None and len(result) >= limit:
+                            return result
+        return result
+
+    # === K NEAREST ===
+    def _cell_bounds(self, row: int, col: int) -> Tuple[float, float, float, float]:
+        south = row * self.cell_deg - 90
+        west = col * self.cell_deg - 180
+        return south, west, min(90.0, south + self.cell_deg), min(180.0, west + self.cell_deg)
+
+    def nearest(self, lat: float, lng: float, k: int = 10,
+                max_km: Optional[float] = None) -> List[Tuple[float, dict]]:
+        """k elementi più vicini come (distanza_km, item), ordinati per distanza"""
+        lng = normalize_lng(lng)
+        if k <= 0 or not self.items:
+            return []
+        limit = math.inf if max_km is None else max_km
+        if len(self.items) <= BRUTE_FORCE_LIMIT or k >= len(self.items):
+            scored = ((haversine_km(lat, lng, self.lats[i], self.lngs[i]), i) for i in range(len(self.items)))
+            best = heapq.nsmallest(k, (s for s in scored if s[0] <= limit))
+            return [(d, self.items[i]) for d, i in best]
+
+        # Best-first sulle celle: si ferma quando la cella più vicina ancora
+        # da visitare è più lontana del k-esimo risultato
+        start = self._cell(lat, lng)
+        frontier = [(0.0, start)]
+        seen = {start}
+        best: List[Tuple[float, int]] = []  # max-heap (distanza negata)
+        while frontier:
+            bound, (row, col) = heapq.heappop(frontier)
+            kth = -best[0][0] if len(best) == k else limit
+            if bound > kth:
+                break
+            for i in self.cells.get((row, col), ()):
+                d = haversine_km(lat, lng, self.lats[i], self.lngs[i])
+                if d > limit:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-d, i))
+                elif d < -best[0][0]:
+                    heapq.heapreplace(best, (-d, i))
+            for dr in (-1, 0, 1):
+                r = row + dr
+                if not 0 <= r < self.rows:
+                    continue
+                for dc in (-1, 0, 1):
+                    cell = (r, (col + dc) % self.cols)
+                    if cell not in seen:
+                        seen.add(cell)
+                        heapq.heappush(frontier, (rect_min_km(lat, lng, *self._cell_bounds(*cell)), cell))
+        return [(-d, self.items[i]) for d, i in sorted(best, reverse=True)]
+
+    # === CLUSTER PER ZOOM ===
+    def _cluster_grid(self, zoom: int) -> Dict[Tuple[int, int], list]:
+        grid = self._clusters.get(zoom)
+        if grid is not None:
+            return grid
+        with self._lock:
+            grid = self._clusters.get(zoom)
+            if grid is None:
+                size = cell_size_for_zoom(zoom)
+                grid = {}
+                for i, (lat, lng) in enumerate(zip(self.lats, self.lngs)):
+                    key = (int((lat + 90) // size), int((lng + 180) // size))
+                    # [count, x, y, z, primo indice]: centroide come media dei vettori unitari
+                    p, l = math.radians(lat), math.radians(lng)
+                    x, y, z = math.cos(p) * math.cos(l), math.cos(p) * math.sin(l), math.sin(p)
+                    acc = grid.get(key)
+                    if acc is None:
+                        grid[key] = [1, x, y, z, i]
+                    else:
+                        acc[0] += 1
+                        acc[1] += x
+                        acc[2] += y
+                        acc[3] += z
+                self._clusters[zoom] = grid
+        return grid
+
+    def clusters(self, zoom: int, south: float = -90, west: float = -180,
+                 north: float = 90, east: float = 180) -> List[dict]:
+        """Cluster nel rettangolo: {lat, lng, count} oppure l'elemento singolo"""
+        zoom = max(0, min(MAX_ZOOM, zoom))
+        size = cell_size_for_zoom(zoom)
+        grid = self._cluster_grid(zoom)
+        ranges = self._lng_ranges(west, east)
+        row_lo, row_hi = int((max(-90, south) + 90) // size), int((min(90, north) + 90) // size)
+        col_ranges = [(int((lo + 180) // size), int((hi + 180) // size)) for lo, hi in ranges]
+        wanted = (row_hi - row_lo + 1) * sum(c_hi - c_lo + 1 for c_lo, c_hi in col_ranges)
+        if wanted < len(grid):
+            # Viewport piccolo: visita solo le celle del rettangolo
+            keys = [(r, c) for r in range(row_lo, row_hi + 1) for c_lo, c_hi in col_ranges
+                    for c in range(c_lo, c_hi + 1) if (r, c) in grid]
+        else:
+            keys = [(r, c) for r, c in grid if row_lo <= r <= row_hi
+                    and any(c_lo <= c <= c_hi for c_lo, c_hi in col_ranges)]
+        result = []
+        for row, col in keys:
+            count, x, y, z, first = grid[(row, col)]
+            cell_west = col * size - 180
+            if count == 1:
+                result.append({"type": "item", "lat": self.lats[first], "lng": self.lngs[first],
+                               "count": 1, "item": self.items[first]})
+                continue
+            lat = math.degrees(math.atan2(z, math.hypot(x, y)))
+            lng = math.degrees(math.atan2(y, x))
+            result.append({"type": "cluster", "lat": round(lat, 5), "lng": round(lng, 5), "count": count,
+                           "bbox": [row * size - 90, cell_west, min(90, (row + 1) * size - 90),
+                                    min(180, cell_west + size)]})
+        return result
+
+
+class GeoCache(IndexCache):
+    """GeoIndex ricostruito solo quando cambia la versione del catalogo"""
+
+    def __init__(self, load: Callable[[], Iterable[dict]],
+                 version: Optional[Callable[[], Hashable]] = None, cell_deg: float = 1.0):
+        super().__init__(lambda: GeoIndex(load(), cell_deg=cell_deg), version)
+
+    def get(self) -> GeoIndex:
+        return super().get()
@@ -0,0 +1,88 @@
+"""
+Health prober in background
+
+Le verifiche costose (OpenAI, Cesium) girano su un task avviato nel
+lifespan con il proprio intervallo; /health, /readyz leggono solo
+l'ultimo snapshot in cache.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from .log import get_logger
+
+log = get_logger("ares.health")
+
+Probe = Callable[[], Awaitable[dict]]
+
+
+class HealthProber:
+    def __init__(self, probes: Dict[str, Probe], interval: float = 300.0, timeout: float = 10.0):
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Dict[str, dict] = {}
+        self.checked_at: Optional[float] = None
+        self.runs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.interval)
+
+    async def _run(self, name: str, probe: Probe) -> dict:
+        try:
+            return await asyncio.wait_for(probe(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return {"status": "error", "ok": False, "details": {"error": "probe timeout"}}
+        except Exception as e:
+            return {"status": "error", "ok": False, "details": {"error": str(e)[:100]}}
+
+    async def probe_once(self):
+        names = list(self.probes)
+        outcomes = await asyncio.gather(*(self._run(n, self.probes[n]) for n in names))
+        for name, result in zip(names, outcomes):
+            previous = self.results.get(name, {}).get("status")
+            if previous != result.get("status"):
+                status = result.get("status")
+                (log.warning if status == "error" else log.info)(
+                    "probe_status_changed", probe=name, previous=previous, status=status)
+        self.results = dict(zip(names, outcomes))
+        self.checked_at = time.time()
+        self.runs += 1
+
+    def get(self, name: str, default: Optional[dict] = None) -> dict:
+        return self.results.get(name, default or {"status": "pending", "ok": False, "details": {}})
+
+    @property
+    def age(self) -> Optional[float]:
+        if self.checked_at is None:
+            return None
+        return round(time.time() - self.checked_at, 1)
+
+    def ready(self) -> bool:
+        return self.checked_at is not None and all(r.get("ok") for r in self.results.values())
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready(),
+            "checked_at": datetime.fromtimestamp(self.checked_at).isoformat() if self.checked_at else None,
+            "age_s": self.age,
+            "interval_s": self.interval,
+            "probes": self.results,
+        }
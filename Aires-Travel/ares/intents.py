@@ -0,0 +1,127 @@
+"""
+Riconoscimento intenti per le risposte senza AI (mock e fallback)
+
+Tabella unica intento -> sinonimi per lingua (IT/EN/FR/ES), compilata
+in una sola regex (alternanza fattorizzata a trie): il testo viene
+portato in minuscolo e senza accenti una volta, poi scandito in un solo
+passaggio; ogni parola candidata si risolve con un lookup nel dizionario. Se più
+intenti compaiono nel messaggio vince quello che viene prima in tabella
+(le mete prima dei temi generici come prezzo o viaggio).
+
+Sinonimi: parola intera, oppure prefisso se terminano con `*`
+("viagg*" -> viaggio, viaggi, viaggiare).
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .ai_cache import fold_accents
+
+# (intento, {lingua: sinonimi}) in ordine di priorità
+INTENTS: List[Tuple[str, Dict[str, Sequence[str]]]] = [
+    ("tokyo", {
+        "it": ["tokyo", "tokio", "giappone"], "en": ["japan"], "fr": ["japon"], "es": ["japon"],
+    }),
+    ("santorini", {
+        "it": ["santorini", "grecia"], "en": ["greece"], "fr": ["grece"], "es": ["grecia"],
+    }),
+    ("maldive", {
+        "it": ["maldive"], "en": ["maldives"], "fr": ["maldives"], "es": ["maldivas"],
+    }),
+    ("machu", {
+        "it": ["machu", "picchu", "peru", "ande"], "en": ["andes"], "fr": ["perou", "andes"], "es": ["andes"],
+    }),
+    ("islanda", {
+        "it": ["islanda", "aurora boreale", "aurore boreali"], "en": ["iceland", "northern lights"],
+        "fr": ["islande", "aurore boreale"], "es": ["islandia", "aurora boreal"],
+    }),
+    ("prezzo", {
+        "it": ["prezz*", "costo", "costi", "economic*", "quanto costa", "budget"],
+        "en": ["price*", "cost", "costs", "cheap*", "how much"], "fr": ["prix", "cout*", "tarif*", "pas cher"],
+        "es": ["precio*", "barat*", "cuanto cuesta"],
+    }),
+    ("viaggio", {
+        "it": ["viagg*", "vacanz*"], "en": ["trip*", "travel*", "holiday*", "vacation*"],
+        "fr": ["voyag*", "vacances"], "es": ["viaj*", "vacaciones"],
+    }),
+    ("test", {
+        "it": ["test"], "en": ["test"], "fr": ["test"], "es": ["test"],
+    }),
+]
+
+
+def trie_pattern(words: Sequence[str]) -> str:
+    """Alternanza fattorizzata per prefissi comuni: il motore regex scarta
+    una posizione dopo pochi caratteri invece di provare ogni sinonimo"""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+class IntentMatcher:
+    def __init__(self, intents: Sequence[Tuple[str, Dict[str, Sequence[str]]]] = INTENTS):
+        self.names = [name for name, _ in intents]
+        self.exact: Dict[str, int] = {}  # sinonimo -> indice intento
+        self.stems: Dict[str, int] = {}  # prefisso -> indice intento
+        for rank, (_, languages) in enumerate(intents):
+            for words in languages.values():
+                for word in words:
+                    word = fold_accents(word.lower())
+                    target = self.stems if word.endswith("*") else self.exact
+                    target.setdefault(word.rstrip("*"), rank)
+        self.stem_lengths = sorted({len(stem) for stem in self.stems}, reverse=True)
+        # Candidato = sinonimo (o prefisso) a inizio parola, esteso fino a fine parola
+        self.regex = re.compile(r"\b" + trie_pattern(list(self.exact) + list(self.stems)) + r"\w*")
+
+    def _resolve(self, word: str) -> Optional[int]:
+        rank = self.exact.get(word)
+        if rank is not None:
+            return rank
+        for n in self.stem_lengths:
+            rank = self.stems.get(word[:n])
+            if rank is not None:
+                return rank
+        return None
+
+    def match(self, text: str) -> Optional[str]:
+        """Intento con priorità più alta presente nel testo, None se nessuno"""
+        text = text.lower()
+        if not text.isascii():
+            text = fold_accents(text)
+        best = None
+        pos = 0
+        while True:
+            found = self.regex.search(text, pos)
+            if found is None:
+                break
+            word = found.group()
+            rank = self._resolve(word)
+            if rank is not None and (best is None or rank < best):
+                best = rank
+                if rank == 0:
+                    break
+            # Frase multi-parola non riconosciuta: riparte dalla parola successiva
+            space = word.find(" ") if rank is None else -1
+            pos = found.start() + space + 1 if space >= 0 else found.end()
+        return None if best is None else self.names[best]
+
+    def reply(self, text: str, responses: Dict[str, str], default: str) -> str:
+        """Risposta per l'intento riconosciuto; `default` (con {text}) se assente"""
+        intent = self.match(text)
+        if intent in responses:
+            return responses[intent]
+        return default.format(text=text)
+
+
+matcher = IntentMatcher()
@@ -0,0 +1,288 @@
+"""
+Client LLM condiviso per tutta l'app
+
+Un solo openai.AsyncOpenAI (con pool httpx keep-alive) creato nel lifespan,
+con limite di chiamate concorrenti, deadline per chiamata e retry con
+jitter sotto un budget globale. Gli errori vengono classificati per tipo
+di eccezione invece che cercando stringhe nel messaggio.
+"""
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+import openai
+
+from .metrics import LLM_BUCKETS, Counter, Histogram
+
+QUOTA_CODES = ("insufficient_quota",)
+
+
+class LimiterSaturated(Exception):
+    """Troppe chiamate upstream in volo: il chiamante deve degradare"""
+
+
+class QuotaExceeded(Exception):
+    """Credito API esaurito (429 insufficient_quota)"""
+
+
+def classify_error(error: BaseException) -> str:
+    """Classe d'errore stabile per metriche e decisioni di retry"""
+    if isinstance(error, asyncio.TimeoutError):
+        return "deadline"
+    if isinstance(error, openai.RateLimitError):
+        return "quota" if getattr(error, "code", None) in QUOTA_CODES else "rate_limit"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.AuthenticationError):
+        return "auth"
+    if isinstance(error, openai.BadRequestError):
+        return "bad_request"
+    if isinstance(error, openai.InternalServerError):
+        return "server"
+    if isinstance(error, openai.APIStatusError):
+        return f"http_{error.status_code}"
+    return "other"
+
+
+RETRYABLE = {"rate_limit", "timeout", "connection", "server"}
+
+LLM_SECONDS = Histogram("ares_llm_request_seconds", "Durata chiamate LLM (retry inclusi) per modalità ed esito",
+                        ("mode", "outcome"), buckets=LLM_BUCKETS)
+LLM_TTFT_SECONDS = Histogram("ares_llm_ttft_seconds", "Tempo al primo token degli stream LLM", buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter("ares_llm_tokens_total", "Token LLM consumati (prompt/completion)", ("type",))
+LLM_ERRORS = Counter("ares_llm_errors_total", "Errori LLM per classe", ("kind",))
+
+
+class RetryBudget:
+    """Token bucket globale: ogni richiesta deposita `ratio` token, ogni retry ne spende 1
+
+    Con ratio=0.2 al massimo ~20% del traffico può essere ritentato, così un
+    picco di 429 non si moltiplica in una tempesta di retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, capacity: float = 10.0):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = capacity
+
+    def deposit(self):
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class LLMClient:
+    def __init__(self, api_key: Optional[str], base_url: Optional[str] = None,
+                 model: str = "gpt-3.5-turbo", max_concurrency: int = 8,
+                 queue_timeout: float = 0.5, deadline: float = 12.0,
+                 max_attempts: int = 3, backoff_base: float = 0.25, backoff_cap: float = 2.0,
+                 retry_budget: Optional[RetryBudget] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = retry_budget or RetryBudget()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self.in_flight = 0
+        self.counters = {
+            "requests": 0,
+            "success": 0,
+            "retries": 0,
+            "retry_budget_exhausted": 0,
+            "saturated": 0,
+        }
+        self.errors: dict = {}
+        self.latency_ms_total = 0.0
+        self.completed = 0
+        self.streams = 0
+        self.ttft_ms_total = 0.0
+        # Esito dell'ultima chiamata reale: usato dal health prober per evitare probe a pagamento
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[tuple] = None
+
+    # === LIFECYCLE ===
+    async def start(self):
+        if self._client is not None:
+            return
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency * 2,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=60.0,
+            ),
+            timeout=httpx.Timeout(self.deadline, connect=5.0),
+        )
+        # max_retries=0: i retry li gestiamo noi con il budget globale
+        self._client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=self._http,
+            max_retries=0,
+        )
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._client = None
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        return self._client
+
+    # === CHIAMATE ===
+    async def _acquire(self):
+        await self.start()
+        self.counters["requests"] += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["saturated"] += 1
+            LLM_ERRORS.inc(kind="saturated")
+            raise LimiterSaturated(f"{self.max_concurrency} chiamate già in corso")
+        self.retry_budget.deposit()
+        self.in_flight += 1
+
+    def _release(self, started: float, mode: str, outcome: str):
+        elapsed = time.monotonic() - started
+        LLM_SECONDS.observe(elapsed, mode=mode, outcome=outcome)
+        self.latency_ms_total += elapsed * 1000
+        self.completed += 1
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _create(self, deadline: float, attempts: int, **kwargs):
+        """chat.completions.create con retry jitterati entro la deadline"""
+        for attempt in range(1, attempts + 1):
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                return await asyncio.wait_for(
+                    self._client.chat.completions.create(**kwargs),
+                    timeout=remaining,
+                )
+            except Exception as e:
+                kind = self._record_error(e)
+                self.last_error = (kind, time.time())
+                if kind == "quota":
+                    raise QuotaExceeded(str(e)) from e
+                if kind not in RETRYABLE or attempt == attempts:
+                    raise
+                if not self.retry_budget.withdraw():
+                    self.counters["retry_budget_exhausted"] += 1
+                    raise
+                self.counters["retries"] += 1
+                # Full jitter: sleep uniforme in [0, min(cap, base * 2^n)]
+                backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                await asyncio.sleep(min(backoff, max(0.0, deadline - time.monotonic())))
+
+    async def complete(self, messages: list, attempts: Optional[int] = None, **params):
+        """chat.completions.create con limiter, deadline e retry
+
+        Solleva LimiterSaturated se non si libera uno slot entro
+        queue_timeout, QuotaExceeded per credito esaurito, altrimenti
+        l'ultima eccezione upstream.
+        """
+        await self._acquire()
+        started = time.monotonic()
+        params.setdefault("model", self.model)
+        outcome = "error"
+        try:
+            response = await self._create(
+                started + self.deadline, attempts or self.max_attempts,
+                messages=messages, **params
+            )
+            self.counters["success"] += 1
+            self.last_success_at = time.time()
+            outcome = "ok"
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, type="prompt")
+                LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, type="completion")
+            return response
+        finally:
+            self._release(started, "complete", outcome)
+
+    async def stream(self, messages: list, attempts: Optional[int] = None,
+                     **params) -> AsyncIterator[str]:
+        """Come complete() ma produce i delta di testo man mano che arrivano
+
+        I retry valgono solo per l'apertura dello stream: dopo il primo
+        token un errore viene propagato al chiamante.
+        """
+        await self._acquire()
+        started = time.monotonic()
+        deadline = started + self.deadline
+        params.setdefault("model", self.model)
+        first_token = True
+        outcome = "error"
+        try:
+            stream = await self._create(
+                deadline, attempts or self.max_attempts,
+                messages=messages, stream=True, **params
+            )
+            iterator = stream.__aiter__()
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(remaining, 0.001))
+                except StopAsyncIteration:
+                    break
+                except Exception as e:
+                    self._record_error(e)
+                    raise
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if first_token:
+                        first_token = False
+                        self.streams += 1
+                        ttft = time.monotonic() - started
+                        self.ttft_ms_total += ttft * 1000
+                        LLM_TTFT_SECONDS.observe(ttft)
+                    # Lo stream non riporta usage: un chunk ~ un token
+                    LLM_TOKENS.inc(type="completion")
+                    yield delta
+            self.counters["success"] += 1
+            self.last_success_at = time.time()
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client annullato o generatore chiuso prima della fine
+            outcome = "cancelled"
+            raise
+        finally:
+            self._release(started, "stream", outcome)
+
+    def _record_error(self, error: BaseException) -> str:
+        kind = classify_error(error)
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        LLM_ERRORS.inc(kind=kind)
+        return kind
+
+    def stats(self) -> dict:
+        done = self.completed
+        return {
+            **self.counters,
+            "errors": dict(self.errors),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "retry_budget_tokens": round(self.retry_budget.tokens, 2),
+            "avg_latency_ms": round(self.latency_ms_total / done, 1) if done else 0.0,
+            "streams": self.streams,
+            "avg_ttft_ms": round(self.ttft_ms_total / self.streams, 1) if self.streams else 0.0,
+        }
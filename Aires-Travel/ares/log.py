@@ -0,0 +1,122 @@
+"""
+Log strutturati asincroni con campionamento
+
+Sostituisce i print() sul percorso caldo: ogni evento ha un nome e dei
+campi, e diventa una riga logfmt (o JSON) scritta su stdout da un
+thread dedicato (QueueHandler + QueueListener). Il chiamante paga solo
+l'accodamento del record; formattazione e I/O avvengono altrove.
+
+    LOG_LEVEL        livello minimo (default INFO)
+    LOG_FORMAT       logfmt (default) | json
+    LOG_SAMPLE_RATE  frazione di eventi DEBUG/INFO tenuti dai logger campionati
+                     (quelli ad alto volume, per messaggio); WARNING e oltre sempre
+
+    log = get_logger("ares.ws", sampled=True)
+    log.info("ws_connected", total=3)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime
+from typing import Optional
+
+ROOT = "ares"
+
+_configured = False
+_config_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class StructFormatter(logging.Formatter):
+    def __init__(self, style: str = "logfmt"):
+        super().__init__()
+        self.style = style
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        if self.style == "json":
+            return json.dumps(data, ensure_ascii=False, default=str)
+        return " ".join(f"{key}={self._value(value)}" for key, value in data.items())
+
+    @staticmethod
+    def _value(value) -> str:
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        if text and not any(c in text for c in ' ="\n'):
+            return text
+        return json.dumps(text, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Niente formattazione nel thread chiamante: ci pensa il listener
+        return record
+
+
+def configure_logging(level: Optional[str] = None, style: Optional[str] = None, stream=None):
+    """Handler asincrono sul logger "ares" (idempotente, chiamato da get_logger)"""
+    global _configured, _listener
+    with _config_lock:
+        if _configured:
+            return
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(StructFormatter(style or os.getenv("LOG_FORMAT", "logfmt")))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        logger = logging.getLogger(ROOT)
+        logger.addHandler(_QueueHandler(records))
+        logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        logger.propagate = False
+        atexit.register(_listener.stop)
+        _configured = True
+
+
+class StructLogger:
+    __slots__ = ("logger", "sample_rate")
+
+    def __init__(self, logger: logging.Logger, sample_rate: float):
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def _log(self, level: int, event: str, fields: dict, exc_info=None):
+        if level < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event: str, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name: str, sampled: bool = False) -> StructLogger:
+    configure_logging()
+    sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1")) if sampled else 1.0
+    if name != ROOT and not name.startswith(ROOT + "."):
+        name = f"{ROOT}.{name}"
+    return StructLogger(logging.getLogger(name), sample_rate)
@@ -0,0 +1,251 @@
+"""
+Metriche in formato Prometheus, senza dipendenze esterne
+
+Counter, Gauge e Histogram con label in un registry di processo
+condiviso da main.py e api/index.py, esposto su /metrics nel formato
+testuale 0.0.4. Ogni worker (o istanza serverless) ha i propri valori:
+l'aggregazione tra processi la fa Prometheus.
+
+Counter e Gauge accettano una callback letta al momento dello scrape
+(connessioni WS, profondità code, contatori già tenuti dagli oggetti),
+così il percorso caldo non paga nulla per quei valori.
+
+MetricsMiddleware misura ogni richiesta HTTP con il template della
+route (/pricing/{trip_id}) e non con il path reale, per tenere bassa
+la cardinalità delle label.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Starlette aggiunge "; charset=utf-8" ai tipi text/*
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Bucket in secondi
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STORAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 12.0, 20.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric"):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self.metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        return self.metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 callback: Optional[Callable[[], object]] = None, registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames: Labels = tuple(labels)
+        # callback -> numero, oppure {tupla valori label: numero} se la metrica ha label
+        self.callback = callback
+        self._values: Dict[Labels, object] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: label attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Labels, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def values(self) -> Dict[Labels, object]:
+        if self.callback is not None:
+            value = self.callback()
+            return dict(value) if isinstance(value, dict) else {(): value}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in sorted(self.values().items())]
+
+
+class _Value(Metric):
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values().get(self._key(labels), 0)
+
+
+class Counter(_Value):
+    kind = "counter"
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, help, labels, registry=registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [conteggi per bucket (+Inf in fondo), somma, conteggio]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Misura il blocco (o la funzione, usato come decoratore)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> Optional[dict]:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return None
+            return {"count": state[2], "sum": state[1], "buckets": dict(zip(self.buckets + (math.inf,), state[0]))}
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+# === HTTP ===
+HTTP_REQUESTS = Counter("ares_http_requests_total", "Richieste HTTP per route e status",
+                        ("method", "route", "status"))
+HTTP_SECONDS = Histogram("ares_http_request_seconds", "Latenza richieste HTTP per route",
+                         ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("ares_http_requests_in_flight", "Richieste HTTP in corso")
+
+UNMATCHED = "unmatched"
+
+
+def _route_templates(app) -> Dict[object, str]:
+    """endpoint -> template della route (i Mount diventano /prefisso/{path})"""
+    templates = {}
+    for route in getattr(app, "routes", ()):
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is not None:
+            templates[endpoint] = route.path
+        elif getattr(route, "app", None) is not None:
+            templates[route.app] = route.path.rstrip("/") + "/{path}"
+    return templates
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: conteggio, latenza e richieste in corso per route HTTP"""
+
+    def __init__(self, app):
+        self.app = app
+        self._templates: Dict[object, str] = {}
+        self._routes = 0
+
+    def route(self, scope) -> str:
+        # Il router di Starlette aggiorna lo scope con l'endpoint che ha gestito la richiesta
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED
+        template = self._templates.get(endpoint)
+        if template is None:
+            app = scope.get("app")
+            routes = len(getattr(app, "routes", ()))
+            if routes != self._routes:
+                self._templates, self._routes = _route_templates(app), routes
+                template = self._templates.get(endpoint)
+        return template or UNMATCHED
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            method, route = scope["method"], self.route(scope)
+            HTTP_SECONDS.observe(elapsed, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
@@ -0,0 +1,164 @@
+"""
+Pagine HTML precompilate in memoria
+
+La pagina viene letta e renderizzata (es. injection del token Cesium)
+una volta sola, poi tenuta come varianti identity/gzip/brotli con ETag
+forte. Le richieste fanno solo content negotiation: nessun I/O su disco
+e nessuna manipolazione di stringhe. Il file viene ricaricato quando
+cambia mtime (controllo al massimo ogni `check_interval` secondi).
+"""
+import gzip
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .catalog import etag_for, etag_matches
+
+try:
+    import brotli
+except ImportError:  # opzionale: senza brotli si servono gzip e identity
+    brotli = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+
+# Ordine di preferenza lato server a parità di q
+PREFERENCE = (BROTLI, GZIP, IDENTITY)
+
+
+@dataclass(frozen=True)
+class PageVariant:
+    body: bytes
+    etag: str
+    encoding: str
+
+
+def compress_variants(raw: bytes) -> Dict[str, PageVariant]:
+    """Varianti per encoding, ognuna con il proprio ETag forte"""
+    base = etag_for(raw)[1:-1]
+    variants = {IDENTITY: PageVariant(raw, f'"{base}"', IDENTITY)}
+    # mtime=0: output deterministico, stesso ETag tra worker e riavvii
+    gz = gzip.compress(raw, compresslevel=9, mtime=0)
+    variants[GZIP] = PageVariant(gz, f'"{base}-gz"', GZIP)
+    if brotli is not None:
+        br = brotli.compress(raw, quality=11, mode=brotli.MODE_TEXT)
+        variants[BROTLI] = PageVariant(br, f'"{base}-br"', BROTLI)
+    return variants
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header: Optional[str], available) -> str:
+    """Miglior encoding disponibile per Accept-Encoding (identity se assente)"""
+    if not header:
+        return IDENTITY
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*")
+    best, best_q = IDENTITY, -1.0
+    for coding in PREFERENCE:
+        if coding not in available:
+            continue
+        if coding in accepted:
+            q = accepted[coding]
+        elif wildcard is not None:
+            q = wildcard
+        else:
+            # identity implicita: accettata ma dopo qualsiasi encoding esplicito
+            q = 0.001 if coding == IDENTITY else 0.0
+        if q > best_q:
+            best, best_q = coding, q
+    return best if best_q > 0 else IDENTITY
+
+
+class PageCache:
+    """Pagina statica renderizzata una volta, servita da memoria
+
+    `render` riceve il testo del file e ritorna l'HTML finale;
+    `fallback` viene servito se il file non esiste.
+    """
+
+    def __init__(self, path: str, render: Optional[Callable[[str], str]] = None,
+                 fallback: str = "", check_interval: float = 2.0,
+                 cache_control: str = "no-cache"):
+        self.path = path
+        self._render = render or (lambda html: html)
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self.cache_control = cache_control
+        self._lock = threading.Lock()
+        self._variants: Optional[Dict[str, PageVariant]] = None
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self.renders = 0
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, mtime) -> Dict[str, PageVariant]:
+        if mtime is None:
+            html = self.fallback
+        else:
+            with open(self.path, "r", encoding="utf-8") as f:
+                html = self._render(f.read())
+        self.renders += 1
+        return compress_variants(html.encode("utf-8"))
+
+    def variants(self) -> Dict[str, PageVariant]:
+        now = time.monotonic()
+        variants = self._variants
+        if variants is not None and now - self._checked_at < self.check_interval:
+            return variants
+        with self._lock:
+            if self._variants is None or now - self._checked_at >= self.check_interval:
+                mtime = self._stat()
+                if self._variants is None or mtime != self._mtime:
+                    self._variants = self._load(mtime)
+                    self._mtime = mtime
+                self._checked_at = now
+            return self._variants
+
+    def response(self, request: Request, media_type: str = "text/html") -> Response:
+        variants = self.variants()
+        variant = variants[choose_encoding(request.headers.get("accept-encoding"), variants)]
+        headers = {
+            "ETag": variant.etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(request, variant.etag):
+            return Response(status_code=304, headers=headers)
+        if variant.encoding != IDENTITY:
+            headers["Content-Encoding"] = variant.encoding
+        return Response(content=variant.body, media_type=media_type, headers=headers)
+
+    def stats(self) -> dict:
+        variants = self._variants or {}
+        return {
+            "renders": self.renders,
+            "bytes": {encoding: len(v.body) for encoding, v in variants.items()},
+        }
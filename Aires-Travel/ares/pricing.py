@@ -0,0 +1,216 @@
+"""
+Prezzi dinamici guidati dagli eventi
+
+Il prezzo di un viaggio si ricalcola solo quando cambia un suo input
+(viewer, posti, meteo, sconto flash, prezzo base), non a intervalli:
+
+    prezzo = base x domanda(viewer) x meteo x urgenza(riempimento) x (1 - sconto%)
+
+Ogni input tocca solo il moltiplicatore che ne dipende; se il prezzo
+risultante non cambia non viene emesso nulla. Storico per viaggio:
+
+    history   ring buffer degli ultimi HISTORY_SIZE cambi di prezzo
+    buckets   aggregati orari (open/high/low/close/cambi) per il lungo periodo
+"""
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+HISTORY_SIZE = 64
+BUCKET_SECONDS = 3600
+BUCKET_COUNT = 24 * 30
+
+# Domanda: viewer contemporanei -> moltiplicatore (soglie crescenti)
+DEMAND_TIERS = ((20, 1.15), (10, 1.10), (5, 1.05))
+# Urgenza: quota di posti venduti -> moltiplicatore
+URGENCY_TIERS = ((0.9, 1.10), (0.75, 1.05))
+
+# input -> moltiplicatore da ricalcolare (None: entra direttamente nel prezzo)
+INPUTS = {"viewers": "demand", "seats_available": "urgency", "seats_total": "urgency",
+          "weather": None, "flash_discount": None, "base_price": None}
+
+
+def demand_multiplier(viewers: int) -> float:
+    for threshold, multiplier in DEMAND_TIERS:
+        if viewers >= threshold:
+            return multiplier
+    return 1.0
+
+
+def urgency_multiplier(seats_available: Optional[int], seats_total: Optional[int]) -> float:
+    if not seats_total or seats_available is None:
+        return 1.0
+    sold = 1 - seats_available / seats_total
+    for threshold, multiplier in URGENCY_TIERS:
+        if sold >= threshold:
+            return multiplier
+    return 1.0
+
+
+class TripPrice:
+    __slots__ = ("trip_id", "base_price", "viewers", "seats_available", "seats_total", "weather",
+                 "flash_discount", "demand", "urgency", "price", "updated_at", "history", "buckets")
+
+    def __init__(self, trip_id: int, base_price: float, seats_available: Optional[int] = None,
+                 seats_total: Optional[int] = None, weather: float = 1.0, flash_discount: float = 0,
+                 history_size: int = HISTORY_SIZE, bucket_count: int = BUCKET_COUNT):
+        self.trip_id = trip_id
+        self.base_price = base_price
+        self.viewers = 0
+        self.seats_available = seats_available
+        self.seats_total = seats_total
+        self.weather = weather
+        self.flash_discount = flash_discount
+        self.demand = demand_multiplier(0)
+        self.urgency = urgency_multiplier(seats_available, seats_total)
+        self.price = self.compute()
+        self.updated_at = time.time()
+        self.history: deque = deque(maxlen=history_size)
+        # [inizio bucket, open, high, low, close, cambi]
+        self.buckets: deque = deque(maxlen=bucket_count)
+
+    def compute(self) -> int:
+        return int(self.base_price * self.demand * self.weather * self.urgency * (1 - self.flash_discount / 100))
+
+    def snapshot(self) -> dict:
+        return {
+            "trip_id": self.trip_id,
+            "base_price": self.base_price,
+            "current_price": self.price,
+            "demand_multiplier": self.demand,
+            "weather_multiplier": self.weather,
+            "urgency_multiplier": self.urgency,
+            "flash_discount": self.flash_discount,
+            "viewers": self.viewers,
+            "last_updated": datetime.fromtimestamp(self.updated_at).isoformat(),
+        }
+
+
+class PricingEngine:
+    def __init__(self, history_size: int = HISTORY_SIZE, bucket_seconds: int = BUCKET_SECONDS,
+                 bucket_count: int = BUCKET_COUNT):
+        self.history_size = history_size
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.trips: Dict[int, TripPrice] = {}
+        self.events = 0
+        self.recomputes = 0
+        self.changes = 0
+
+    def load(self, trips: Iterable[dict], pricing: Iterable[dict] = ()) -> int:
+        """Stato iniziale da data.json (trips + eventuale sezione dynamic_pricing)"""
+        overrides = {p.get("trip_id"): p for p in pricing}
+        for trip in trips:
+            saved = overrides.get(trip["id"], {})
+            self.trips[trip["id"]] = TripPrice(
+                trip["id"], saved.get("base_price", trip.get("price_chf", 0)),
+                trip.get("seats_available"), trip.get("seats_total"),
+                saved.get("weather_multiplier", 1.0), saved.get("flash_discount", 0),
+                self.history_size, self.bucket_count,
+            )
+        return len(self.trips)
+
+    def sync_trips(self, trips: Iterable[dict]) -> List[dict]:
+        """Catalogo cambiato: posti e viaggi nuovi diventano eventi"""
+        updates = []
+        for trip in trips:
+            if trip["id"] not in self.trips:
+                self.load([trip])
+                continue
+            update = self.apply(trip["id"], seats_available=trip.get("seats_available"),
+                                seats_total=trip.get("seats_total"))
+            if update:
+                updates.append(update)
+        return updates
+
+    def apply(self, trip_id: int, now: Optional[float] = None, **inputs) -> Optional[dict]:
+        """Applica un evento; ritorna il price_update solo se il prezzo è cambiato"""
+        self.events += 1
+        state = self.trips.get(trip_id)
+        if state is None:
+            return None
+        demand_dirty = urgency_dirty = price_dirty = False
+        for name, value in inputs.items():
+            try:
+                target = INPUTS[name]
+            except KeyError:
+                raise ValueError(f"Input di prezzo sconosciuto: {name}")
+            if getattr(state, name) == value:
+                continue
+            setattr(state, name, value)
+            if target == "demand":
+                demand_dirty = True
+            elif target == "urgency":
+                urgency_dirty = True
+            else:
+                price_dirty = True
+        if demand_dirty:
+            demand = demand_multiplier(state.viewers)
+            price_dirty |= demand != state.demand
+            state.demand = demand
+        if urgency_dirty:
+            urgency = urgency_multiplier(state.seats_available, state.seats_total)
+            price_dirty |= urgency != state.urgency
+            state.urgency = urgency
+        if not price_dirty:
+            return None
+
+        self.recomputes += 1
+        price = state.compute()
+        if price == state.price:
+            return None
+        previous, state.price = state.price, price
+        now = time.time() if now is None else now
+        state.updated_at = now
+        self.changes += 1
+        state.history.append((now, price, state.demand, state.weather, state.urgency, state.viewers))
+        self._aggregate(state, now, price)
+        return {
+            "type": "price_update",
+            "trip_id": trip_id,
+            "price": price,
+            "previous": previous,
+            "multipliers": {"demand": state.demand, "weather": state.weather, "urgency": state.urgency},
+            "flash_discount": state.flash_discount,
+            "timestamp": datetime.fromtimestamp(now).isoformat(),
+        }
+
+    def _aggregate(self, state: TripPrice, now: float, price: int):
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        buckets = state.buckets
+        if buckets and buckets[-1][0] == start:
+            bucket = buckets[-1]
+            bucket[2] = max(bucket[2], price)
+            bucket[3] = min(bucket[3], price)
+            bucket[4] = price
+            bucket[5] += 1
+        else:
+            buckets.append([start, price, price, price, price, 1])
+
+    # === LETTURA ===
+    def prices(self, trip_ids: Optional[Iterable[int]] = None) -> List[dict]:
+        ids = self.trips if trip_ids is None else [i for i in trip_ids if i in self.trips]
+        return [self.trips[i].snapshot() for i in ids]
+
+    def history(self, trip_id: int) -> Optional[dict]:
+        state = self.trips.get(trip_id)
+        if state is None:
+            return None
+        return {
+            **state.snapshot(),
+            "history": [
+                {"timestamp": datetime.fromtimestamp(ts).isoformat(), "price": price, "demand": demand,
+                 "weather": weather, "urgency": urgency, "viewers": viewers}
+                for ts, price, demand, weather, urgency, viewers in state.history
+            ],
+            "hourly": [
+                {"hour": datetime.fromtimestamp(start).isoformat(timespec="hours"), "open": o, "high": h,
+                 "low": l, "close": c, "changes": n}
+                for start, o, h, l, c, n in state.buckets
+            ],
+        }
+
+    def stats(self) -> dict:
+        return {"trips": len(self.trips), "events": self.events, "recomputes": self.recomputes,
+                "changes": self.changes, "history_size": self.history_size}
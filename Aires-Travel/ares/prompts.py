@@ -0,0 +1,161 @@
+"""
+System prompt compilato dal catalogo
+
+Il prompt di sistema (persona + destinazioni + viaggi) viene costruito
+una volta per versione del catalogo e riusato identico byte per byte:
+così il prefisso della richiesta resta stabile e il prompt caching
+lato provider può riutilizzarlo. Tutto ciò che cambia per richiesta
+(disponibilità, risultati di ricerca) va in un messaggio separato dopo
+il prefisso. Il prompt viene tagliato a un budget di token e i token
+di ogni richiesta vengono conteggiati.
+"""
+import math
+import threading
+from dataclasses import dataclass
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # opzionale: senza tiktoken si usa una stima
+    tiktoken = None
+
+from .log import get_logger
+
+log = get_logger("ares.prompts")
+
+# Overhead del formato chat per messaggio e per la risposta (come da documentazione OpenAI)
+TOKENS_PER_MESSAGE = 4
+TOKENS_REPLY_PRIMING = 3
+
+Section = Tuple[str, Sequence[str]]
+
+
+def make_token_counter(model: str = "gpt-3.5-turbo") -> Callable[[str], int]:
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    # Stima: ~3.5 caratteri per token su testo italiano con emoji e numeri
+    return lambda text: math.ceil(len(text) / 3.5)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    text: str
+    tokens: int
+    version: Hashable
+    lines_dropped: int
+
+
+class PromptBuilder:
+    """`sections` ritorna [(titolo, righe), ...] dal catalogo corrente;
+    in caso di budget superato si tagliano per prime le ultime righe
+    dell'ultima sezione."""
+
+    def __init__(self, persona: str, sections: Callable[[], List[Section]],
+                 version: Optional[Callable[[], Hashable]] = None,
+                 token_budget: int = 1200, count_tokens: Optional[Callable[[str], int]] = None):
+        self.persona = persona
+        self._sections = sections
+        self._version = version or (lambda: 0)
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens or make_token_counter()
+        self._lock = threading.Lock()
+        self._compiled: Optional[CompiledPrompt] = None
+        self.compilations = 0
+        # Statistiche per richiesta
+        self.requests = 0
+        self.prompt_tokens_total = 0
+        self.last_prompt_tokens = 0
+        self.upstream_prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def _render(self, sections: List[Section]) -> str:
+        parts = [self.persona]
+        for title, lines in sections:
+            if lines:
+                parts.append(title + "\n" + "\n".join(f"- {line}" for line in lines))
+        return "\n\n".join(parts)
+
+    def _compile(self, version: Hashable) -> CompiledPrompt:
+        sections = [(title, list(lines)) for title, lines in self._sections()]
+        text = self._render(sections)
+        tokens = self.count_tokens(text)
+        dropped = 0
+        while tokens > self.token_budget and any(lines for _, lines in sections):
+            # Taglia dalla fine: ultima riga dell'ultima sezione non vuota
+            title, lines = next((t, l) for t, l in reversed(sections) if l)
+            lines.pop()
+            dropped += 1
+            text = self._render(sections)
+            tokens = self.count_tokens(text)
+        if dropped:
+            log.warning("prompt_over_budget", budget=self.token_budget, dropped_lines=dropped)
+        self.compilations += 1
+        return CompiledPrompt(text=text, tokens=tokens, version=version, lines_dropped=dropped)
+
+    def system_prompt(self) -> CompiledPrompt:
+        version = self._version()
+        compiled = self._compiled
+        if compiled is not None and compiled.version == version:
+            return compiled
+        with self._lock:
+            if self._compiled is None or self._compiled.version != version:
+                self._compiled = self._compile(version)
+            return self._compiled
+
+    def messages(self, user_message: str, context: Optional[str] = None, history: Sequence[dict] = ()) -> list:
+        """Prefisso stabile (system compilato) + storico conversazione + contesto variabile + domanda
+
+        Lo storico cresce solo in coda tra un turno e l'altro: resta parte
+        del prefisso riutilizzabile, il contesto per richiesta va dopo.
+        """
+        messages = [{"role": "system", "content": self.system_prompt().text}]
+        messages.extend(history)
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def count_messages(self, messages: list) -> int:
+        compiled = self._compiled
+        total = TOKENS_REPLY_PRIMING
+        for message in messages:
+            content = message["content"]
+            # Il system compilato è già contato: niente ri-tokenizzazione per richiesta
+            if compiled is not None and content is compiled.text:
+                total += compiled.tokens
+            else:
+                total += self.count_tokens(content)
+            total += TOKENS_PER_MESSAGE
+        return total
+
+    def record(self, prompt_tokens: int, usage=None):
+        """Registra i token di una richiesta (stimati e, se disponibili, quelli del provider)"""
+        self.requests += 1
+        self.prompt_tokens_total += prompt_tokens
+        self.last_prompt_tokens = prompt_tokens
+        if usage is not None:
+            self.upstream_prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            if isinstance(details, dict):
+                self.cached_tokens += details.get("cached_tokens", 0) or 0
+            elif details is not None:
+                self.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+    def stats(self) -> dict:
+        compiled = self._compiled
+        return {
+            "tokenizer": "tiktoken" if tiktoken is not None else "estimate",
+            "budget": self.token_budget,
+            "system_tokens": compiled.tokens if compiled else None,
+            "lines_dropped": compiled.lines_dropped if compiled else None,
+            "compilations": self.compilations,
+            "requests": self.requests,
+            "last_prompt_tokens": self.last_prompt_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens_total / self.requests, 1) if self.requests else None,
+            "upstream_prompt_tokens": self.upstream_prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
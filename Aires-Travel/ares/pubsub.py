@@ -0,0 +1,310 @@
+"""
+Pub/sub per il fan-out WebSocket tra worker e nodi
+
+Ogni worker si iscrive una volta ai canali e consegna i messaggi ai
+propri client locali. Backend disponibili (ARES_PUBSUB):
+
+    memory                   -> solo processo corrente (default)
+    redis://host:6379        -> Redis o server compatibile (protocollo RESP)
+    unix:/tmp/ares-ws.sock   -> più worker sulla stessa macchina, senza Redis
+"""
+import asyncio
+import fcntl
+import os
+import struct
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from .log import get_logger
+
+log = get_logger("ares.pubsub")
+
+Handler = Callable[[bytes], Awaitable[None]]
+
+
+class PubSub:
+    """Interfaccia comune: publish/subscribe di bytes su canali con nome"""
+
+    name = "base"
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, data: bytes):
+        raise NotImplementedError
+
+    async def _dispatch(self, channel: str, data: bytes):
+        for handler in self.handlers.get(channel, ()):
+            self.delivered += 1
+            try:
+                await handler(data)
+            except Exception as e:
+                log.warning("pubsub_handler_failed", channel=channel, error=str(e))
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published, "delivered": self.delivered}
+
+
+class MemoryPubSub(PubSub):
+    name = "memory"
+
+    async def publish(self, channel: str, data: bytes):
+        self.published += 1
+        await self._dispatch(channel, data)
+
+
+# === REDIS (RESP minimale, nessuna dipendenza) ===
+def encode_command(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connessione chiusa")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise ConnectionError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise ConnectionError(f"risposta RESP non valida: {line[:20]!r}")
+
+
+class RedisPubSub(PubSub):
+    name = "redis"
+
+    def __init__(self, url: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.reconnect_delay = reconnect_delay
+        self._pub: Optional[tuple] = None
+        self._pub_lock = asyncio.Lock()
+        self._sub_task: Optional[asyncio.Task] = None
+        self._sub_writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await read_reply(reader)
+        return reader, writer
+
+    async def start(self):
+        if self._sub_task is None:
+            self._sub_task = asyncio.create_task(self._subscriber_loop())
+
+    async def stop(self):
+        if self._sub_task is not None:
+            self._sub_task.cancel()
+            try:
+                await self._sub_task
+            except asyncio.CancelledError:
+                pass
+            self._sub_task = None
+        for writer in (self._sub_writer, self._pub[1] if self._pub else None):
+            if writer is not None:
+                writer.close()
+        self._pub = None
+
+    async def subscribe(self, channel: str, handler: Handler):
+        new_channel = channel not in self.handlers
+        await super().subscribe(channel, handler)
+        if new_channel and self._sub_writer is not None:
+            self._sub_writer.write(encode_command("SUBSCRIBE", channel))
+
+    async def publish(self, channel: str, data: bytes):
+        async with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = await self._connect()
+                    reader, writer = self._pub
+                    writer.write(encode_command("PUBLISH", channel, data))
+                    await writer.drain()
+                    await read_reply(reader)
+                    self.published += 1
+                    return
+                except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                    self._pub = None
+                    if attempt:
+                        log.warning("redis_publish_failed", error=str(e))
+
+    async def _subscriber_loop(self):
+        while True:
+            try:
+                reader, writer = await self._connect()
+                self._sub_writer = writer
+                if self.handlers:
+                    writer.write(encode_command("SUBSCRIBE", *self.handlers.keys()))
+                    await writer.drain()
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        await self._dispatch(reply[1].decode(), reply[2])
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                log.warning("redis_subscriber_disconnected", error=str(e))
+            self._sub_writer = None
+            await asyncio.sleep(self.reconnect_delay)
+
+
+# === UNIX SOCKET (broker eletto tra i worker) ===
+_HEADER = struct.Struct("!IH")
+
+
+def encode_frame(channel: str, data: bytes) -> bytes:
+    name = channel.encode("utf-8")
+    return _HEADER.pack(len(name) + len(data), len(name)) + name + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple:
+    size, name_len = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    body = await reader.readexactly(size)
+    return body[:name_len].decode("utf-8"), body[name_len:]
+
+
+class UnixSocketPubSub(PubSub):
+    """Un worker (chi prende il lock) fa da broker, tutti si collegano come client
+
+    Se il broker muore, il primo worker che riesce a prendere il lock
+    diventa il nuovo broker.
+    """
+
+    name = "unix"
+
+    def __init__(self, path: str, reconnect_delay: float = 0.5):
+        super().__init__()
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.is_broker = False
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: set = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._client_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._server = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            self.is_broker = False
+
+    async def _try_become_broker(self):
+        if self._server is not None:
+            return
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return
+        self._lock_fd = fd
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path)
+        self.is_broker = True
+        log.info("unix_broker_started", path=self.path, pid=os.getpid())
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        try:
+            while True:
+                channel, data = await read_frame(reader)
+                frame = encode_frame(channel, data)
+                for peer in list(self._peers):
+                    try:
+                        peer.write(frame)
+                    except Exception:
+                        self._peers.discard(peer)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _client_loop(self):
+        while True:
+            try:
+                await self._try_become_broker()
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                self._writer = writer
+                while True:
+                    channel, data = await read_frame(reader)
+                    await self._dispatch(channel, data)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                pass
+            self._writer = None
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def publish(self, channel: str, data: bytes):
+        self.published += 1
+        if self._writer is None:
+            # Broker non raggiungibile: almeno i client locali ricevono il messaggio
+            await self._dispatch(channel, data)
+            return
+        self._writer.write(encode_frame(channel, data))
+        await self._writer.drain()
+
+
+def create_pubsub(url: Optional[str]) -> PubSub:
+    """Factory dal valore di ARES_PUBSUB"""
+    if not url or url == "memory":
+        return MemoryPubSub()
+    if url.startswith("redis://"):
+        return RedisPubSub(url)
+    if url.startswith("unix:"):
+        return UnixSocketPubSub(url[len("unix:"):])
+    raise ValueError(f"Backend pub/sub sconosciuto: {url}")
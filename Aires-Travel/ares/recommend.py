@@ -0,0 +1,458 @@
+"""
+Raccomandazioni precalcolate (smart_notifications, personalized_offers)
+
+Ogni viaggio è un vettore di feature:
+
+    interessi   one-hot sul vocabolario degli interessi del catalogo
+    prezzo      RBF su 4 fasce di log(prezzo)
+    periodo     mese di partenza, con i mesi adiacenti a metà peso
+
+Ogni utente è la somma pesata dei vettori dei viaggi con cui ha
+interagito (vista 1, wishlist 3, prenotazione 5). Lo score è il coseno
+utente-viaggio. I top-k per utente sono calcolati in blocco con NumPy
+(a blocchi di righe, memoria limitata) ed escludono i viaggi già visti.
+Un nuovo evento aggiorna solo il vettore dell'utente e ne ricalcola i
+top-k, con lo stesso risultato di un ricalcolo completo. La lettura è un
+lookup per chiave: riga dell'utente -> top-k già pronti. Gli utenti nuovi
+(non presenti all'ultimo fit) sono limitati a max_new_users.
+
+Le notifiche personal_recommendation hanno il formato di data.json,
+una sola notifica attiva per (utente, tipo, viaggio), e vengono rimosse
+alla scadenza (expires_at) tramite un heap.
+
+NumPy è opzionale: senza, `available` è False e il motore non si usa.
+"""
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # opzionale: senza NumPy niente raccomandazioni
+    np = None
+
+available = np is not None
+
+ACTION_WEIGHTS = {"view_trip": 1.0, "wishlist": 3.0, "booking": 5.0}
+BLOCK_WEIGHTS = {"interests": 1.0, "price": 0.5, "month": 0.5}
+PRICE_BANDS = 4
+NOTIFICATION_TYPE = "personal_recommendation"
+NOTIFICATION_TITLE = "✨ Ho trovato qualcosa che ti piacerà"
+
+Event = Tuple[str, int, str]  # (user_id, trip_id, azione)
+
+
+def _month(trip: dict) -> Optional[int]:
+    try:
+        return int((trip.get("dates") or {}).get("start", "")[5:7]) - 1
+    except ValueError:
+        return None
+
+
+def _timestamp(value) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def trip_features(trips: List[dict]) -> Tuple["np.ndarray", List[str]]:
+    """Matrice (viaggi x feature) float32 e vocabolario degli interessi"""
+    vocab = sorted({i for t in trips for i in t.get("interests", [])})
+    column = {interest: n for n, interest in enumerate(vocab)}
+    prices = [math.log(t["price_chf"]) for t in trips if t.get("price_chf")]
+    low, high = (min(prices), max(prices)) if prices else (0.0, 1.0)
+    centers = np.linspace(low, high, PRICE_BANDS)
+    width = max((high - low) / (PRICE_BANDS - 1), 1e-6)
+    features = np.zeros((len(trips), len(vocab) + PRICE_BANDS + 12), dtype=np.float32)
+    for row, trip in enumerate(trips):
+        interests = [column[i] for i in trip.get("interests", [])]
+        if interests:
+            features[row, interests] = BLOCK_WEIGHTS["interests"] / math.sqrt(len(interests))
+        if trip.get("price_chf"):
+            rbf = np.exp(-((math.log(trip["price_chf"]) - centers) / width) ** 2)
+            features[row, len(vocab):len(vocab) + PRICE_BANDS] = BLOCK_WEIGHTS["price"] * rbf / np.linalg.norm(rbf)
+        month = _month(trip)
+        if month is not None:
+            base = len(vocab) + PRICE_BANDS
+            months = np.zeros(12, dtype=np.float32)
+            months[month] = 1.0
+            months[(month - 1) % 12] = months[(month + 1) % 12] = 0.5
+            features[row, base:base + 12] = BLOCK_WEIGHTS["month"] * months / np.linalg.norm(months)
+    return features, vocab
+
+
+class Recommender:
+    def __init__(self, k: int = 3, action_weights: Optional[Dict[str, float]] = None, chunk: int = 65536,
+                 max_new_users: int = 10000):
+        if not available:
+            raise RuntimeError("NumPy non installato: raccomandazioni non disponibili")
+        self.k = k
+        self.action_weights = action_weights or ACTION_WEIGHTS
+        self.chunk = chunk
+        self.max_new_users = max_new_users
+        self._lock = threading.Lock()
+        self.trips: List[dict] = []
+        self.vocab: List[str] = []
+        self._trip_index: Dict[int, int] = {}
+        self._features = np.zeros((0, 0), dtype=np.float32)
+        self._columns: Dict[str, int] = {}
+        self._lookup = np.full(1, -1, dtype=np.int32)
+        # Utenti: chiave -> riga; vettori, top-k e score in array preallocati
+        self._users: Dict[str, int] = {}
+        self._fitted_users = 0
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._top = np.zeros((0, k), dtype=np.int32)
+        self._scores = np.zeros((0, k), dtype=np.float32)
+        # Interazioni (riga utente, trip_id, peso): blocco ordinato + aggiunte incrementali
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._trip_ids = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._extra: Dict[int, Dict[int, float]] = {}
+        self._popularity = np.zeros(0)
+        self._popular: List[int] = []
+        # Eventi arrivati durante un set_trips in corso (None: nessun ricalcolo)
+        self._pending: Optional[List[Event]] = None
+        self.fits = 0
+        self.updates = 0
+        self.rejected_users = 0
+        self.fit_seconds = 0.0
+
+    # === COSTRUZIONE ===
+    def fit(self, trips: List[dict], events: Iterable[Event]):
+        """Ricalcolo completo da catalogo ed eventi (utente, viaggio, azione)"""
+        users: Dict[str, int] = {}
+        rows, trip_ids, weights = [], [], []
+        for user_id, trip_id, action in events:
+            weight = self.action_weights.get(action)
+            if weight and trip_id is not None:
+                rows.append(users.setdefault(user_id, len(users)))
+                trip_ids.append(trip_id)
+                weights.append(weight)
+        self.fit_arrays(trips, list(users), np.array(rows, dtype=np.int32),
+                        np.array(trip_ids, dtype=np.int32), np.array(weights, dtype=np.float32))
+
+    def fit_arrays(self, trips: List[dict], user_ids: Sequence[str], rows: "np.ndarray",
+                   trip_ids: "np.ndarray", weights: "np.ndarray"):
+        """Come fit, con le interazioni già in array (righe riferite a user_ids)"""
+        start = time.perf_counter()
+        with self._lock:
+            self._set_catalog(trips)
+            self._users = dict(zip(user_ids, range(len(user_ids))))
+            self._fitted_users = len(self._users)
+            self._extra = {}
+            self._set_interactions(len(user_ids), rows, trip_ids, weights)
+            self._rebuild()
+        self.fits += 1
+        self.fit_seconds = time.perf_counter() - start
+
+    def set_trips(self, trips: List[dict]):
+        """Catalogo cambiato: stesse interazioni, nuove feature e nuovi top-k
+
+        Il ricalcolo avviene fuori dal lock su un motore nuovo, sostituito
+        alla fine: letture e observe continuano sullo stato corrente, e gli
+        eventi arrivati nel frattempo vengono riapplicati dopo lo scambio.
+        """
+        with self._lock:
+            rows, trip_ids, weights = self._all_interactions()
+            user_ids = list(self._users)
+            self._pending = []
+        fresh = Recommender(self.k, self.action_weights, self.chunk, self.max_new_users)
+        try:
+            fresh.fit_arrays(trips, user_ids, rows, trip_ids, weights)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending, None
+            for name in ("trips", "vocab", "_trip_index", "_features", "_columns", "_lookup", "_users",
+                         "_vectors", "_top", "_scores", "_rows", "_trip_ids", "_weights", "_indptr",
+                         "_extra", "_popularity", "_popular"):
+                setattr(self, name, getattr(fresh, name))
+        for event in pending:
+            self.observe(*event)
+
+    def _set_catalog(self, trips: List[dict]):
+        self.trips = list(trips)
+        self._trip_index = {t["id"]: n for n, t in enumerate(self.trips)}
+        self._features, self.vocab = trip_features(self.trips)
+        self._columns = {interest: n for n, interest in enumerate(self.vocab)}
+        # trip_id -> riga della matrice feature (-1 se non in catalogo), ultima cella per gli id fuori range
+        self._lookup = np.full(max(self._trip_index, default=0) + 2, -1, dtype=np.int32)
+        self._lookup[list(self._trip_index)] = list(self._trip_index.values())
+
+    def _set_interactions(self, users: int, rows, trip_ids, weights):
+        order = np.argsort(rows, kind="stable")
+        self._rows, self._trip_ids, self._weights = rows[order], trip_ids[order], weights[order]
+        self._indptr = np.zeros(users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self._rows, minlength=users), out=self._indptr[1:])
+
+    def _all_interactions(self):
+        rows, trip_ids, weights = [self._rows], [self._trip_ids], [self._weights]
+        for row, trips in self._extra.items():
+            rows.append(np.full(len(trips), row, dtype=np.int32))
+            trip_ids.append(np.fromiter(trips.keys(), dtype=np.int32, count=len(trips)))
+            weights.append(np.fromiter(trips.values(), dtype=np.float32, count=len(trips)))
+        return np.concatenate(rows), np.concatenate(trip_ids), np.concatenate(weights)
+
+    def _trip_rows(self, trip_ids: "np.ndarray") -> "np.ndarray":
+        return self._lookup[np.clip(trip_ids, -1, len(self._lookup) - 1)]
+
+    def _rebuild(self):
+        users, dims = len(self._users), self._features.shape[1]
+        capacity = max(users, 16)
+        self._vectors = np.zeros((capacity, dims), dtype=np.float32)
+        self._top = np.full((capacity, self.k), -1, dtype=np.int32)
+        self._scores = np.zeros((capacity, self.k), dtype=np.float32)
+        self._indptr = np.concatenate([self._indptr, np.full(capacity - users, self._indptr[-1])])
+        trip_rows = self._trip_rows(self._trip_ids)
+        # Blocchi di utenti con matrice interazioni densa (utenti x viaggi) di dimensione limitata
+        chunk = max(1, min(self.chunk, (1 << 22) // max(len(self.trips), 1)))
+        for first in range(0, users, chunk):
+            self._score_rows(first, min(first + chunk, users), trip_rows)
+        known = trip_rows >= 0
+        self._popularity = np.bincount(trip_rows[known], weights=self._weights[known], minlength=len(self.trips))
+        self._update_popular()
+
+    def _update_popular(self):
+        self._popular = [int(i) for i in np.argsort(-self._popularity, kind="stable")[:self.k]]
+
+    def _score_rows(self, first: int, last: int, trip_rows: "np.ndarray"):
+        begin, end = self._indptr[first], self._indptr[last]
+        trips = trip_rows[begin:end]
+        known = trips >= 0
+        cells = (self._rows[begin:end][known] - first).astype(np.int64) * len(self.trips) + trips[known]
+        interactions = np.bincount(cells, weights=self._weights[begin:end][known],
+                                   minlength=(last - first) * len(self.trips)).reshape(last - first, -1)
+        vectors = self._vectors[first:last] = interactions.astype(np.float32) @ self._features
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = (vectors @ self._features.T) / np.maximum(norms, 1e-9)
+        # Viaggi già visti fuori dai candidati
+        scores[interactions > 0] = -np.inf
+        self._store_top(first, scores)
+
+    def _store_top(self, first: int, scores: "np.ndarray"):
+        """Top-k per riga (modifica `scores`): k passate di argmax, più rapide di argpartition per k piccolo"""
+        k = min(self.k, scores.shape[1])
+        lines = np.arange(scores.shape[0])
+        rows = slice(first, first + scores.shape[0])
+        for rank in range(k):
+            best = scores.argmax(axis=1)
+            values = scores[lines, best]
+            found = np.isfinite(values)
+            self._top[rows, rank] = np.where(found, best, -1)
+            self._scores[rows, rank] = np.where(found, values, 0)
+            scores[lines, best] = -np.inf
+
+    # === AGGIORNAMENTO INCREMENTALE ===
+    def observe(self, user_id: str, trip_id: int, action: str = "view_trip") -> bool:
+        """Nuovo evento: aggiorna vettore e top-k dell'utente; True se i top-k sono cambiati"""
+        weight = self.action_weights.get(action)
+        trip_row = self._trip_index.get(trip_id)
+        if not weight or trip_row is None:
+            return False
+        with self._lock:
+            row = self._users.get(user_id)
+            if row is None:
+                # Gli id arrivano dai client: oltre il limite nessuna nuova riga (restano sui popolari)
+                if len(self._users) - self._fitted_users >= self.max_new_users:
+                    self.rejected_users += 1
+                    return False
+                row = self._users[user_id] = len(self._users)
+                self._grow(row + 1)
+            if self._pending is not None:
+                self._pending.append((user_id, trip_id, action))
+            trips = self._extra.setdefault(row, {})
+            trips[trip_id] = trips.get(trip_id, 0.0) + weight
+            self._vectors[row] += weight * self._features[trip_row]
+            self._popularity[trip_row] += weight
+            self._update_popular()
+            before = self._top[row].copy()
+            self._rescore(row)
+            self.updates += 1
+            return not np.array_equal(before, self._top[row])
+
+    def _grow(self, users: int):
+        if users <= len(self._vectors):
+            return
+        capacity = max(users, len(self._vectors) * 2)
+        for name in ("_vectors", "_top", "_scores"):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], -1 if name == "_top" else 0, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self._indptr = np.concatenate([self._indptr, np.full(capacity + 1 - len(self._indptr), self._indptr[-1])])
+
+    def _rescore(self, row: int):
+        vector = self._vectors[row]
+        scores = (self._features @ vector) / max(float(np.linalg.norm(vector)), 1e-9)
+        begin, end = self._indptr[row], self._indptr[row + 1]
+        seen = [r for r in self._trip_rows(self._trip_ids[begin:end]) if r >= 0]
+        seen += [self._trip_index[t] for t in self._extra.get(row, ()) if t in self._trip_index]
+        scores[seen] = -np.inf
+        self._store_top(row, scores[None, :])
+
+    # === LETTURA ===
+    def top(self, user_id: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """[(trip_id, score)] precalcolati; utenti sconosciuti: viaggi più popolari"""
+        row = self._users.get(user_id)
+        k = k or self.k
+        if row is None:
+            return [(self.trips[i]["id"], 0.0) for i in self._popular[:k]]
+        return [(self.trips[i]["id"], round(float(s), 4))
+                for i, s in zip(self._top[row, :k].tolist(), self._scores[row, :k].tolist()) if i >= 0]
+
+    def recommendations(self, user_id: str, k: Optional[int] = None) -> List[dict]:
+        """Top-k con dati del viaggio e interessi in comune (motivo del consiglio)"""
+        row = self._users.get(user_id)
+        weights = self._vectors[row, :len(self.vocab)] if row is not None else None
+        items = []
+        for trip_id, score in self.top(user_id, k):
+            trip = self.trips[self._trip_index[trip_id]]
+            reasons = []
+            if weights is not None:
+                affinity = {i: weights[self._columns[i]] for i in trip.get("interests", [])}
+                reasons = [i for i in sorted(affinity, key=lambda i: -affinity[i]) if affinity[i] > 0][:3]
+            items.append({"trip_id": trip_id, "title": trip.get("title"), "price_chf": trip.get("price_chf"),
+                          "dates": trip.get("dates"), "score": score, "reasons": reasons,
+                          "personalized": row is not None})
+        return items
+
+    def stats(self) -> dict:
+        arrays = (self._vectors, self._top, self._scores, self._rows, self._trip_ids, self._weights, self._indptr)
+        return {
+            "users": len(self._users),
+            "trips": len(self.trips),
+            "dims": int(self._features.shape[1]) if self._features.size else 0,
+            "k": self.k,
+            "interactions": int(len(self._rows)) + sum(len(t) for t in self._extra.values()),
+            "array_bytes": int(sum(a.nbytes for a in arrays)),
+            "fits": self.fits,
+            "fit_ms": round(self.fit_seconds * 1000, 1),
+            "updates": self.updates,
+            "new_users": len(self._users) - self._fitted_users,
+            "rejected_users": self.rejected_users,
+        }
+
+
+def legacy_events(profiles: List[dict], wishlists: List[dict]) -> List[Event]:
+    """Eventi dal layout di data.json: visit_history dei profili e wishlists"""
+    events = [(p["user_id"], e.get("trip_id"), e.get("action"))
+              for p in profiles for e in p.get("visit_history") or () if p.get("user_id")]
+    events += [(w["user_id"], w.get("trip_id"), "wishlist") for w in wishlists if w.get("user_id")]
+    return events
+
+
+# === NOTIFICHE ===
+class NotificationBook:
+    """smart_notifications attive per utente: dedupe per (tipo, viaggio), scadenza via heap"""
+
+    def __init__(self, ttl: float = 7 * 86400, max_per_user: int = 5, max_users: int = 10000):
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._by_user: Dict[str, Dict[Tuple[str, int], dict]] = {}
+        self._expiry: List[Tuple[float, str, Tuple[str, int]]] = []
+        self.created = 0
+        self.duplicates = 0
+        self.expired = 0
+
+    def load(self, notifications: List[dict], now: Optional[float] = None) -> int:
+        """Import da data.json (quelle già scadute vengono scartate)"""
+        added = sum(self._add(n, now) for n in notifications if n.get("user_id"))
+        self.prune(now)
+        return added
+
+    def _add(self, notification: dict, now: Optional[float]) -> bool:
+        key = (notification.get("type"), notification.get("trip_id"))
+        expires = _timestamp(notification.get("expires_at")) or math.inf
+        with self._lock:
+            active = self._by_user.setdefault(notification["user_id"], {})
+            current = active.get(key)
+            if current is not None and (_timestamp(current.get("expires_at")) or math.inf) > (now or time.time()):
+                self.duplicates += 1
+                return False
+            active[key] = notification
+            heapq.heappush(self._expiry, (expires, notification["user_id"], key))
+            return True
+
+    def notify(self, user_id: str, recommendations: List[dict], min_score: float = 0.0,
+               now: Optional[float] = None) -> List[dict]:
+        """Crea le notifiche per i consigli nuovi (una per viaggio finché non scade)"""
+        now = time.time() if now is None else now
+        if user_id not in self._by_user and len(self._by_user) >= self.max_users:
+            self.prune(now)
+            if len(self._by_user) >= self.max_users:
+                return []
+        created_at = datetime.fromtimestamp(now)
+        created = []
+        for item in recommendations:
+            if not item.get("personalized") or item["score"] < min_score:
+                continue
+            if len(self._by_user.get(user_id, ())) >= self.max_per_user:
+                break
+            notification = {
+                "id": f"recommendation_{item['trip_id']}_{user_id}_{int(now)}",
+                "user_id": user_id,
+                "type": NOTIFICATION_TYPE,
+                "title": NOTIFICATION_TITLE,
+                "message": f"Basandomi sui tuoi interessi, penso che {item['title']} sia perfetto per te! "
+                           f"{item['price_chf']} CHF",
+                "trip_id": item["trip_id"],
+                "priority": "high" if item["score"] >= 0.8 else "medium",
+                "created_at": created_at.isoformat(),
+                "expires_at": (created_at + timedelta(seconds=self.ttl)).isoformat(),
+                "seen": False,
+            }
+            if self._add(notification, now):
+                created.append(notification)
+                self.created += 1
+        return created
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Rimuove le notifiche scadute (solo quelle in testa all'heap)"""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires, user_id, key = heapq.heappop(self._expiry)
+                active = self._by_user.get(user_id, {})
+                current = active.get(key)
+                # Voce dell'heap superata da una notifica più recente per la stessa chiave
+                if current is None or (_timestamp(current.get("expires_at")) or math.inf) != expires:
+                    continue
+                del active[key]
+                if not active:
+                    del self._by_user[user_id]
+                removed += 1
+        self.expired += removed
+        return removed
+
+    def for_user(self, user_id: str, now: Optional[float] = None) -> List[dict]:
+        self.prune(now)
+        return sorted(self._by_user.get(user_id, {}).values(), key=lambda n: n["created_at"], reverse=True)
+
+    def mark_seen(self, user_id: str, ids: Iterable[str]) -> int:
+        ids = set(ids)
+        marked = 0
+        for notification in self._by_user.get(user_id, {}).values():
+            if notification["id"] in ids and not notification["seen"]:
+                notification["seen"] = True
+                marked += 1
+        return marked
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._by_user),
+            "max_users": self.max_users,
+            "active": sum(len(n) for n in self._by_user.values()),
+            "created": self.created,
+            "duplicates": self.duplicates,
+            "expired": self.expired,
+        }
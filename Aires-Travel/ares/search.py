@@ -0,0 +1,296 @@
+"""
+Ricerca viaggi a faccette su indici precostruiti
+
+Ogni filtro produce un bitset (int Python, bit i = viaggio i):
+
+    interessi, città di partenza, mese, mete     -> posting list invertite
+    prezzo, data di partenza, posti disponibili  -> array ordinati + bisect
+
+Le mete sono i nomi di luogo (destinazione e paese, separati da ","),
+riconosciuti nel testo come frase intera: "costa rica" sì, "costa" no.
+Un viaggio senza seats_available ha posti illimitati, come in
+Store.reserve_booking.
+
+I filtri si combinano con AND tra faccette e OR dentro la stessa
+faccetta; i conteggi di ogni faccetta escludono il filtro della faccetta
+stessa (così l'interfaccia mostra le alternative possibili).
+"""
+import re
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence
+
+from .ai_cache import fold_accents
+from .catalog import IndexCache
+
+# Granularità dei prefissi precomputati per i range (compromesso memoria/velocità)
+PREFIX_BLOCK = 256
+
+MONTHS = {
+    "gennaio": 1, "january": 1, "febbraio": 2, "february": 2, "marzo": 3, "march": 3,
+    "aprile": 4, "april": 4, "maggio": 5, "may": 5, "giugno": 6, "june": 6,
+    "luglio": 7, "july": 7, "agosto": 8, "august": 8, "settembre": 9, "september": 9,
+    "ottobre": 10, "october": 10, "novembre": 11, "november": 11, "dicembre": 12, "december": 12,
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Posti illimitati (seats_available assente): sempre sopra qualsiasi richiesta
+UNLIMITED_SEATS = float("inf")
+_MAX_PRICE = re.compile(
+    r"(?:sotto|meno di|massimo|max|entro|budget|fino a|under|below|less than)\s*(?:i|di|a|the)?\s*"
+    r"(?:€|eur|euro|chf|fr\.?)?\s*(\d{3,6})"
+)
+_MIN_PRICE = re.compile(r"(?:sopra|oltre|almeno|more than|over)\s*(?:i|di|a)?\s*(?:€|eur|euro|chf)?\s*(\d{3,6})")
+
+
+def fold(text: str) -> str:
+    return fold_accents(text.lower()).strip()
+
+
+def place_names(trip: dict) -> List[str]:
+    """Nomi di luogo del viaggio normalizzati ("Costa Rica, America Centrale" -> 2 frasi)"""
+    names = []
+    for text in (trip.get("destination", ""), trip.get("country", "")):
+        for part in text.split(","):
+            name = " ".join(_WORD.findall(fold(part)))
+            if len(name) >= 3 and name not in names:
+                names.append(name)
+    return names
+
+
+# Posizioni dei bit a 1 per ogni valore di byte
+_BYTE_BITS = [tuple(b for b in range(8) if value >> b & 1) for value in range(256)]
+
+
+def bits_to_indices(mask: int) -> List[int]:
+    """Indici dei bit a 1 (un passaggio sui bytes invece di shift ripetuti sull'int)"""
+    indices = []
+    for offset, byte in enumerate(mask.to_bytes((mask.bit_length() + 7) // 8, "little")):
+        if byte:
+            base = offset * 8
+            indices.extend(base + b for b in _BYTE_BITS[byte])
+    return indices
+
+
+def indices_to_bits(indices: Iterable[int], size: int) -> int:
+    """Bitset da una lista di indici in un solo passaggio (niente OR ripetuti su int grandi)"""
+    buffer = bytearray((size + 7) // 8)
+    for i in indices:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class SortedBits:
+    """Valori ordinati con indici: range [lo, hi] -> bitset tramite bisect"""
+
+    def __init__(self, pairs: Iterable[tuple]):
+        pairs = sorted(pairs)
+        self.keys = [value for value, _ in pairs]
+        self.order = [i for _, i in pairs]
+        self.rank = {i: position for position, i in enumerate(self.order)}
+        # prefix[b] = OR dei primi b*PREFIX_BLOCK indici in ordine di valore
+        size = max(self.order, default=-1) + 1
+        buffer = bytearray((size + 7) // 8)
+        self._prefix = [0]
+        for j, i in enumerate(self.order, 1):
+            buffer[i >> 3] |= 1 << (i & 7)
+            if j % PREFIX_BLOCK == 0:
+                self._prefix.append(int.from_bytes(buffer, "little"))
+
+    def _prefix_mask(self, position: int) -> int:
+        block = position // PREFIX_BLOCK
+        mask = self._prefix[block]
+        for i in self.order[block * PREFIX_BLOCK:position]:
+            mask |= 1 << i
+        return mask
+
+    def range(self, lo=None, hi=None) -> int:
+        start = 0 if lo is None else bisect_left(self.keys, lo)
+        end = len(self.keys) if hi is None else bisect_right(self.keys, hi)
+        if start >= end:
+            return 0
+        return self._prefix_mask(end) ^ self._prefix_mask(start)
+
+
+class TripSearch:
+    def __init__(self, trips: Iterable[dict]):
+        self.trips: List[dict] = list(trips)
+        self.all = (1 << len(self.trips)) - 1
+        postings = {"interests": {}, "origins": {}, "months": {}, "terms": {}}
+        self.labels: Dict[str, str] = {}  # chiave normalizzata -> etichetta originale
+        prices, starts, seats = [], [], []
+
+        for i, trip in enumerate(self.trips):
+            for interest in trip.get("interests", []):
+                self._post(postings["interests"], interest, i)
+            for city in trip.get("origin_cities", []):
+                self._post(postings["origins"], city, i)
+            for name in place_names(trip):
+                postings["terms"].setdefault(name, []).append(i)
+            start = (trip.get("dates") or {}).get("start")
+            if start:
+                starts.append((start, i))
+                postings["months"].setdefault(int(start[5:7]), []).append(i)
+            prices.append((trip.get("price_chf", 0), i))
+            available = trip.get("seats_available")
+            seats.append((UNLIMITED_SEATS if available is None else available, i))
+
+        size = len(self.trips)
+        self.interests: Dict[str, int] = {k: indices_to_bits(v, size) for k, v in postings["interests"].items()}
+        self.origins: Dict[str, int] = {k: indices_to_bits(v, size) for k, v in postings["origins"].items()}
+        self.months: Dict[int, int] = {k: indices_to_bits(v, size) for k, v in postings["months"].items()}
+        # Termini (nomi di mete) quasi sempre rari: liste di indici, bitset costruito alla query
+        self.terms: Dict[str, List[int]] = postings["terms"]
+        self._term_words = max((name.count(" ") + 1 for name in self.terms), default=1)
+        self.prices = SortedBits(prices)
+        self.starts = SortedBits(starts)
+        self.seats = SortedBits(seats)
+
+    def _post(self, postings: Dict[str, list], label: str, i: int):
+        key = fold(label)
+        ids = postings.setdefault(key, [])
+        if not ids or ids[-1] != i:
+            ids.append(i)
+        self.labels.setdefault(key, label)
+
+    @staticmethod
+    def _any(postings: Dict, keys: Sequence) -> int:
+        mask = 0
+        for key in keys:
+            mask |= postings.get(fold(key) if isinstance(key, str) else key, 0)
+        return mask
+
+    def search(self, interests: Sequence[str] = (), origins: Sequence[str] = (),
+               months: Sequence[int] = (), terms: Sequence[str] = (),
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               guests: int = 1, sort: str = "price", limit: int = 20, offset: int = 0) -> dict:
+        filters = {
+            "interests": self._any(self.interests, interests) if interests else None,
+            "origins": self._any(self.origins, origins) if origins else None,
+            "months": self._any(self.months, months) if months else None,
+            "terms": indices_to_bits((i for t in terms for i in self.terms.get(" ".join(_WORD.findall(fold(t))), ())),
+                                     len(self.trips)) if terms else None,
+            "price": self.prices.range(min_price, max_price) if min_price is not None or max_price is not None else None,
+            "dates": self.starts.range(date_from, date_to) if date_from or date_to else None,
+            "seats": self.seats.range(max(1, guests)),
+        }
+
+        def combined(skip: Optional[str] = None) -> int:
+            mask = self.all
+            for name, value in filters.items():
+                if value is not None and name != skip:
+                    mask &= value
+            return mask
+
+        mask = combined()
+        total = mask.bit_count()
+        order = self.starts.order if sort == "date" else self.prices.order
+        if total * 8 > len(self.trips):
+            # Molti risultati: basta scorrere l'ordinamento fino a riempire la pagina
+            flags = mask.to_bytes((len(self.trips) + 7) // 8, "little")
+            page = []
+            for i in order:
+                if flags[i >> 3] >> (i & 7) & 1:
+                    page.append(i)
+                    if len(page) >= offset + limit:
+                        break
+        else:
+            ranking = self.starts.rank if sort == "date" else self.prices.rank
+            page = sorted(bits_to_indices(mask), key=lambda i: ranking.get(i, len(self.trips)))
+        results = [self.trips[i] for i in page[offset:offset + limit]]
+
+        interest_base, origin_base, month_base = combined("interests"), combined("origins"), combined("months")
+        return {
+            "total": total,
+            "results": results,
+            "facets": {
+                "interests": self._facet(self.interests, interest_base),
+                "origin_cities": self._facet(self.origins, origin_base),
+                "months": {m: n for m, p in sorted(self.months.items()) if (n := (p & month_base).bit_count())},
+                "price": self._price_range(mask) if total else None,
+            },
+        }
+
+    def _price_range(self, mask: int) -> dict:
+        # Primo e ultimo viaggio selezionato nell'ordine per prezzo
+        flags = mask.to_bytes((len(self.trips) + 7) // 8, "little")
+        order, keys = self.prices.order, self.prices.keys
+        low = next(p for p, i in enumerate(order) if flags[i >> 3] >> (i & 7) & 1)
+        high = next(p for p in range(len(order) - 1, -1, -1) if flags[order[p] >> 3] >> (order[p] & 7) & 1)
+        return {"min": keys[low], "max": keys[high]}
+
+    def _facet(self, postings: Dict[str, int], base: int) -> Dict[str, int]:
+        counts = {self.labels[key]: (posting & base).bit_count() for key, posting in postings.items()}
+        return dict(sorted(((k, n) for k, n in counts.items() if n), key=lambda kv: (-kv[1], kv[0])))
+
+    # === TESTO LIBERO (chat) ===
+    def parse_query(self, text: str) -> dict:
+        """Filtri riconosciuti in una frase: interessi, partenze, mesi, mete, budget"""
+        folded = fold(text)
+        tokens = _WORD.findall(folded)
+        words = set(tokens)
+        # Mete come frasi intere: n-grammi di parole della domanda cercati tra i nomi di luogo
+        phrases = {" ".join(tokens[i:i + n]) for n in range(1, self._term_words + 1) for i in range(len(tokens) - n + 1)}
+        query = {
+            "interests": sorted(w for w in words if w in self.interests),
+            "origins": sorted(self.labels[key] for key in self.origins if re.search(rf"\b{re.escape(key)}\b", folded)),
+            "months": sorted({MONTHS[w] for w in words if w in MONTHS}),
+            "terms": sorted(p for p in phrases if p in self.terms and p not in self.interests and p not in self.origins),
+        }
+        if match := _MAX_PRICE.search(folded):
+            query["max_price"] = int(match.group(1))
+        if match := _MIN_PRICE.search(folded):
+            query["min_price"] = int(match.group(1))
+        return {key: value for key, value in query.items() if value}
+
+    def find(self, q: Optional[str] = None, **filters) -> dict:
+        """search() con in più i filtri ricavati dal testo libero q"""
+        for key, value in (self.parse_query(q) if q else {}).items():
+            if isinstance(value, list):
+                filters[key] = list(filters.get(key) or []) + value
+            elif filters.get(key) is None:
+                filters[key] = value
+        return self.search(**filters)
+
+
+def format_trip(trip: dict) -> str:
+    dates = trip.get("dates") or {}
+    origins = ", ".join(trip.get("origin_cities", [])[:3])
+    return (f"{trip.get('title', trip.get('destination', '?'))} - CHF {trip.get('price_chf')}"
+            f" | {dates.get('start', '?')} → {dates.get('end', '?')}"
+            f" | {seats_label(trip)} | partenze da {origins}")
+
+
+def seats_label(trip: dict) -> str:
+    available = trip.get("seats_available")
+    if available is None:
+        return "posti disponibili"
+    return "1 posto" if available == 1 else f"{available} posti"
+
+
+def trips_found(total: int) -> str:
+    return "1 viaggio" if total == 1 else f"{total} viaggi"
+
+
+def grounding_context(search: TripSearch, text: str, limit: int = 3) -> str:
+    """Viaggi reali pertinenti alla domanda (o i più economici disponibili) per il prompt"""
+    query = search.parse_query(text)
+    found = search.search(limit=limit, **query) if query else None
+    if not found or not found["total"]:
+        found = search.search(limit=limit)
+        header = "Viaggi disponibili (dal catalogo, posti aggiornati):"
+    else:
+        header = "Viaggi disponibili pertinenti alla richiesta (dal catalogo, posti aggiornati):"
+    if not found["results"]:
+        return "Al momento non ci sono viaggi con posti disponibili."
+    return "\n".join([header] + [f"- {format_trip(t)}" for t in found["results"]])
+
+
+class SearchCache(IndexCache):
+    """TripSearch ricostruito solo quando cambia la versione del catalogo"""
+
+    def __init__(self, load: Callable[[], Iterable[dict]], version: Optional[Callable[[], Hashable]] = None):
+        super().__init__(lambda: TripSearch(load()), version)
+
+    def get(self) -> TripSearch:
+        return super().get()
@@ -0,0 +1,375 @@
+"""
+Storage SQLite (WAL) per Ares Travel
+
+Sostituisce il ciclo load_data()/save_data() sull'intero data.json:
+ogni collezione ha la sua tabella (o righe indicizzate in `documents`)
+e le scritture toccano solo le righe interessate.
+
+Migrazione one-shot dal vecchio layout:
+    python -m ares.storage migrate data.json ares.db
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from .log import get_logger
+from .metrics import STORAGE_BUCKETS, Histogram
+
+log = get_logger("ares.storage")
+
+STORE_SECONDS = Histogram("ares_store_operation_seconds", "Durata operazioni SQLite per tipo (read/write)",
+                          ("kind", "op"), buckets=STORAGE_BUCKETS)
+
+
+def _read(op: str):
+    return STORE_SECONDS.time(kind="read", op=op)
+
+
+def _write(op: str):
+    return STORE_SECONDS.time(kind="write", op=op)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trips (
+    id INTEGER PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    id TEXT PRIMARY KEY,
+    trip_id INTEGER,
+    email TEXT,
+    created_at TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_trip ON bookings(trip_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_email ON bookings(email);
+CREATE TABLE IF NOT EXISTS user_profiles (
+    user_id TEXT PRIMARY KEY,
+    last_seen TEXT,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (collection, key)
+);
+"""
+
+# Chiave naturale per le collezioni "generiche" di data.json
+DOCUMENT_KEYS = {
+    "analytics": ("trip_id",),
+    "dynamic_pricing": ("trip_id",),
+    "smart_notifications": ("id",),
+    "personalized_offers": ("id",),
+    "payment_sessions": ("session_id",),
+    "wishlists": ("user_id", "trip_id"),
+    "leads": ("id",),
+    "comparisons": ("id",),
+    "destinations": ("id",),
+}
+
+# Collezioni con tabella dedicata
+TABLE_COLLECTIONS = ("trips", "bookings", "user_profiles")
+
+
+class BookingError(Exception):
+    """Prenotazione rifiutata (viaggio inesistente, dati invalidi o posti esauriti)"""
+
+    def __init__(self, message: str, status: int = 409):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _dumps(doc: Any) -> str:
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+
+
+def document_key(collection: str, doc: dict, position: Optional[int] = None) -> str:
+    """Chiave di riga per un documento generico (fallback: posizione o uuid)"""
+    fields = DOCUMENT_KEYS.get(collection, ("id",))
+    values = [doc.get(f) for f in fields]
+    if any(v is None for v in values):
+        return f"#{position:08d}" if position is not None else f"#{uuid.uuid4().hex}"
+    return ":".join(str(v) for v in values)
+
+
+class Store:
+    """Storage indicizzato su SQLite in modalità WAL (una connessione per thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    # === CONNESSIONE ===
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: ogni COMMIT è fsync'd sul WAL
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transazione di scrittura serializzata (BEGIN IMMEDIATE)"""
+        conn = self._conn()
+        with _write("transaction"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # === META ===
+    @_read("get_meta")
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @_write("set_meta")
+    def set_meta(self, key: str, value: Any, conn: Optional[sqlite3.Connection] = None):
+        (conn or self._conn()).execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, _dumps(value)),
+        )
+
+    def revision(self, collection: str) -> int:
+        """Contatore incrementato ad ogni scrittura sulla collezione (per le cache)"""
+        return self.get_meta(f"rev:{collection}", 0)
+
+    def _bump(self, collection: str, conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            (f"rev:{collection}",),
+        )
+
+    def is_empty(self) -> bool:
+        return self.get_meta("migrated_at") is None
+
+    # === TRIPS ===
+    @_read("trips")
+    def trips(self) -> List[dict]:
+        rows = self._conn().execute("SELECT body FROM trips ORDER BY id").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    @_read("get_trip")
+    def get_trip(self, trip_id: int) -> Optional[dict]:
+        row = self._conn().execute("SELECT body FROM trips WHERE id = ?", (trip_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @_write("put_trip")
+    def put_trip(self, trip: dict, conn: Optional[sqlite3.Connection] = None):
+        conn = conn or self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO trips (id, body) VALUES (?, ?)",
+            (trip["id"], _dumps(trip)),
+        )
+        self._bump("trips", conn)
+
+    # === BOOKINGS ===
+    @_read("bookings")
+    def bookings(self, trip_id: Optional[int] = None, email: Optional[str] = None) -> List[dict]:
+        query, args = "SELECT body FROM bookings", []
+        clauses = []
+        if trip_id is not None:
+            clauses.append("trip_id = ?")
+            args.append(trip_id)
+        if email is not None:
+            clauses.append("email = ?")
+            args.append(email)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        rows = self._conn().execute(query + " ORDER BY created_at, id", args).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    @_read("get_booking")
+    def get_booking(self, booking_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT body FROM bookings WHERE id = ?", (booking_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @_write("insert_booking")
+    def insert_booking(self, booking: dict, conn: Optional[sqlite3.Connection] = None):
+        (conn or self._conn()).execute(
+            "INSERT INTO bookings (id, trip_id, email, created_at, body) VALUES (?, ?, ?, ?, ?)",
+            (
+                booking["id"],
+                booking.get("tripId"),
+                booking.get("customerEmail"),
+                booking.get("bookingDate"),
+                _dumps(booking),
+            ),
+        )
+
+    def reserve_booking(self, booking: dict) -> dict:
+        """Prenotazione atomica: ID monotono da next_id + decremento posti
+
+        Tutto avviene in una sola transazione IMMEDIATE, quindi richieste
+        concorrenti (thread o processi) vengono serializzate da SQLite.
+        """
+        try:
+            guests = int(booking.get("guests") or 1)
+        except (TypeError, ValueError):
+            raise BookingError("Numero ospiti non valido", 400)
+        if guests < 1:
+            raise BookingError("Numero ospiti non valido", 400)
+
+        trip_id = booking.get("tripId")
+        if isinstance(trip_id, str) and trip_id.isdigit():
+            trip_id = int(trip_id)
+
+        with self.transaction() as conn:
+            trip = self.get_trip(trip_id) if isinstance(trip_id, int) else None
+            if trip is None:
+                raise BookingError(f"Viaggio {trip_id} non trovato", 404)
+
+            available = trip.get("seats_available")
+            if available is not None:
+                if guests > available:
+                    raise BookingError(f"Posti insufficienti: {available} disponibili", 409)
+                trip["seats_available"] = available - guests
+                self.put_trip(trip, conn)
+
+            seq = self.get_meta("next_id") or self.count("bookings") + 1
+            booking = {**booking, "id": f"BK{seq:04d}", "tripId": trip_id, "guests": guests}
+            booking = {"id": booking.pop("id"), **booking}
+            self.insert_booking(booking, conn)
+            self.set_meta("next_id", seq + 1, conn)
+        return booking
+
+    # === USER PROFILES ===
+    @_read("get_profile")
+    def get_profile(self, user_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT body FROM user_profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @_write("put_profile")
+    def put_profile(self, profile: dict, conn: Optional[sqlite3.Connection] = None):
+        (conn or self._conn()).execute(
+            "INSERT OR REPLACE INTO user_profiles (user_id, last_seen, body) VALUES (?, ?, ?)",
+            (profile["user_id"], profile.get("last_seen"), _dumps(profile)),
+        )
+
+    # === COLLEZIONI GENERICHE ===
+    @_read("documents")
+    def documents(self, collection: str) -> List[dict]:
+        rows = self._conn().execute(
+            "SELECT body FROM documents WHERE collection = ? ORDER BY key", (collection,)
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    @_read("get_document")
+    def get_document(self, collection: str, key: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT body FROM documents WHERE collection = ? AND key = ?", (collection, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @_write("put_document")
+    def put_document(self, collection: str, doc: dict, key: Optional[str] = None,
+                     conn: Optional[sqlite3.Connection] = None):
+        if key is None:
+            key = document_key(collection, doc)
+        conn = conn or self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, key, body) VALUES (?, ?, ?)",
+            (collection, key, _dumps(doc)),
+        )
+        self._bump(collection, conn)
+
+    @_read("count")
+    def count(self, collection: str) -> int:
+        if collection in TABLE_COLLECTIONS:
+            return self._conn().execute(f"SELECT COUNT(*) FROM {collection}").fetchone()[0]
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM documents WHERE collection = ?", (collection,)
+        ).fetchone()[0]
+
+
+# === MIGRAZIONE ===
+def migrate_document(store: Store, data: Dict[str, Any], source: str = "data.json") -> Dict[str, int]:
+    """Importa il layout di data.json in un'unica transazione, ritorna i conteggi"""
+    counts: Dict[str, int] = {}
+    with store.transaction() as conn:
+        if not store.is_empty():
+            # Un altro worker ha già migrato mentre aspettavamo il lock
+            return counts
+        for name, value in data.items():
+            if name == "trips":
+                for trip in value:
+                    store.put_trip(trip, conn)
+            elif name == "bookings":
+                for booking in value:
+                    store.insert_booking(booking, conn)
+            elif name == "user_profiles":
+                for profile in value:
+                    store.put_profile(profile, conn)
+            elif isinstance(value, list):
+                for position, doc in enumerate(value):
+                    store.put_document(name, doc, document_key(name, doc, position), conn)
+            else:
+                # Scalari e dict (next_id, live_activity) -> meta
+                store.set_meta(name, value, conn)
+                counts[name] = 1
+                continue
+            counts[name] = len(value)
+        store.set_meta("migrated_from", source, conn)
+        store.set_meta("migrated_at", datetime.now().isoformat(), conn)
+    return counts
+
+
+def migrate_json(json_path: str, store: Store) -> Dict[str, int]:
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return migrate_document(store, data, os.path.basename(json_path))
+
+
+def open_store(db_path: str, *seed_files: str) -> Store:
+    """Apre lo store e, se vuoto, lo popola dal primo file JSON esistente"""
+    store = Store(db_path)
+    if store.is_empty():
+        for path in seed_files:
+            if os.path.exists(path):
+                try:
+                    migrate_json(path, store)
+                    break
+                except (OSError, ValueError) as e:
+                    log.warning("migration_failed", source=path, error=str(e))
+        else:
+            migrate_document(store, {"destinations": [], "bookings": []}, "empty")
+    return store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "migrate":
+        print("Uso: python -m ares.storage migrate <data.json> <ares.db>")
+        sys.exit(1)
+    result = migrate_json(sys.argv[2], Store(sys.argv[3]))
+    for collection, n in result.items():
+        print(f"✅ {collection}: {n}")
@@ -0,0 +1,316 @@
+"""
+WebSocket manager: registry O(1) e invio concorrente con code per client
+
+Ogni connessione ha una coda in uscita limitata svuotata dal proprio
+writer task, così un client lento non blocca gli altri. I broadcast
+vengono serializzati una sola volta e passano dal backend pub/sub
+(fan-out tra worker, vedi ares.pubsub). I messaggi per topic (es. i
+prezzi di un viaggio) arrivano solo ai client iscritti a quel topic.
+
+Il numero di iscritti per topic è aggregato tra worker (conteggi locali
+pubblicati a ogni cambio e nel presence), e ogni topic ha un solo worker
+proprietario (rendezvous hashing sui worker vivi): chi deriva eventi dal
+totale, come i prezzi dai viewer, li pubblica solo dal proprietario.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from .log import get_logger
+from .metrics import Counter
+from .pubsub import PubSub
+
+BROADCAST_CHANNEL = "ws:broadcast"
+PRESENCE_CHANNEL = "ws:presence"
+TOPIC_CHANNEL = "ws:topic"
+COUNT_CHANNEL = "ws:topic_count"
+PRESENCE_INTERVAL = 5.0
+
+# Politiche per client lenti (coda piena durante un broadcast)
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+log = get_logger("ares.ws", sampled=True)
+
+WS_MESSAGES = Counter("ares_ws_messages_total", "Messaggi WebSocket ricevuti/inviati", ("direction",))
+
+
+class ClientConnection:
+    __slots__ = ("websocket", "queue", "writer", "dropped", "topics")
+
+    def __init__(self, websocket, maxsize: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.topics: Set[str] = set()
+
+
+class WebSocketManager:
+    def __init__(self, pubsub: PubSub, queue_size: int = 64, slow_policy: str = DROP_OLDEST):
+        if slow_policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Politica client lenti sconosciuta: {slow_policy}")
+        self.active_connections: Dict[object, ClientConnection] = {}
+        # topic -> websocket iscritti (solo client locali)
+        self.topics: Dict[str, Set[object]] = {}
+        self.pubsub = pubsub
+        self.queue_size = queue_size
+        self.slow_policy = slow_policy
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # Connessioni degli altri worker: worker_id -> (count, timestamp)
+        self.peers = {}
+        # Iscritti degli altri worker: topic -> {worker_id: count}
+        self.peer_topics: Dict[str, Dict[str, int]] = {}
+        # Chiamata (su ogni worker) quando cambia il totale degli iscritti a un topic
+        self.on_subscribers: Optional[Callable[[str], Awaitable[None]]] = None
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self._presence_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Iscrizione unica ai canali: ogni worker fa fan-out ai propri client"""
+        await self.pubsub.subscribe(BROADCAST_CHANNEL, self._deliver_local)
+        await self.pubsub.subscribe(PRESENCE_CHANNEL, self._on_presence)
+        await self.pubsub.subscribe(TOPIC_CHANNEL, self._deliver_topic)
+        await self.pubsub.subscribe(COUNT_CHANNEL, self._on_topic_count)
+        await self.pubsub.start()
+        self._presence_task = asyncio.create_task(self._presence_loop())
+
+    async def stop(self):
+        if self._presence_task:
+            self._presence_task.cancel()
+            self._presence_task = None
+        await self.pubsub.stop()
+
+    # === REGISTRY ===
+    async def connect(self, websocket):
+        await websocket.accept()
+        self.register(websocket)
+        log.info("ws_connected", total=len(self.active_connections))
+
+    def register(self, websocket) -> ClientConnection:
+        client = ClientConnection(websocket, self.queue_size)
+        client.writer = asyncio.create_task(self._writer(client))
+        self.active_connections[websocket] = client
+        return client
+
+    def disconnect(self, websocket):
+        client = self.active_connections.pop(websocket, None)
+        if client is not None:
+            self._drop_topics(websocket, client.topics)
+            if client.writer is not None and client.writer is not asyncio.current_task():
+                client.writer.cancel()
+            log.info("ws_disconnected", total=len(self.active_connections))
+
+    async def _writer(self, client: ClientConnection):
+        """Svuota la coda del client: l'unico punto che scrive sul socket"""
+        websocket = client.websocket
+        try:
+            while True:
+                text = await client.queue.get()
+                await websocket.send_text(text)
+                WS_MESSAGES.inc(direction="out")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("ws_send_failed", error=str(e))
+            self.disconnect(websocket)
+
+    # === INVIO ===
+    async def send_personal_message(self, message: dict, websocket):
+        """Accoda per un singolo client (attende se la sua coda è piena)"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+        await client.queue.put(json.dumps(message))
+
+    async def broadcast(self, message: dict):
+        """Pubblica su tutti i worker/nodi tramite il backend pub/sub"""
+        await self.pubsub.publish(BROADCAST_CHANNEL, json.dumps(message).encode("utf-8"))
+
+    async def _deliver_local(self, data: bytes):
+        # Serializzato una volta: la stessa stringa va in tutte le code
+        self.fan_out(data.decode("utf-8"))
+
+    def fan_out(self, text: str, targets: Optional[Iterable[object]] = None):
+        """Accoda senza attendere; coda piena -> politica slow consumer"""
+        slow = []
+        connections = self.active_connections
+        clients = connections.items() if targets is None else (
+            (websocket, connections[websocket]) for websocket in list(targets) if websocket in connections)
+        for websocket, client in clients:
+            queue = client.queue
+            if queue.full():
+                if self.slow_policy == DISCONNECT:
+                    slow.append(websocket)
+                    continue
+                queue.get_nowait()
+                client.dropped += 1
+                self.dropped += 1
+            queue.put_nowait(text)
+
+        for websocket in slow:
+            self.slow_disconnects += 1
+            self.disconnect(websocket)
+            asyncio.create_task(self._close(websocket))
+
+    # === TOPIC ===
+    def subscribe(self, websocket, topics: Iterable[str]) -> Set[str]:
+        """Iscrive il client ai topic; ritorna quelli nuovi"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return set()
+        added = set(topics) - client.topics
+        client.topics |= added
+        for topic in added:
+            self.topics.setdefault(topic, set()).add(websocket)
+        return added
+
+    def unsubscribe(self, websocket, topics: Optional[Iterable[str]] = None) -> Set[str]:
+        """Rimuove le iscrizioni (tutte se topics è None); ritorna quelle rimosse"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return set()
+        removed = set(client.topics) if topics is None else client.topics & set(topics)
+        client.topics -= removed
+        self._drop_topics(websocket, removed)
+        return removed
+
+    def _drop_topics(self, websocket, topics: Iterable[str]):
+        for topic in topics:
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.topics[topic]
+
+    def subscribers(self, topic: str) -> int:
+        """Iscritti locali (solo questo worker)"""
+        return len(self.topics.get(topic, ()))
+
+    def total_subscribers(self, topic: str) -> int:
+        """Iscritti su tutti i worker vivi"""
+        return self.subscribers(topic) + sum(self.peer_topics.get(topic, {}).values())
+
+    def owns(self, topic: str) -> bool:
+        """Questo worker è il proprietario del topic tra quelli vivi (rendezvous hashing)"""
+        workers = [self.worker_id, *self._live_peers()]
+        return max(workers, key=lambda w: zlib.crc32(f"{w}|{topic}".encode("utf-8"))) == self.worker_id
+
+    async def announce_subscribers(self, topics: Iterable[str]):
+        """Pubblica i conteggi locali cambiati: ogni worker aggiorna il totale"""
+        for topic in topics:
+            await self.pubsub.publish(COUNT_CHANNEL, json.dumps({
+                "worker": self.worker_id,
+                "topic": topic,
+                "count": self.subscribers(topic)
+            }).encode("utf-8"))
+
+    async def _on_topic_count(self, data: bytes):
+        info = json.loads(data)
+        if info.get("worker") != self.worker_id:
+            self._set_peer_count(info["worker"], info["topic"], info.get("count", 0))
+        await self._subscribers_changed([info["topic"]])
+
+    def _set_peer_count(self, worker: str, topic: str, count: int) -> bool:
+        counts = self.peer_topics.setdefault(topic, {})
+        previous = counts.get(worker, 0)
+        if count:
+            counts[worker] = count
+        else:
+            counts.pop(worker, None)
+            if not counts:
+                del self.peer_topics[topic]
+        return previous != count
+
+    async def _subscribers_changed(self, topics: Iterable[str]):
+        if self.on_subscribers is None:
+            return
+        for topic in topics:
+            try:
+                await self.on_subscribers(topic)
+            except Exception as e:
+                log.warning("subscribers_callback_failed", topic=topic, error=str(e))
+
+    async def publish(self, topic: str, message: dict):
+        """Come broadcast, ma consegnato solo agli iscritti al topic (su ogni worker)"""
+        await self.pubsub.publish(TOPIC_CHANNEL, f"{topic}\n{json.dumps(message)}".encode("utf-8"))
+
+    async def _deliver_topic(self, data: bytes):
+        topic, _, text = data.decode("utf-8").partition("\n")
+        subscribers = self.topics.get(topic)
+        if subscribers:
+            self.fan_out(text, subscribers)
+
+    @staticmethod
+    async def _close(websocket):
+        try:
+            # 1013: try again later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    # === PRESENCE: conteggio connessioni aggregato tra worker ===
+    async def _presence_loop(self):
+        while True:
+            try:
+                # Anche i conteggi per topic: un worker nuovo (o che ha perso messaggi) si riallinea
+                await self.pubsub.publish(PRESENCE_CHANNEL, json.dumps({
+                    "worker": self.worker_id,
+                    "connections": len(self.active_connections),
+                    "topics": {topic: len(subscribers) for topic, subscribers in self.topics.items()},
+                    "ts": time.time()
+                }).encode("utf-8"))
+                await self._expire_peers()
+            except Exception as e:
+                log.warning("presence_failed", error=str(e))
+            await asyncio.sleep(PRESENCE_INTERVAL)
+
+    async def _on_presence(self, data: bytes):
+        info = json.loads(data)
+        worker = info.get("worker")
+        if worker == self.worker_id:
+            return
+        self.peers[worker] = (info.get("connections", 0), info.get("ts", time.time()))
+        counts = info.get("topics", {})
+        known = [topic for topic, workers in self.peer_topics.items() if worker in workers]
+        changed = [topic for topic in set(counts) | set(known)
+                   if self._set_peer_count(worker, topic, counts.get(topic, 0))]
+        await self._subscribers_changed(changed)
+
+    def _live_peers(self) -> Dict[str, tuple]:
+        cutoff = time.time() - 3 * PRESENCE_INTERVAL
+        self.peers = {w: p for w, p in self.peers.items() if p[1] >= cutoff}
+        return self.peers
+
+    async def _expire_peers(self):
+        # Worker spariti: i loro iscritti non contano più nei totali
+        live = self._live_peers()
+        changed = set()
+        for topic, workers in list(self.peer_topics.items()):
+            for worker in [w for w in workers if w not in live]:
+                self._set_peer_count(worker, topic, 0)
+                changed.add(topic)
+        await self._subscribers_changed(changed)
+
+    def total_connections(self) -> int:
+        return len(self.active_connections) + sum(count for count, _ in self._live_peers().values())
+
+    def queue_depth(self) -> int:
+        return sum(client.queue.qsize() for client in self.active_connections.values())
+
+    def stats(self) -> dict:
+        return {
+            "local": len(self.active_connections),
+            "queue_size": self.queue_size,
+            "queued": self.queue_depth(),
+            "slow_policy": self.slow_policy,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "topics": len(self.topics),
+            "peer_topics": len(self.peer_topics),
+        }
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark broadcast WebSocket su socket finti
+
+Registra N client finti (una frazione lenti) nel WebSocketManager e
+misura la latenza di consegna di ogni broadcast: p50/p99/max sui client
+veloci, messaggi scartati sui lenti.
+
+    python bench/bench_broadcast.py --clients 10000 --messages 20 --slow 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ares.pubsub import MemoryPubSub
+from ares.ws import WebSocketManager
+
+
+class FakeWebSocket:
+    __slots__ = ("delay", "latencies", "received")
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.latencies = []
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        sent_at = json.loads(text)["t"]
+        self.latencies.append(time.perf_counter() - sent_at)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(args):
+    manager = WebSocketManager(MemoryPubSub(), queue_size=args.queue_size, slow_policy=args.policy)
+    await manager.start()
+
+    slow_every = int(1 / args.slow) if args.slow else 0
+    sockets = []
+    for i in range(args.clients):
+        ws = FakeWebSocket(args.slow_delay if slow_every and i % slow_every == 0 else 0.0)
+        await manager.connect(ws) if args.verbose else manager.register(ws)
+        sockets.append(ws)
+
+    start = time.perf_counter()
+    for n in range(args.messages):
+        await manager.broadcast({"type": "bench", "n": n, "t": time.perf_counter()})
+        await asyncio.sleep(args.interval)
+    fan_out_elapsed = time.perf_counter() - start
+
+    # Attende che i client veloci abbiano svuotato le code
+    fast = [ws for ws in sockets if not ws.delay]
+    deadline = time.perf_counter() + 30
+    while any(ws.received < args.messages for ws in fast) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+    latencies = [l for ws in fast for l in ws.latencies]
+    slow = [ws for ws in sockets if ws.delay]
+    result = {
+        "clients": args.clients,
+        "slow_clients": len(slow),
+        "messages": args.messages,
+        "policy": args.policy,
+        "publish_s": round(fan_out_elapsed, 3),
+        "deliveries": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "dropped": manager.dropped,
+        "slow_disconnects": manager.slow_disconnects,
+    }
+    print(json.dumps(result, indent=2))
+    await manager.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark broadcast WebSocket")
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="secondi tra broadcast")
+    parser.add_argument("--slow", type=float, default=0.01, help="frazione di client lenti")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="secondi per send sui client lenti")
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--policy", default="drop_oldest", choices=["drop_oldest", "disconnect"])
+    parser.add_argument("--verbose", action="store_true")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark indice geografico su un catalogo sintetico
+
+Genera N viaggi (metà uniformi sul globo, metà concentrati attorno a
+città turistiche), poi confronta GeoIndex con la scansione lineare per
+bbox (viewport), k più vicini e cluster per zoom:
+
+    python bench/bench_geo.py --trips 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ares.geo import GeoIndex, haversine_km
+
+HOTSPOTS = [(35.68, 139.65), (36.39, 25.46), (-13.16, -72.54), (3.20, 73.22), (64.15, -21.94),
+            (48.86, 2.35), (40.71, -74.01), (-33.87, 151.21), (-8.34, 115.09), (37.39, -5.98)]
+
+
+def synthetic_trips(n: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    trips = []
+    for i in range(n):
+        if i % 2:
+            lat, lng = rng.choice(HOTSPOTS)
+            lat, lng = lat + rng.gauss(0, 3), lng + rng.gauss(0, 3)
+        else:
+            lat, lng = rng.uniform(-60, 75), rng.uniform(-180, 180)
+        lat = max(-90.0, min(90.0, lat))
+        lng = (lng + 180) % 360 - 180
+        trips.append({"id": i + 1, "title": f"Trip {i + 1}", "lat": round(lat, 5), "lng": round(lng, 5),
+                      "price_chf": rng.randint(600, 6000)})
+    return trips
+
+
+def timed(fn, args_list) -> dict:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def linear_bbox(trips, south, west, north, east):
+    if west <= east:
+        return [t for t in trips if south <= t["lat"] <= north and west <= t["lng"] <= east]
+    return [t for t in trips if south <= t["lat"] <= north and (t["lng"] >= west or t["lng"] <= east)]
+
+
+def linear_nearest(trips, lat, lng, k):
+    return sorted(trips, key=lambda t: haversine_km(lat, lng, t["lat"], t["lng"]))[:k]
+
+
+def main(args):
+    rng = random.Random(7)
+    trips = synthetic_trips(args.trips)
+
+    start = time.perf_counter()
+    index = GeoIndex(trips, cell_deg=args.cell)
+    build_s = time.perf_counter() - start
+
+    viewports = []
+    for _ in range(args.queries):
+        lat, lng = rng.choice(HOTSPOTS) if rng.random() < 0.5 else (rng.uniform(-60, 70), rng.uniform(-180, 180))
+        half = rng.choice([2, 10, 30])
+        west, east = lng - half, lng + half
+        west = (west + 180) % 360 - 180
+        east = (east + 180) % 360 - 180
+        viewports.append((lat - half / 2, west, lat + half / 2, east))
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(args.queries)]
+
+    # Correttezza a campione contro la scansione lineare
+    for vp in viewports[:20]:
+        assert len(index.bbox(*vp)) == len(linear_bbox(trips, *vp)), vp
+    for lat, lng in points[:5]:
+        got = [t["id"] for _, t in index.nearest(lat, lng, 10)]
+        assert got == [t["id"] for t in linear_nearest(trips, lat, lng, 10)], (lat, lng)
+
+    linear_queries = max(1, args.queries // 10)
+    result = {
+        "trips": args.trips,
+        "cell_deg": args.cell,
+        "build_s": round(build_s, 3),
+        "bbox": {
+            "index": timed(index.bbox, viewports),
+            "linear": timed(lambda *vp: linear_bbox(trips, *vp), viewports[:linear_queries]),
+            "avg_results": round(statistics.fmean(len(index.bbox(*vp)) for vp in viewports), 1),
+        },
+        "nearest_k10": {
+            "index": timed(lambda lat, lng: index.nearest(lat, lng, 10), points),
+            "linear": timed(lambda lat, lng: linear_nearest(trips, lat, lng, 10), points[:linear_queries]),
+        },
+        "clusters": {},
+    }
+    for zoom in (0, 2, 4, 6, 8):
+        start = time.perf_counter()
+        first = index.clusters(zoom)
+        warm = time.perf_counter() - start
+        result["clusters"][f"zoom_{zoom}"] = {
+            "first_call_ms": round(warm * 1000, 2),
+            "global_clusters": len(first),
+            "viewport": timed(lambda *vp: index.clusters(zoom, *vp), viewports),
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark GeoIndex")
+    parser.add_argument("--trips", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--cell", type=float, default=1.0, help="lato cella griglia in gradi")
+    main(parser.parse_args())
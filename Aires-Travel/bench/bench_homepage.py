@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark homepage: lettura da disco ad ogni richiesta vs PageCache
+
+Monta le due versioni della route "/" sulla stessa app e misura le
+richieste/sec in-process (httpx + ASGI, nessun socket di mezzo):
+
+    python bench/bench_homepage.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+from ares.pages import PageCache
+
+INDEX = os.path.join(ROOT, "public", "index.html")
+
+
+def build_app(token: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/legacy")
+    async def legacy():
+        # Handler precedente: open + read + replace per ogni richiesta
+        with open(INDEX, "r", encoding="utf-8") as f:
+            html = f.read()
+        if token:
+            html = html.replace("YOUR_CESIUM_TOKEN_HERE", token)
+        return HTMLResponse(html)
+
+    cache = PageCache(INDEX, render=lambda html: html.replace("YOUR_CESIUM_TOKEN_HERE", token) if token else html)
+
+    @app.get("/cached")
+    async def cached(request: Request):
+        return cache.response(request)
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, headers: dict, total: int, concurrency: int) -> dict:
+    remaining = total
+    transferred = 0
+
+    async def worker():
+        nonlocal remaining, transferred
+        while remaining > 0:
+            remaining -= 1
+            async with client.stream("GET", path, headers=headers) as r:
+                async for chunk in r.aiter_raw():
+                    transferred += len(chunk)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "rps": round(total / elapsed, 1),
+        "elapsed_s": round(elapsed, 3),
+        "avg_bytes": transferred // total,
+    }
+
+
+async def run(args):
+    app = build_app(args.token)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Sul wire contano i bytes compressi: niente decodifica lato client
+        raw = {"accept-encoding": args.encoding}
+        await measure(client, "/cached", raw, 10, 1)  # warm-up (render iniziale)
+        first = await client.get("/cached", headers=raw)
+        results = {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "accept_encoding": args.encoding,
+            "legacy": await measure(client, "/legacy", raw, args.requests, args.concurrency),
+            "cached": await measure(client, "/cached", raw, args.requests, args.concurrency),
+            "cached_304": await measure(client, "/cached", dict(raw, **{"if-none-match": first.headers["etag"]}),
+                                        args.requests, args.concurrency),
+        }
+        results["speedup"] = round(results["cached"]["rps"] / results["legacy"]["rps"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark homepage")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--encoding", default="gzip, deflate, br")
+    parser.add_argument("--token", default=os.getenv("CESIUM_TOKEN", ""))
+    asyncio.run(run(parser.parse_args()))
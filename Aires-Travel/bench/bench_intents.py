@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Intenti chat: parità tra i punti di risposta e microbenchmark del matcher
+
+1. Parità: per ogni frase del corpus (IT/EN/FR/ES) le tre strade senza AI
+   (mock demo, fallback di /api/chat, fallback del WebSocket) devono
+   riconoscere lo stesso intento atteso. L'AI viene fatta fallire
+   sostituendo get_ai_response, così /api/chat e /ws usano il fallback.
+   Il mock passa da mock_ai_response: se risponde dal catalogo, ogni
+   viaggio elencato deve corrispondere all'intento atteso.
+2. Benchmark: ladder if/elif precedente (solo 12 parole italiane), la
+   stessa tabella multilingua controllata con `in`, e IntentMatcher.
+
+    python bench/bench_intents.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("USE_OPENAI", "false")
+
+from ares.intents import INTENTS, matcher
+
+# (frase, intento atteso)
+CORPUS = [
+    ("Vorrei andare a Tokyo", "tokyo"), ("I dream of Japan", "tokyo"), ("Un voyage au Japon ?", "tokyo"),
+    ("Santorini è bella?", "santorini"), ("Greece in June", "santorini"), ("Vacaciones en Grecia", "santorini"),
+    ("Le Maldive!", "maldive"), ("honeymoon in the Maldives", "maldive"), ("las Maldivas", "maldive"),
+    ("Machu Picchu quando?", "machu"), ("Perù o Cile?", "machu"), ("randonnée au Pérou", "machu"),
+    ("Islanda d'inverno", "islanda"), ("Iceland northern lights", "islanda"), ("L'Islande", "islanda"),
+    ("Islandia en marzo", "islanda"),
+    ("Quanto costa?", "prezzo"), ("Qual è il prezzo?", "prezzo"), ("something cheap please", "prezzo"),
+    ("Quel est le prix ?", "prezzo"), ("¿Cuánto cuesta?", "prezzo"), ("un coût raisonnable", "prezzo"),
+    ("Voglio fare un viaggio", "viaggio"), ("Consigliami dei viaggi", "viaggio"), ("plan a trip", "viaggio"),
+    ("Je veux voyager", "viaggio"), ("Quiero viajar", "viaggio"),
+    ("test", "test"),
+    # Priorità: la meta vince sui temi generici
+    ("Prezzo per Tokyo?", "tokyo"), ("viaggio alle Maldive economico", "maldive"),
+    # Nessun intento (niente match su sottostringhe)
+    ("ciao", None), ("Il testo è lungo", None), ("Costa Rica", None), ("Perugia", None),
+    # Parole comuni nei nomi di luogo ("Costa Rica, America Centrale") non sono mete
+    ("quanto costa un viaggio?", "prezzo"), ("quanto costa il viaggio a Santorini?", "santorini"),
+    ("stazione centrale", None),
+]
+
+
+def legacy_fallback(user_text: str) -> str:
+    """Ladder precedente di /ws (fallback_response), per confronto"""
+    if "tokyo" in user_text.lower():
+        return "tokyo"
+    elif "santorini" in user_text.lower():
+        return "santorini"
+    elif "maldive" in user_text.lower():
+        return "maldive"
+    elif "machu" in user_text.lower() or "peru" in user_text.lower():
+        return "machu"
+    elif "islanda" in user_text.lower():
+        return "islanda"
+    elif "prezzo" in user_text.lower() or "costo" in user_text.lower() or "economico" in user_text.lower():
+        return "prezzo"
+    elif "viaggio" in user_text.lower():
+        return "viaggio"
+    elif "test" in user_text.lower():
+        return "test"
+    return None
+
+
+def substring_scan(user_text: str):
+    """Stessa tabella multilingua controllata con `in` sinonimo per sinonimo"""
+    text = user_text.lower()
+    for name, languages in INTENTS:
+        for words in languages.values():
+            for word in words:
+                if word.rstrip("*") in text:
+                    return name
+    return None
+
+
+def catalog_intent(reply: str):
+    """Intento dei viaggi elencati da una risposta del catalogo ("mixed" se diversi)"""
+    titles = [line[2:].split(" - CHF")[0] for line in reply.splitlines() if line.startswith("• ")]
+    intents = {matcher.match(title) for title in titles}
+    return intents.pop() if len(intents) == 1 else "mixed"
+
+
+def check_parity() -> dict:
+    from fastapi.testclient import TestClient
+    import main
+
+    async def unavailable(user_message: str, history: list = ()) -> dict:
+        raise RuntimeError("AI non disponibile (bench)")
+
+    failures = []
+    main.get_ai_response = unavailable
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws") as ws:
+            for text, expected in CORPUS:
+                got = {"matcher": matcher.match(text)}
+                # Mock completo: catalogo (filtri riconosciuti) prima delle parole chiave
+                mock_text = main.mock_ai_response(text)["text"]
+                if mock_text.startswith("✈️ Ho trovato"):
+                    got["mock"] = catalog_intent(mock_text)
+                else:
+                    got["mock"] = next((k for k, v in main.MOCK_RESPONSES.items() if v == mock_text), None)
+                http_text = client.post("/api/chat", json={"text": text}).json()["response"]
+                ws.send_text(json.dumps({"type": "user", "text": text}))
+                while True:
+                    frame = ws.receive_json()
+                    if frame.get("type") == "assistant":
+                        break
+                for site, reply in (("http", http_text), ("ws", frame["text"])):
+                    got[site] = next((k for k, v in main.FALLBACK_RESPONSES.items() if v == reply), None)
+                # "test" non ha una risposta demo dedicata
+                wanted = {site: expected for site in got}
+                if expected not in main.MOCK_RESPONSES and not mock_text.startswith("✈️ Ho trovato"):
+                    wanted["mock"] = None
+                if got != wanted:
+                    failures.append({"text": text, "expected": expected, "got": got})
+    return {"phrases": len(CORPUS), "failures": failures}
+
+
+def bench(iterations: int) -> dict:
+    rng = random.Random(3)
+    filler = "ciao vorrei qualche informazione per la mia famiglia la prossima estate".split()
+    messages = []
+    for _ in range(iterations):
+        words = rng.sample(filler, rng.randint(3, len(filler)))
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(CORPUS)[0])
+        messages.append(" ".join(words))
+
+    result = {"iterations": iterations}
+    for name, fn in (("legacy_ladder", legacy_fallback), ("substring_scan", substring_scan),
+                     ("matcher", matcher.match)):
+        start = time.perf_counter()
+        for text in messages:
+            fn(text)
+        elapsed = time.perf_counter() - start
+        result[name] = {"us_per_message": round(elapsed / iterations * 1e6, 2)}
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parità e benchmark intenti chat")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--skip-parity", action="store_true")
+    args = parser.parse_args()
+    report = {"benchmark": bench(args.iterations)}
+    if not args.skip_parity:
+        report["parity"] = check_parity()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report.get("parity", {}).get("failures"):
+        sys.exit(1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Replay di eventi sul motore prezzi dinamici
+
+Genera un flusso sintetico (viewer che entrano/escono, prenotazioni che
+consumano posti, cambi meteo e sconti flash rari) e lo riproduce su
+PricingEngine, misurando eventi/s, ricalcoli effettivi e cambi di
+prezzo. Confronto: ricalcolo completo ad ogni evento con una voce di
+pricing_history per ricalcolo (il comportamento precedente, storico
+illimitato).
+
+    python bench/bench_pricing.py --events 1000000 --trips 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ares.pricing import PricingEngine, demand_multiplier, urgency_multiplier
+
+
+def synthetic_trips(n: int, rng: random.Random) -> list:
+    trips = []
+    for i in range(1, n + 1):
+        seats = rng.choice([8, 12, 16, 20, 30])
+        trips.append({"id": i, "price_chf": rng.randint(900, 4500), "seats_total": seats, "seats_available": seats})
+    return trips
+
+
+def synthetic_events(trips: list, n: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    viewers = {t["id"]: 0 for t in trips}
+    seats = {t["id"]: t["seats_available"] for t in trips}
+    ids = [t["id"] for t in trips]
+    events = []
+    for _ in range(n):
+        trip_id = rng.choice(ids)
+        roll = rng.random()
+        if roll < 0.90:
+            # Viewer entra/esce (random walk, mai negativo)
+            viewers[trip_id] = max(0, viewers[trip_id] + (1 if rng.random() < 0.52 else -1))
+            events.append((trip_id, "viewers", viewers[trip_id]))
+        elif roll < 0.97:
+            if seats[trip_id] > 0:
+                seats[trip_id] -= 1
+            events.append((trip_id, "seats_available", seats[trip_id]))
+        elif roll < 0.995:
+            events.append((trip_id, "weather", rng.choice([0.97, 1.0, 1.03, 1.05])))
+        else:
+            events.append((trip_id, "flash_discount", rng.choice([0, 0, 10, 15, 25])))
+    return events
+
+
+def replay_engine(trips: list, events: list) -> dict:
+    engine = PricingEngine()
+    engine.load(trips)
+    published = 0
+    start = time.perf_counter()
+    for trip_id, name, value in events:
+        if engine.apply(trip_id, **{name: value}) is not None:
+            published += 1
+    elapsed = time.perf_counter() - start
+    stats = engine.stats()
+    return {
+        "seconds": round(elapsed, 3),
+        "events_per_s": round(len(events) / elapsed),
+        "recomputes": stats["recomputes"],
+        "price_changes": published,
+        "history_entries": sum(len(t.history) for t in engine.trips.values()),
+        "hourly_buckets": sum(len(t.buckets) for t in engine.trips.values()),
+        "prices": {t.trip_id: t.price for t in engine.trips.values()},
+    }
+
+
+def replay_full(trips: list, events: list) -> dict:
+    """Baseline: ogni evento ricalcola tutto e appende allo storico"""
+    state = {t["id"]: {"base_price": t["price_chf"], "viewers": 0, "seats_available": t["seats_available"],
+                       "seats_total": t["seats_total"], "weather": 1.0, "flash_discount": 0} for t in trips}
+    prices = {}
+    history = {t["id"]: [] for t in trips}
+    start = time.perf_counter()
+    for trip_id, name, value in events:
+        s = state[trip_id]
+        s[name] = value
+        demand = demand_multiplier(s["viewers"])
+        urgency = urgency_multiplier(s["seats_available"], s["seats_total"])
+        price = int(s["base_price"] * demand * s["weather"] * urgency * (1 - s["flash_discount"] / 100))
+        prices[trip_id] = price
+        history[trip_id].append({"price": price, "timestamp": time.time(), "demand": demand,
+                                 "weather": s["weather"], "urgency": urgency, "viewers": s["viewers"]})
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 3), "events_per_s": round(len(events) / elapsed),
+            "recomputes": len(events), "history_entries": sum(map(len, history.values())), "prices": prices}
+
+
+def main(args):
+    rng = random.Random(5)
+    trips = synthetic_trips(args.trips, rng)
+    start = time.perf_counter()
+    events = synthetic_events(trips, args.events)
+    generation_s = time.perf_counter() - start
+
+    engine = replay_engine(trips, events)
+    full = replay_full(trips, events)
+    # Stesso stato finale: il ricalcolo incrementale non perde eventi
+    for trip_id, price in full["prices"].items():
+        assert engine["prices"][trip_id] == price, (trip_id, engine["prices"][trip_id], price)
+    engine.pop("prices")
+    full.pop("prices")
+    print(json.dumps({
+        "events": args.events,
+        "trips": args.trips,
+        "generation_s": round(generation_s, 3),
+        "engine": engine,
+        "full_recompute": full,
+        "recompute_ratio": round(engine["recomputes"] / args.events, 4),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay eventi prezzi dinamici")
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--trips", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark raccomandazioni su utenti sintetici
+
+Genera un catalogo di viaggi (interessi presi da data.json) e N utenti,
+ciascuno con un interesse dominante e qualche visita/wishlist/prenotazione
+per lo più coerente con quello. Misura fit completo (top-k per tutti),
+lookup per chiave, aggiornamento incrementale per evento, notifiche con
+scadenza, e verifica i risultati contro un calcolo diretto:
+
+    python bench/bench_recommend.py --users 1000000 --trips 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+from ares.recommend import ACTION_WEIGHTS, NotificationBook, Recommender
+
+ACTIONS = list(ACTION_WEIGHTS)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def synthetic_trips(n: int, seed: int) -> list:
+    with open(os.path.join(ROOT, "data.json"), encoding="utf-8") as f:
+        vocab = sorted({i for t in json.load(f).get("trips", []) for i in t.get("interests", [])})
+    rng = random.Random(seed)
+    return [{
+        "id": i + 1,
+        "title": f"Viaggio {i + 1}",
+        "price_chf": rng.randint(700, 6000),
+        "dates": {"start": f"2026-{rng.randint(1, 12):02d}-10"},
+        "interests": rng.sample(vocab, rng.randint(2, 5)),
+    } for i in range(n)]
+
+
+def synthetic_events(trips: list, users: int, per_user: float, seed: int):
+    """Interazioni vettoriali: 80% su viaggi con l'interesse dominante dell'utente"""
+    rng = np.random.default_rng(seed)
+    by_interest = {}
+    for row, trip in enumerate(trips):
+        for interest in trip["interests"]:
+            by_interest.setdefault(interest, []).append(row)
+    interests = sorted(by_interest)
+    counts = rng.poisson(per_user, users) + 1
+    rows = np.repeat(np.arange(users, dtype=np.int32), counts)
+    taste = rng.integers(0, len(interests), users)[rows]
+    picks = rng.integers(0, len(trips), len(rows)).astype(np.int32)
+    focused = rng.random(len(rows)) < 0.8
+    for n, interest in enumerate(interests):
+        pool = np.array(by_interest[interest], dtype=np.int32)
+        hit = focused & (taste == n)
+        picks[hit] = pool[rng.integers(0, len(pool), int(hit.sum()))]
+    trip_ids = np.array([t["id"] for t in trips], dtype=np.int32)[picks]
+    weights = np.array([ACTION_WEIGHTS[a] for a in ACTIONS], dtype=np.float32)[
+        rng.choice(len(ACTIONS), len(rows), p=[0.85, 0.12, 0.03])]
+    return rows, trip_ids, weights
+
+
+def brute_force(engine: Recommender, rows, trip_ids, weights, user: int) -> list:
+    # Calcolo diretto per un utente: vettore, coseno, esclusione dei visti, ordinamento
+    mask = rows == user
+    index = {t["id"]: n for n, t in enumerate(engine.trips)}
+    vector = np.zeros(engine._features.shape[1], dtype=np.float64)
+    seen = set()
+    for trip_id, weight in zip(trip_ids[mask].tolist(), weights[mask].tolist()):
+        vector += weight * engine._features[index[trip_id]]
+        seen.add(trip_id)
+    scores = engine._features @ vector / np.linalg.norm(vector)
+    ranked = sorted(((s, t["id"]) for s, t in zip(scores.tolist(), engine.trips) if t["id"] not in seen),
+                    key=lambda x: -x[0])
+    return ranked[:engine.k]
+
+
+def timed(fn, args_list) -> dict:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {"avg_us": round(statistics.fmean(samples), 2),
+            "p99_us": round(samples[int(len(samples) * 0.99) - 1], 2), "n": len(samples)}
+
+
+def main(args):
+    trips = synthetic_trips(args.trips, args.seed)
+    rows, trip_ids, weights = synthetic_events(trips, args.users, args.events, args.seed)
+    user_ids = [f"user{i}" for i in range(args.users)]
+    engine = Recommender(k=args.k, chunk=args.chunk)
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    engine.fit_arrays(trips, user_ids, rows, trip_ids, weights)
+    fit_s = time.perf_counter() - start
+    rss_after = rss_mb()
+
+    rng = random.Random(args.seed)
+    sample = [rng.randrange(args.users) for _ in range(args.queries)]
+    mismatches = 0
+    for user in sample[:args.verify]:
+        expected = [t for _, t in brute_force(engine, rows, trip_ids, weights, user)]
+        if [t for t, _ in engine.top(user_ids[user])] != expected:
+            mismatches += 1
+
+    events = [(user_ids[u], rng.choice(trips)["id"], "view_trip") for u in sample]
+    book = NotificationBook(ttl=3600)
+    now = time.time()
+    results = {
+        "users": args.users,
+        "trips": args.trips,
+        "interactions": int(len(rows)),
+        "k": args.k,
+        "fit_s": round(fit_s, 2),
+        "fit_users_per_s": round(args.users / fit_s),
+        "rss_mb": {"before_fit": round(rss_before, 1), "after_fit": round(rss_after, 1)},
+        "engine": engine.stats(),
+        "verified_users": min(args.verify, len(sample)),
+        "mismatches": mismatches,
+        "lookup_top": timed(lambda u: engine.top(u), [(user_ids[u],) for u in sample]),
+        "lookup_recommendations": timed(lambda u: engine.recommendations(u), [(user_ids[u],) for u in sample]),
+        "observe": timed(engine.observe, events),
+        "notify": timed(lambda u: book.notify(u, engine.recommendations(u), now=now),
+                        [(user_ids[u],) for u in sample]),
+    }
+    # Scadenza di tutte le notifiche create
+    start = time.perf_counter()
+    expired = book.prune(now + 3601)
+    results["prune"] = {"expired": expired, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    # Incrementale == ricalcolo completo sugli stessi eventi (su un sottoinsieme di utenti)
+    subset = min(args.users, 20000)
+    keep = rows < subset
+    small = Recommender(k=args.k)
+    small.fit_arrays(trips, user_ids[:subset], rows[keep], trip_ids[keep], weights[keep])
+    extra = [(user_ids[rng.randrange(subset)], rng.choice(trips)["id"], rng.choice(ACTIONS)) for _ in range(2000)]
+    for event in extra:
+        small.observe(*event)
+    full = Recommender(k=args.k)
+    full.fit(trips, [(user_ids[r], t, a) for r, t, w in zip(rows[keep].tolist(), trip_ids[keep].tolist(),
+                                                                weights[keep].tolist())
+                     for a in [next(a for a in ACTIONS if ACTION_WEIGHTS[a] == w)]] + extra)
+    results["incremental_mismatches"] = sum(
+        [t for t, _ in small.top(u)] != [t for t, _ in full.top(u)] for u in user_ids[:subset])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark raccomandazioni")
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--trips", type=int, default=200)
+    parser.add_argument("--events", type=float, default=6.0, help="interazioni medie per utente")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--chunk", type=int, default=65536)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--verify", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
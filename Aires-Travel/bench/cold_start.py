@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Budget di cold start della Vercel Function (api/index.py)
+
+Ogni run è un interprete nuovo con database vuoto in una directory
+temporanea, come un'istanza serverless appena creata. Misura:
+
+    import_ms     import di api.index
+    first_ms      prima risposta per route, in ordine (/, /config,
+                  /destinations, poi una route che richiede lo store e
+                  quindi l'app FastAPI completa)
+    fastapi_imported  se FastAPI era già importato prima di quella route
+
+in modalità snapshot (default) e con ARES_COLD_START=0 per confronto.
+Esce con codice 1 se la mediana della modalità snapshot supera i budget:
+
+    python -m ares.coldstart build
+    python bench/cold_start.py --runs 7 --import-budget-ms 150 --first-response-budget-ms 25
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CATALOG_PATHS = ["/", "/config", "/destinations"]
+STORE_PATH = "/search?limit=5"
+
+
+async def asgi_get(app, target: str) -> int:
+    """GET diretto sull'app ASGI (nessun client HTTP da importare)"""
+    path, _, query = target.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+             "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1),
+             "server": ("bench", 80)}
+    status = 0
+    done = asyncio.Event()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    await done.wait()
+    return status
+
+
+def child():
+    # Eseguito nel processo misurato: stdout è solo il risultato JSON
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from api.index import app
+    result = {"import_ms": (time.perf_counter() - start) * 1000, "first_ms": {}, "status": {}}
+
+    async def requests():
+        for target in CATALOG_PATHS + [STORE_PATH]:
+            if target == STORE_PATH:
+                result["fastapi_imported"] = "fastapi" in sys.modules
+            t = time.perf_counter()
+            result["status"][target] = await asgi_get(app, target)
+            result["first_ms"][target] = (time.perf_counter() - t) * 1000
+
+    asyncio.run(requests())
+    print(json.dumps(result))
+
+
+def spawn(cold_start: bool) -> dict:
+    with tempfile.TemporaryDirectory(prefix="ares-coldstart-") as tmp:
+        env = dict(os.environ, ARES_DB=os.path.join(tmp, "ares.db"), ANALYTICS_DB=os.path.join(tmp, "analytics.db"),
+                   ARES_COLD_START="1" if cold_start else "0", LOG_LEVEL="WARNING")
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], env=env, cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+
+def summarize(runs: list) -> dict:
+    def median(values):
+        return round(statistics.median(values), 1)
+
+    return {
+        "import_ms": median([r["import_ms"] for r in runs]),
+        "first_ms": {path: median([r["first_ms"][path] for r in runs]) for path in runs[0]["first_ms"]},
+        "process_ms": median([r["process_ms"] for r in runs]),
+        "status": runs[0]["status"],
+        "fastapi_imported": runs[0]["fastapi_imported"],
+    }
+
+
+def main(args):
+    snapshot = os.getenv("ARES_SNAPSHOT", os.path.join(ROOT, "api", "catalog.snapshot"))
+    if not os.path.exists(snapshot):
+        print(f"Snapshot mancante ({snapshot}): python -m ares.coldstart build", file=sys.stderr)
+        sys.exit(2)
+    modes = {"snapshot": True, "full": False}
+    results = {"runs": args.runs}
+    for name, cold_start in modes.items():
+        results[name] = summarize([spawn(cold_start) for _ in range(args.runs)])
+
+    fast = results["snapshot"]
+    first_catalog = max(fast["first_ms"][path] for path in CATALOG_PATHS)
+    results["budget"] = {
+        "import_ms": args.import_budget_ms,
+        "first_response_ms": args.first_response_budget_ms,
+        "ok": fast["import_ms"] <= args.import_budget_ms and first_catalog <= args.first_response_budget_ms
+              and not fast["fastapi_imported"] and all(status == 200 for status in fast["status"].values()),
+    }
+    results["speedup_first_catalog_response"] = round(
+        (results["full"]["import_ms"] + results["full"]["first_ms"]["/"]) / (fast["import_ms"] + fast["first_ms"]["/"]), 1)
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if results["budget"]["ok"] else 1)
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child()
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Budget cold start api/index.py")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--import-budget-ms", type=float, default=150)
+    parser.add_argument("--first-response-budget-ms", type=float, default=25)
+    main(parser.parse_args())
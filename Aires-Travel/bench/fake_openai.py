@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Server locale che imita /v1/chat/completions di OpenAI
+
+Serve per provare main.py senza chiave né credito:
+    python bench/fake_openai.py --port 8081 --latency 0.5 --token-delay 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=fake USE_OPENAI=true python main.py
+
+Errori simulati: --error-rate 0.1 risponde 429 a una chiamata su dieci
+(code rate_limit_exceeded, oppure insufficient_quota con --error-code).
+La latenza ha un jitter uniforme opzionale (--jitter) e il seed è fisso,
+così due run con gli stessi parametri iniettano gli stessi errori.
+
+GET /stats ritorna il numero di chiamate ricevute e di 429 iniettati
+(utile per verificare cache e coalescing); POST /config cambia latenza,
+jitter, token delay ed errori a caldo (usato da bench/loadtest.py).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ERROR_CODES = ("rate_limit_exceeded", "insufficient_quota")
+
+app = FastAPI(title="Fake OpenAI")
+app.state.latency = 0.0
+app.state.jitter = 0.0
+app.state.token_delay = 0.0
+app.state.error_rate = 0.0
+app.state.error_code = "rate_limit_exceeded"
+app.state.calls = 0
+app.state.errors = 0
+app.state.rng = random.Random(7)
+
+
+def completion_text(messages: list) -> str:
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    return f"✈️ [fake] Risposta a: {user[:80]}"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.calls += 1
+    delay = app.state.latency + app.state.rng.uniform(0, app.state.jitter)
+    if delay:
+        await asyncio.sleep(delay)
+    if app.state.error_rate and app.state.rng.random() < app.state.error_rate:
+        return rate_limited()
+
+    text = completion_text(body.get("messages", []))
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, text), media_type="text/event-stream")
+
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-3.5-turbo"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(text) // 4,
+            "total_tokens": prompt_tokens + len(text) // 4,
+        },
+    }
+
+
+def rate_limited() -> JSONResponse:
+    """429 nel formato OpenAI (il client lo classifica come rate_limit o quota)"""
+    app.state.errors += 1
+    code = app.state.error_code
+    return JSONResponse({"error": {
+        "message": "Rate limit reached (fake)" if code == "rate_limit_exceeded" else "You exceeded your current quota (fake)",
+        "type": "requests" if code == "rate_limit_exceeded" else "insufficient_quota",
+        "param": None,
+        "code": code,
+    }}, status_code=429, headers={"retry-after": "1"})
+
+
+async def stream_chunks(body: dict, text: str):
+    """Formato chat.completion.chunk, una parola per chunk"""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    base = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-3.5-turbo"),
+    }
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        delta = {"content": word if i == 0 else " " + word}
+        if i == 0:
+            delta["role"] = "assistant"
+        yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}) + "\n\n"
+        if app.state.token_delay:
+            await asyncio.sleep(app.state.token_delay)
+    yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/stats")
+async def stats():
+    return {"calls": app.state.calls, "errors_429": app.state.errors}
+
+
+@app.post("/config")
+async def configure(request: Request):
+    """Aggiorna i parametri a caldo e azzera i contatori"""
+    config = await request.json()
+    for key in ("latency", "jitter", "token_delay", "error_rate"):
+        if key in config:
+            setattr(app.state, key, float(config[key]))
+    if config.get("error_code") in ERROR_CODES:
+        app.state.error_code = config["error_code"]
+    app.state.calls = app.state.errors = 0
+    app.state.rng = random.Random(config.get("seed", 7))
+    return {key: getattr(app.state, key) for key in ("latency", "jitter", "token_delay", "error_rate", "error_code")}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="secondi di attesa per risposta")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latenza extra uniforme in [0, jitter] secondi")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="secondi tra un chunk e l'altro (stream)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="frazione di chiamate che ricevono 429")
+    parser.add_argument("--error-code", choices=ERROR_CODES, default="rate_limit_exceeded")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency
+    app.state.jitter = args.jitter
+    app.state.token_delay = args.token_delay
+    app.state.error_rate = args.error_rate
+    app.state.error_code = args.error_code
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Server locale compatibile Redis (solo PING, PUBLISH, SUBSCRIBE, UNSUBSCRIBE)
+
+Sostituto per provare ARES_PUBSUB=redis://... senza un Redis vero:
+    python bench/fake_redis.py --port 6390
+    ARES_PUBSUB=redis://127.0.0.1:6390 uvicorn main:app --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ares.pubsub import read_reply
+
+subscribers = {}  # channel -> set(writer)
+
+
+def bulk_array(*items) -> bytes:
+    out = [b"*%d\r\n" % len(items)]
+    for item in items:
+        if isinstance(item, int):
+            out.append(b":%d\r\n" % item)
+        else:
+            out.append(b"$%d\r\n%s\r\n" % (len(item), item))
+    return b"".join(out)
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    subscribed = set()
+    try:
+        while True:
+            command = await read_reply(reader)
+            if not isinstance(command, list) or not command:
+                continue
+            name = command[0].upper()
+            if name == b"PING":
+                writer.write(b"+PONG\r\n")
+            elif name == b"AUTH":
+                writer.write(b"+OK\r\n")
+            elif name == b"PUBLISH":
+                channel, data = command[1], command[2]
+                targets = subscribers.get(channel, set())
+                frame = bulk_array(b"message", channel, data)
+                for target in list(targets):
+                    target.write(frame)
+                writer.write(b":%d\r\n" % len(targets))
+            elif name == b"SUBSCRIBE":
+                for channel in command[1:]:
+                    subscribers.setdefault(channel, set()).add(writer)
+                    subscribed.add(channel)
+                    writer.write(bulk_array(b"subscribe", channel, len(subscribed)))
+            elif name == b"UNSUBSCRIBE":
+                for channel in command[1:] or list(subscribed):
+                    subscribers.get(channel, set()).discard(writer)
+                    subscribed.discard(channel)
+                    writer.write(bulk_array(b"unsubscribe", channel, len(subscribed)))
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        for channel in subscribed:
+            subscribers.get(channel, set()).discard(writer)
+        writer.close()
+
+
+async def main(host: str, port: int):
+    server = await asyncio.start_server(handle, host, port)
+    print(f"🧪 Fake Redis su {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Redis pub/sub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Load test riproducibile delle due app, offline, con report JSON
+
+Avvia bench/fake_openai.py e l'app scelta (main.py o api/index.py) come
+processi uvicorn su porte locali (nessuna rete esterna, database e
+analytics in una cartella temporanea) e misura:
+
+    http  N richieste per endpoint a concorrenza fissa: /, /destinations,
+          /health, /api/chat (main) e POST /bookings (vercel), con
+          RPS, p50/p95/p99/max e conteggio degli status
+    ws    migliaia di client /ws con il protocollo di public/index.html:
+          benvenuto, ping/pong, chat {"type": "user", "stream": true};
+          latenza di connessione, RTT del ping, primo delta e risposta
+          completa, RSS del server per connessione aperta
+
+Il finto LLM ha latenza, jitter, streaming e 429 iniettati configurabili
+(--llm-latency, --llm-error-rate, ...). L'output è un JSON (stdout o
+--output) con commit git e parametri; --compare confronta con un report
+precedente e riporta la variazione % di ogni valore:
+
+    python bench/loadtest.py --app main --requests 2000 --ws-clients 2000 --output base.json
+    python bench/loadtest.py --app main --requests 2000 --ws-clients 2000 --compare base.json
+
+Client e server girano sulla stessa macchina: i numeri assoluti
+dipendono dall'host, il confronto ha senso tra run sullo stesso host.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from ares.storage import Store, migrate_json
+
+APPS = {"main": "main:app", "vercel": "api.index:app"}
+ENDPOINTS = {
+    "main": ["/", "/destinations", "/health", "/api/chat"],
+    "vercel": ["/", "/destinations", "/bookings"],
+}
+CHAT_PHRASES = [
+    "Vorrei andare a Tokyo", "Quanto costa Santorini?", "Un viaggio alle Maldive in luglio",
+    "Machu Picchu quando conviene?", "Islanda e aurora boreale", "Consigliami un viaggio economico",
+    "I want a beach holiday", "Un voyage au Japon ?", "¿Cuánto cuesta Islandia?",
+]
+
+
+# === UTILITÀ ===
+def percentiles(samples: List[float]) -> dict:
+    """p50/p95/p99/max/media in millisecondi (nearest-rank)"""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+    return {
+        "n": len(ordered),
+        "p50_ms": round(rank(0.50) * 1000, 2),
+        "p95_ms": round(rank(0.95) * 1000, 2),
+        "p99_ms": round(rank(0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+def rss_kb(pid: Optional[int]) -> Optional[int]:
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def raise_fd_limit():
+    # Migliaia di socket: client e server (processo figlio) ereditano il limite alzato
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+
+def prepare_store(path: str, seats: int) -> List[int]:
+    """Database dell'app vercel già migrato, con posti abbondanti (le prenotazioni non si esauriscono)"""
+    store = Store(path)
+    migrate_json(os.path.join(ROOT, "data.json"), store)
+    with store.transaction() as conn:
+        trips = store.trips()
+        for trip in trips:
+            trip["seats_total"] = trip["seats_available"] = seats
+            store.put_trip(trip, conn)
+    store.close()
+    return [trip["id"] for trip in trips]
+
+
+class Server:
+    """Processo uvicorn in background, atteso finché risponde"""
+
+    def __init__(self, target: str, port: int, env: dict, cwd: str = ROOT):
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=cwd, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    async def wait_ready(self, path: str = "/", timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(base_url=self.url) as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.url} terminato: {self.process.stderr.read().decode()[-2000:]}")
+                try:
+                    await client.get(path, timeout=1.0)
+                    return
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.1)
+        raise RuntimeError(f"{self.url} non pronto dopo {timeout}s")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# === HTTP ===
+def request_for(path: str, i: int, rng: random.Random, args) -> dict:
+    if path == "/api/chat":
+        text = rng.choice(CHAT_PHRASES)
+        # Una parte delle domande si ripete (cache AI), il resto è unico
+        if rng.random() >= args.chat_repeat:
+            text = f"{text} #{i}"
+        return {"method": "POST", "url": path, "json": {"text": text}}
+    if path == "/bookings":
+        return {"method": "POST", "url": path, "json": {
+            "tripId": rng.choice(args.trip_ids), "guests": 1,
+            "customerName": f"Load {i}", "customerEmail": f"load{i}@bench.local",
+        }}
+    return {"method": "GET", "url": path}
+
+
+async def run_http(base_url: str, endpoints: List[str], args) -> Dict[str, dict]:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        for path in endpoints:
+            rng = random.Random(args.seed)
+            await client.request(**request_for(path, -1, rng, args))  # warm-up (cache, connessioni)
+            latencies: List[float] = []
+            statuses: Dict[str, int] = {}
+            body_errors = 0
+            issued = 0
+
+            async def worker():
+                nonlocal issued, body_errors
+                while issued < args.requests:
+                    i = issued
+                    issued += 1
+                    request = request_for(path, i, rng, args)
+                    start = time.perf_counter()
+                    try:
+                        response = await client.request(**request)
+                        await response.aread()
+                        status = str(response.status_code)
+                        # /api/chat risponde 200 anche con quota esaurita: {"error": true, "code": 429}
+                        if path == "/api/chat" and response.status_code == 200 and response.json().get("error"):
+                            body_errors += 1
+                    except httpx.HTTPError as e:
+                        status = type(e).__name__
+                    latencies.append(time.perf_counter() - start)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+            results[path] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / elapsed, 1),
+                "latency": percentiles(latencies),
+                "status": statuses,
+            }
+            if path == "/api/chat":
+                results[path]["quota_responses"] = body_errors
+    return results
+
+
+# === WEBSOCKET ===
+async def run_ws(base_url: str, server_pid: Optional[int], args) -> dict:
+    url = base_url.replace("http://", "ws://") + "/ws"
+    rng = random.Random(args.seed)
+    connect_times: List[float] = []
+    ping_rtts: List[float] = []
+    first_reply: List[float] = []
+    full_reply: List[float] = []
+    errors: Dict[str, int] = {}
+    opened = 0
+    settled = 0
+    all_connected = asyncio.Event()
+    go = asyncio.Event()
+    dialing = asyncio.Semaphore(args.ws_connect_concurrency)
+
+    def error(kind: str):
+        errors[kind] = errors.get(kind, 0) + 1
+
+    def settle():
+        nonlocal settled
+        settled += 1
+        if settled == args.ws_clients:
+            all_connected.set()
+
+    async def receive(ws) -> dict:
+        """Prossimo messaggio applicativo; i ping del server ricevono pong come fa index.html"""
+        while True:
+            message = json.loads(await asyncio.wait_for(ws.recv(), timeout=args.timeout))
+            if message.get("type") == "ping":
+                await ws.send(json.dumps({"type": "pong", "t": message.get("server_time")}))
+                continue
+            return message
+
+    async def client(n: int):
+        nonlocal opened
+        ws = None
+        try:
+            async with dialing:
+                start = time.perf_counter()
+                ws = await websockets.connect(url, ping_interval=None, max_size=None, open_timeout=args.timeout)
+                welcome = await receive(ws)
+                connect_times.append(time.perf_counter() - start)
+                if welcome.get("type") != "system":
+                    error("unexpected_welcome")
+            opened += 1
+        except Exception as e:
+            error(f"connect_{type(e).__name__}")
+        settle()
+        if ws is None:
+            return
+        try:
+            await go.wait()
+            for round_ in range(args.ws_rounds):
+                # Distribuisce i round nel tempo invece di partire tutti insieme
+                await asyncio.sleep(rng.uniform(0, args.ws_think))
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "ping", "t": int(time.time() * 1000)}))
+                while (await receive(ws)).get("type") != "pong":
+                    pass
+                ping_rtts.append(time.perf_counter() - start)
+
+                text = rng.choice(CHAT_PHRASES)
+                if rng.random() >= args.chat_repeat:
+                    text = f"{text} #{n}.{round_}"
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "user", "text": text, "stream": args.ws_stream}))
+                first = None
+                while True:
+                    message = await receive(ws)
+                    kind = message.get("type")
+                    if first is None and kind in ("assistant_delta", "assistant"):
+                        first = time.perf_counter() - start
+                    if kind in ("assistant_done", "assistant"):
+                        break
+                    if message.get("error"):
+                        error(f"reply_{message.get('code', 'error')}")
+                        break
+                if first is not None:
+                    first_reply.append(first)
+                full_reply.append(time.perf_counter() - start)
+        except Exception as e:
+            error(f"session_{type(e).__name__}")
+        finally:
+            await ws.close()
+
+    rss_before = rss_kb(server_pid)
+    tasks = [asyncio.create_task(client(n)) for n in range(args.ws_clients)]
+    start = time.perf_counter()
+    await all_connected.wait()
+    connect_elapsed = time.perf_counter() - start
+    # Lascia assestare il server (writer task, buffer) prima di leggere l'RSS
+    await asyncio.sleep(0.5)
+    rss_connected = rss_kb(server_pid)
+    go.set()
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    session_elapsed = time.perf_counter() - start
+    exchanged = len(ping_rtts) + len(full_reply)
+
+    report = {
+        "clients": args.ws_clients,
+        "connected": opened,
+        "connect_rate_per_s": round(opened / connect_elapsed, 1) if connect_elapsed else None,
+        "connect": percentiles(connect_times),
+        "ping_rtt": percentiles(ping_rtts),
+        "chat_first_reply": percentiles(first_reply),
+        "chat_full_reply": percentiles(full_reply),
+        "exchanges_per_s": round(exchanged / session_elapsed, 1) if session_elapsed else None,
+        "errors": errors,
+    }
+    if rss_before is not None and rss_connected is not None:
+        report["server_rss_kb"] = {"before": rss_before, "connected": rss_connected}
+        report["server_kb_per_connection"] = round((rss_connected - rss_before) / opened, 2) if opened else None
+    return report
+
+
+# === CONFRONTO ===
+def flatten(report: dict, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Variazione % per ogni valore numerico dei risultati presente in entrambi i report"""
+    now = flatten({k: current.get(k) for k in ("http", "ws") if current.get(k)})
+    before = flatten({k: baseline.get(k) for k in ("http", "ws") if baseline.get(k)})
+    diff = {}
+    for path in sorted(now.keys() & before.keys()):
+        old, new = before[path], now[path]
+        diff[path] = {"before": old, "after": new,
+                      "change_pct": round((new - old) / old * 100, 1) if old else None}
+    return {"baseline": baseline.get("meta", {}).get("git"), "metrics": diff}
+
+
+# === ORCHESTRAZIONE ===
+async def run(args) -> dict:
+    fd_limit = raise_fd_limit()
+    tmp = tempfile.mkdtemp(prefix="ares-load-")
+    scenarios = set(args.scenarios.split(","))
+    servers: List[Server] = []
+    report = {
+        "meta": {
+            "git": git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "app": args.app,
+            "fd_limit": fd_limit,
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "trip_ids")},
+        },
+    }
+    try:
+        env = {
+            "ANALYTICS_DB": os.path.join(tmp, "analytics.db"),
+            "ARES_DB": os.path.join(tmp, "ares.db"),
+            "LOG_LEVEL": "WARNING",
+            "CESIUM_TOKEN": "",
+        }
+        llm = None
+        if args.url:
+            base_url, pid = args.url.rstrip("/"), args.pid
+        else:
+            if not args.mock:
+                llm = Server("bench.fake_openai:app", free_port(), {})
+                servers.append(llm)
+                await llm.wait_ready("/stats")
+                env.update(OPENAI_BASE_URL=f"{llm.url}/v1", OPENAI_API_KEY="fake", USE_OPENAI="true")
+            else:
+                env.update(OPENAI_API_KEY="", USE_OPENAI="false")
+            if args.app == "vercel":
+                args.trip_ids = prepare_store(env["ARES_DB"], args.seats)
+            app = Server(APPS[args.app], free_port(), env)
+            servers.append(app)
+            await app.wait_ready()
+            base_url, pid = app.url, app.pid
+
+        if llm is not None:
+            async with httpx.AsyncClient(base_url=llm.url) as client:
+                report["llm"] = {"config": (await client.post("/config", json={
+                    "latency": args.llm_latency, "jitter": args.llm_jitter, "token_delay": args.llm_token_delay,
+                    "error_rate": args.llm_error_rate, "error_code": args.llm_error_code, "seed": args.seed,
+                })).json()}
+
+        report["server"] = {"url": base_url, "rss_start_kb": rss_kb(pid)}
+        if "http" in scenarios:
+            endpoints = args.endpoints.split(",") if args.endpoints else ENDPOINTS[args.app]
+            report["http"] = await run_http(base_url, endpoints, args)
+        if "ws" in scenarios and args.app == "main":
+            report["ws"] = await run_ws(base_url, pid, args)
+        report["server"]["rss_end_kb"] = rss_kb(pid)
+
+        if llm is not None:
+            async with httpx.AsyncClient(base_url=llm.url) as client:
+                report["llm"]["stats"] = (await client.get("/stats")).json()
+    finally:
+        for server in reversed(servers):
+            server.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test HTTP/WebSocket con LLM finto, report JSON")
+    parser.add_argument("--app", choices=sorted(APPS), default="main")
+    parser.add_argument("--scenarios", default="http,ws", help="http, ws o entrambi (ws solo per main)")
+    parser.add_argument("--url", help="server già avviato (niente processi figli)")
+    parser.add_argument("--pid", type=int, help="pid del server in --url, per misurare l'RSS")
+    parser.add_argument("--endpoints", help="endpoint HTTP separati da virgola (default per app)")
+    parser.add_argument("--requests", type=int, default=2000, help="richieste per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--chat-repeat", type=float, default=0.5, help="frazione di domande ripetute (cache AI)")
+    parser.add_argument("--seats", type=int, default=10 ** 6, help="posti per viaggio (app vercel)")
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-rounds", type=int, default=2, help="ping + chat per client")
+    parser.add_argument("--ws-think", type=float, default=1.0, help="pausa casuale massima tra i round (s)")
+    parser.add_argument("--ws-connect-concurrency", type=int, default=200)
+    parser.add_argument("--ws-stream", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--mock", action="store_true", help="niente LLM finto: risposte demo di main.py")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="frazione di 429 iniettati")
+    parser.add_argument("--llm-error-code", choices=("rate_limit_exceeded", "insufficient_quota"),
+                        default="rate_limit_exceeded")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="scrive il report JSON su file")
+    parser.add_argument("--compare", help="report JSON precedente da confrontare")
+    args = parser.parse_args()
+    # Con --url il database non è nostro: prenotazioni sui viaggi di data.json
+    with open(os.path.join(ROOT, "data.json"), "r", encoding="utf-8") as f:
+        args.trip_ids = [t["id"] for t in json.load(f).get("trips", [])] or [1]
+
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["compare"] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
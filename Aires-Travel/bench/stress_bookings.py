@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Stress test prenotazioni concorrenti su ares.storage
+
+Lancia migliaia di prenotazioni in parallelo da un thread pool contro
+un database temporaneo e verifica: nessun update perso, ID unici e
+contigui, posti mai sotto zero, overbooking rifiutato.
+
+    python bench/stress_bookings.py --bookings 5000 --workers 64
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ares.storage import BookingError, Store, migrate_document
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--seats", type=int, default=None,
+                        help="posti per viaggio (default: 80%% delle prenotazioni / 2 viaggi)")
+    args = parser.parse_args()
+
+    seats = args.seats or int(args.bookings * 0.8) // 2
+    tmp = tempfile.mkdtemp(prefix="ares-stress-")
+    store = Store(os.path.join(tmp, "stress.db"))
+    migrate_document(store, {
+        "next_id": 1,
+        "trips": [
+            {"id": 1, "title": "Stress A", "seats_total": seats, "seats_available": seats},
+            {"id": 2, "title": "Stress B", "seats_total": seats, "seats_available": seats},
+        ],
+        "bookings": [],
+    }, "stress")
+
+    def book(i):
+        try:
+            return store.reserve_booking({
+                "tripId": 1 + i % 2,
+                "customerEmail": f"user{i}@stress.test",
+                "guests": 1,
+                "bookingDate": f"{i:08d}",
+            })
+        except BookingError as e:
+            return e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(book, range(args.bookings)))
+    elapsed = time.perf_counter() - start
+
+    confirmed = [r for r in results if isinstance(r, dict)]
+    rejected = [r for r in results if isinstance(r, BookingError)]
+    ids = [b["id"] for b in confirmed]
+    stored = store.count("bookings")
+    remaining = [store.get_trip(t)["seats_available"] for t in (1, 2)]
+
+    print(f"⏱️  {args.bookings} prenotazioni in {elapsed:.2f}s ({args.bookings / elapsed:.0f}/s)")
+    print(f"✅ confermate: {len(confirmed)} | ❌ rifiutate: {len(rejected)} | 💾 in DB: {stored}")
+    print(f"💺 posti rimasti: {remaining}")
+
+    expected = min(args.bookings, 2 * seats)
+    assert len(confirmed) == expected, f"attese {expected} conferme, ottenute {len(confirmed)}"
+    assert stored == len(confirmed), "update persi: righe in DB != conferme"
+    assert len(set(ids)) == len(ids), "ID duplicati"
+    assert sorted(ids) == [f"BK{n:04d}" for n in range(1, len(ids) + 1)], "ID non contigui"
+    assert all(r.status == 409 for r in rejected), "rifiuti inattesi"
+    assert remaining == [max(0, seats - expected // 2)] * 2, "posti incoerenti"
+    assert store.get_meta("next_id") == len(confirmed) + 1
+    print("🎉 Nessun update perso")
+
+
+if __name__ == "__main__":
+    main()
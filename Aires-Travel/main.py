@@ -3,9 +3,8 @@
 ARES TRAVEL - Sistema Stabile v1 con OpenAI
 Globe.gl v2.27.5 + Three.js v0.150.1 + Chat AI
 """
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import json
@@ -13,10 +12,36 @@ import os
 import asyncio
 import time
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, List
 from contextlib import asynccontextmanager
+from functools import partial
 import openai
 
+from ares.ai_cache import ResponseCache
+from ares.assets import AssetFiles
+from ares.catalog import CatalogCache, cached_response
+from ares.conversation import ConversationStore
+from ares.counters import METRICS, RESOLUTIONS, AnalyticsCounters
+from ares.dispatch import ConnectionDispatcher, RequestRejected, new_request_id
+from ares.geo import GeoCache
+from ares.health import HealthProber
+from ares.intents import matcher
+from ares.llm import LimiterSaturated, LLMClient, QuotaExceeded, classify_error
+from ares.log import get_logger
+from ares.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, MetricsMiddleware
+from ares.pages import PageCache
+from ares.pricing import PricingEngine
+from ares.prompts import PromptBuilder
+from ares.pubsub import create_pubsub
+from ares.recommend import NotificationBook, Recommender, legacy_events
+from ares.recommend import available as recommendations_available
+from ares.search import SearchCache, format_trip, grounding_context, trips_found
+from ares.ws import WS_MESSAGES, WebSocketManager
+
+log = get_logger("ares.main")
+# Eventi per messaggio (alto volume): soggetti a LOG_SAMPLE_RATE
+chat_log = get_logger("ares.chat", sampled=True)
+
 # === MODELLI ===
 class ChatMessage(BaseModel):
     text: str
@@ -70,60 +95,234 @@ DESTINATIONS = [
     }
 ]
 
+# Viaggi del catalogo (data.json, sola lettura): indicizzati con le destinazioni
+DATA_FILE = "data.json"
+
+def catalog_version():
+    """Versione del catalogo: cambia quando data.json viene modificato"""
+    try:
+        return os.stat(DATA_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def load_trips(path: str = DATA_FILE) -> list:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("trips", [])
+    except (OSError, ValueError) as e:
+        log.warning("catalog_unavailable", path=path, error=str(e))
+        return []
+
+geo_cache = GeoCache(lambda: (
+    [dict(d, kind="destination") for d in DESTINATIONS] +
+    [dict(t, kind="trip") for t in load_trips()]
+), version=catalog_version)
+
+# Ricerca a faccette sui viaggi (interessi, partenze, date, prezzo, posti)
+search_cache = SearchCache(load_trips, version=catalog_version)
+
+# Prezzi dinamici: ricalcolo solo sugli eventi (viewer iscritti, posti, meteo)
+PRICE_HISTORY_SIZE = int(os.getenv("PRICE_HISTORY_SIZE", "64"))
+pricing = PricingEngine(history_size=PRICE_HISTORY_SIZE)
+pricing_version = None
+
+def load_section(name: str, path: str = DATA_FILE) -> list:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(name, [])
+    except (OSError, ValueError):
+        return []
+
+# Raccomandazioni precalcolate (NumPy opzionale): top-k per utente con un lookup, aggiornati per evento
+recommender = Recommender(
+    k=int(os.getenv("RECOMMEND_K", "3")),
+    max_new_users=int(os.getenv("RECOMMEND_MAX_NEW_USERS", "10000")),
+) if recommendations_available else None
+notifications = NotificationBook(
+    ttl=float(os.getenv("NOTIFICATION_TTL", str(7 * 86400))),
+    max_users=int(os.getenv("NOTIFICATION_MAX_USERS", "10000")),
+)
+RECOMMEND_MIN_SCORE = float(os.getenv("RECOMMEND_MIN_SCORE", "0.3"))
+# Consigli e notifiche per user_id: l'id arriva dal client (come CONVERSATION_BY_USER),
+# abilitarlo solo dove è già autenticato a monte
+RECOMMEND_BY_USER = os.getenv("RECOMMEND_BY_USER", "false").lower() == "true"
+recommend_version = None
+recommend_task = None
+
+async def refresh_recommendations():
+    """Primo avvio: fit da visit_history e wishlists; catalogo cambiato: solo nuove feature dei viaggi
+
+    Il calcolo gira in un thread: il loop continua a servire gli altri socket.
+    """
+    global recommend_version
+    version = catalog_version()
+    if recommender is None or version == recommend_version:
+        return
+    if recommend_version is None:
+        await asyncio.to_thread(lambda: recommender.fit(
+            load_trips(), legacy_events(load_section("user_profiles"), load_section("wishlists"))))
+        notifications.load(load_section("smart_notifications"))
+    else:
+        await asyncio.to_thread(lambda: recommender.set_trips(load_trips()))
+    recommend_version = version
+
+def schedule_recommendations_refresh():
+    # Sui percorsi delle richieste: ricalcolo in background, intanto si servono i top-k correnti
+    global recommend_task
+    if recommender is None or catalog_version() == recommend_version:
+        return
+    if recommend_task is None or recommend_task.done():
+        recommend_task = asyncio.create_task(refresh_recommendations())
+
+def user_recommendations(user_id: str, notify: bool = False) -> dict:
+    """personalized_offers + smart_notifications attive dell'utente (notify: crea quelle nuove)"""
+    schedule_recommendations_refresh()
+    offers = recommender.recommendations(user_id) if recommender is not None else []
+    if notify:
+        notifications.notify(user_id, offers, min_score=RECOMMEND_MIN_SCORE)
+    return {
+        "user_id": user_id,
+        "personalized_offers": offers,
+        "smart_notifications": notifications.for_user(user_id),
+        "available": recommender is not None
+    }
+
+def recommendation_context(user_id: str) -> list:
+    # Consigli dell'utente come contesto chat (stabile tra i turni, prima dello storico)
+    if recommender is None:
+        return []
+    schedule_recommendations_refresh()
+    offers = [o for o in recommender.recommendations(user_id) if o["personalized"]]
+    if not offers:
+        return []
+    lines = [f"- {o['title']}: CHF {o['price_chf']}" + (f" (interessi: {', '.join(o['reasons'])})" if o["reasons"] else "")
+             for o in offers]
+    return [{"role": "system", "content": "Viaggi consigliati a questo utente in base alla sua attività:\n" + "\n".join(lines)}]
+
+def chat_history(session: str = None, user_id: str = None) -> list:
+    history = conversations.history(session) if session else []
+    return (recommendation_context(user_id) if user_id and RECOMMEND_BY_USER else []) + history
+
+# Contatori analytics in memoria, scritti a lotti su un database dedicato
+analytics = AnalyticsCounters(
+    os.getenv("ANALYTICS_DB", "analytics.db"),
+    flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5")),
+    max_pending=int(os.getenv("ANALYTICS_MAX_PENDING", "5000")),
+)
+
+def price_topic(trip_id: int) -> str:
+    return f"price:{trip_id}"
+
 # === WEBSOCKET MANAGER ===
-class WebSocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# Richieste AI concorrenti per connessione, e accettate in totale (in corso + in coda)
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "2"))
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", "8"))
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"🔗 WebSocket connesso. Totale: {len(self.active_connections)}")
+manager = WebSocketManager(
+    create_pubsub(os.getenv("ARES_PUBSUB", "memory")),
+    queue_size=int(os.getenv("WS_QUEUE_SIZE", "64")),
+    slow_policy=os.getenv("WS_SLOW_POLICY", "drop_oldest"),
+)
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            print(f"❌ WebSocket disconnesso. Totale: {len(self.active_connections)}")
+# Letti allo scrape di /metrics: nessun costo sul percorso dei messaggi
+Gauge("ares_ws_connections", "Connessioni WebSocket locali", callback=lambda: len(manager.active_connections))
+Gauge("ares_ws_queue_depth", "Messaggi in coda verso i client WebSocket", callback=manager.queue_depth)
+Gauge("ares_ws_topics", "Topic con almeno un iscritto locale", callback=lambda: len(manager.topics))
+Counter("ares_ws_dropped_total", "Messaggi scartati per client lenti", callback=lambda: manager.dropped)
+Counter("ares_ws_slow_disconnects_total", "Client lenti disconnessi", callback=lambda: manager.slow_disconnects)
 
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            print(f"Errore invio messaggio: {e}")
-            self.disconnect(websocket)
+async def refresh_pricing():
+    """Catalogo cambiato (posti in data.json): gli eventi di prezzo vanno agli iscritti"""
+    global pricing_version
+    version = catalog_version()
+    if version == pricing_version:
+        return
+    if pricing_version is None:
+        pricing.load(load_trips(), load_section("dynamic_pricing"))
+        pricing_version = version
+        return
+    pricing_version = version
+    # Ogni worker ricalcola (stesso data.json), pubblica solo il proprietario del topic
+    for update in pricing.sync_trips(load_trips()):
+        topic = price_topic(update["trip_id"])
+        if manager.owns(topic):
+            await manager.publish(topic, update)
 
-    async def broadcast(self, message: dict):
-        if not self.active_connections:
-            return
-        
-        dead_connections = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except:
-                dead_connections.append(connection)
-        
-        for dead in dead_connections:
-            self.disconnect(dead)
+async def update_viewers(trip_ids):
+    """Viewer = client iscritti ai prezzi del viaggio: ogni (dis)iscrizione è un evento (su tutti i worker)"""
+    await manager.announce_subscribers([price_topic(trip_id) for trip_id in trip_ids])
+
+async def reprice_viewers(topic: str):
+    # Totale viewer aggregato tra worker: tutti aggiornano il proprio motore, pubblica solo il proprietario
+    if not topic.startswith("price:"):
+        return
+    update = pricing.apply(int(topic[len("price:"):]), viewers=manager.total_subscribers(topic))
+    if update and manager.owns(topic):
+        await manager.publish(topic, update)
 
-manager = WebSocketManager()
+manager.on_subscribers = reprice_viewers
+
+# Catalogo statico: serializzato una sola volta, servito con ETag
+destinations_cache = CatalogCache(lambda: {
+    "destinations": DESTINATIONS,
+    "count": len(DESTINATIONS)
+})
+
+# Homepage: token Cesium iniettato una volta, varianti identity/gzip/brotli in memoria
+def render_homepage(html: str) -> str:
+    cesium_token = os.getenv("CESIUM_TOKEN", "")
+    if cesium_token:
+        html = html.replace("YOUR_CESIUM_TOKEN_HERE", cesium_token)
+        log.info("cesium_token_injected")
+    return html
+
+homepage_cache = PageCache(
+    "public/index.html",
+    render=render_homepage,
+    fallback="""
+        <!DOCTYPE html>
+        <html>
+        <head><title>Ares Travel</title></head>
+        <body>
+            <h1>🚀 Ares Travel</h1>
+            <p>Sistema in costruzione...</p>
+        </body>
+        </html>
+        """,
+    check_interval=float(os.getenv("HOMEPAGE_CHECK_INTERVAL", "2")),
+)
 
 # === OPENAI SETUP CON MOCK ===
 openai.api_key = os.getenv("OPENAI_API_KEY")
 USE_OPENAI = os.getenv("USE_OPENAI", "false").lower() == "true"
 
-async def get_ai_response(user_message: str) -> dict:
-    """Genera risposta intelligente con OpenAI"""
-    
-    # Context per Ares Travel
-    system_prompt = """Sei l'assistente AI di Ares Travel, un'agenzia di viaggi premium che ama creare esperienze indimenticabili! 
-    
-    Le nostre destinazioni disponibili sono:
-    - Tokyo, Giappone (€2500) - Metropoli futuristica e cultura millenaria
-    - Santorini, Grecia (€1800) - Tramonti mozzafiato sul Mar Egeo  
-    - Machu Picchu, Perù (€2200) - Cittadella inca nelle Ande
-    - Maldive (€3500) - Atolli paradisiaci nell'Oceano Indiano
-    - Reykjavík, Islanda (€2800) - Aurora boreale e paesaggi vulcanici
+# Cache risposte: domande ripetute ("prezzo", "tokyo"...) non richiamano l'API.
+# Le risposte citano catalogo e posti (data.json): svuotata quando cambia la versione
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("AI_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("AI_CACHE_TTL", "600")),
+    similarity=float(os.getenv("AI_CACHE_SIMILARITY", "0")),
+    version=catalog_version,
+)
+
+# Client unico con pool keep-alive, avviato/chiuso nel lifespan (OPENAI_BASE_URL per server locali)
+llm = LLMClient(
+    api_key=openai.api_key,
+    base_url=os.getenv("OPENAI_BASE_URL"),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "0.5")),
+    deadline=float(os.getenv("LLM_DEADLINE", "12")),
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+)
+
+QUOTA_RESPONSE = {
+    "error": True,
+    "code": 429,
+    "ui": "Credito API esaurito. Modalità demo attiva."
+}
+
+# Context per Ares Travel
+SYSTEM_PROMPT = """Sei l'assistente AI di Ares Travel, un'agenzia di viaggi premium che ama creare esperienze indimenticabili! 
     
     Il tuo stile è caloroso, entusiasta e sempre propositivo. Rispondi con varietà e creatività.
     Saluto iniziale: "Benvenuto! Posso consigliarti 2 mete basate sul periodo e budget. Preferisci mare o città?"
@@ -131,62 +330,308 @@ async def get_ai_response(user_message: str) -> dict:
     Usa emojis per rendere più vivace la conversazione e mantieni il tono entusiasta ma professionale.
     
     Mantieni le risposte coinvolgenti (2-3 frasi) e sempre con una proposta d'azione."""
+
+def catalog_sections() -> list:
+    """Catalogo per il prompt di sistema: solo dati stabili (i posti vanno nel contesto per richiesta)"""
+    trips = sorted(load_trips(), key=lambda t: (t.get("dates") or {}).get("start", ""))
+    return [
+        ("Destinazioni in evidenza sul globo:", [
+            f"{d['name']} (€{d['price']}) - {d['description']}" for d in DESTINATIONS
+        ]),
+        ("Viaggi prenotabili dal catalogo (prezzi in CHF):", [
+            f"{t['title']}: CHF {t['price_chf']}, {t['dates']['start']} → {t['dates']['end']}, "
+            f"partenze da {', '.join(t.get('origin_cities', []))}, interessi: {', '.join(t.get('interests', []))}"
+            for t in trips if t.get("dates")
+        ]),
+    ]
+
+# Prompt di sistema compilato una volta per versione del catalogo (prefisso identico tra richieste)
+prompt_builder = PromptBuilder(
+    SYSTEM_PROMPT, catalog_sections,
+    version=catalog_version,
+    token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "1200")),
+)
+
+# Memoria per sessione /ws: turni recenti + riepilogo entro CONVERSATION_TOKEN_BUDGET
+conversations = ConversationStore(
+    max_sessions=int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000")),
+    ttl=float(os.getenv("CONVERSATION_TTL", "1800")),
+    max_turns=int(os.getenv("CONVERSATION_TURNS", "12")),
+    token_budget=int(os.getenv("CONVERSATION_TOKEN_BUDGET", "600")),
+    summary_tokens=int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "150")),
+    max_bytes=int(float(os.getenv("CONVERSATION_MAX_MB", "64")) * 1024 * 1024),
+    count_tokens=prompt_builder.count_tokens,
+)
+# Sessione per user_id (sopravvive alle riconnessioni) invece che per connessione:
+# l'user_id arriva dal client, abilitarlo solo dove è già autenticato a monte
+CONVERSATION_BY_USER = os.getenv("CONVERSATION_BY_USER", "false").lower() == "true"
+
+Gauge("ares_conversation_sessions", "Sessioni di conversazione in memoria", callback=lambda: len(conversations))
+Gauge("ares_conversation_bytes", "Memoria stimata delle conversazioni", callback=lambda: conversations.bytes)
+Counter("ares_conversation_evictions_total", "Sessioni di conversazione rimosse", ("reason",),
+        callback=lambda: {(reason,): n for reason, n in conversations.evictions.items()})
+
+def build_messages(user_message: str, history: list = ()) -> list:
+    # Disponibilità reale (ricerca a faccette) in un messaggio dopo il prefisso stabile
+    context = grounding_context(search_cache.get(), user_message)
+    return prompt_builder.messages(user_message, context, history)
+
+CHAT_PARAMS = {
+    "max_tokens": 300,
+    "temperature": 0.6,
+    "presence_penalty": 0.3,
+    "frequency_penalty": 0.1
+}
+
+# Risposte senza AI per intento (vedi ares/intents.py): demo estese e fallback brevi
+MOCK_RESPONSES = {
+    "tokyo": "🗾 Tokyo è una metropoli incredibile che fonde tradizione e modernità. I nostri pacchetti includono visite ai templi storici e ai quartieri futuristici di Shibuya.",
+    "santorini": "🏛️ Santorini offre tramonti mozzafiato e architettura unica. Le nostre escursioni includono degustazioni di vino locale e tour delle tipiche case bianche.",
+    "maldive": "🏝️ Le Maldive sono il paradiso tropicale perfetto per una fuga romantica. I nostri resort offrono bungalow sull'acqua e attività subacquee esclusive.",
+    "machu": "🏔️ Machu Picchu è un'esperienza spirituale unica nelle Ande. I nostri tour includono trekking guidati e visite ai siti archeologici più importanti.",
+    "islanda": "❄️ L'Islanda offre paesaggi vulcanici e aurore boreali spettacolari. Le nostre escursioni includono bagni termali e tour dei geyser più famosi.",
+    "prezzo": "💰 I nostri prezzi vanno da €1800 (Santorini) a €3500 (Maldive). Tutti i pacchetti includono volo, hotel 4 stelle e escursioni guidate.",
+    "viaggio": "✈️ Offriamo 5 destinazioni esclusive con pacchetti completi. Ogni viaggio include servizi premium e guide esperte locali per un'esperienza indimenticabile."
+}
+MOCK_DEFAULT = "🌍 Grazie per la tua domanda su '{text}'. I nostri consulenti sono specializzati in viaggi premium verso destinazioni esclusive. Come posso aiutarti a pianificare la tua prossima avventura?"
+
+FALLBACK_RESPONSES = {
+    "tokyo": "🗾 Tokyo è una destinazione fantastica! Vuoi vedere i dettagli del viaggio?",
+    "santorini": "🏛️ Santorini offre tramonti indimenticabili! Ti interessa prenotare?",
+    "maldive": "🏝️ Le Maldive sono il paradiso tropicale! Posso mostrarti i nostri pacchetti.",
+    "machu": "🏔️ Machu Picchu è un'esperienza mistica! Ti piacerebbe esplorare le Ande?",
+    "islanda": "❄️ L'Islanda offre aurore boreali spettacolari! Quando vorresti partire?",
+    "prezzo": "💰 Santorini €1800 | Tokyo €2500 | Machu Picchu €2200 | Islanda €2800 | Maldive €3500. Quale ti interessa?",
+    "viaggio": "✈️ Perfetto! Abbiamo 5 destinazioni incredibili. Clicca sui pin colorati sul globo per esplorare!",
+    "test": "🔧 Sistema funzionante! Pronto per pianificare il tuo viaggio da sogno?"
+}
+FALLBACK_DEFAULT = "🌍 Ho ricevuto: '{text}'. Come posso aiutarti con i tuoi viaggi?"
+
+def mock_ai_response(user_message: str) -> dict:
+    """Risposte demo senza OpenAI (anche fallback quando il limiter è saturo)"""
+    # Richieste con filtri riconoscibili (mete, interessi, partenze, mesi, budget): risposta dal catalogo
+    search = search_cache.get()
+    query = search.parse_query(user_message)
+    if query:
+        found = search.search(limit=3, **query)
+        if found["total"]:
+            for trip in found["results"]:
+                analytics.incr(trip["id"], "ai_suggestions")
+            lines = "\n".join(f"• {format_trip(t)}" for t in found["results"])
+            return {"text": f"✈️ Ho trovato {trips_found(found['total'])} per te:\n{lines}\nVuoi che ti mostri i dettagli o prenotiamo?", "mock": True}
     
+    return {"text": matcher.reply(user_message, MOCK_RESPONSES, MOCK_DEFAULT), "mock": True}
+
+async def get_ai_response(user_message: str, history: list = ()) -> dict:
+    """Genera risposta intelligente con OpenAI (history: turni precedenti della sessione)"""
     if not USE_OPENAI:
-        # MOCK RESPONSE
-        print(f"[MOCK] User: {user_message}")
-        mock_responses = {
-            "tokyo": "🗾 Tokyo è una metropoli incredibile che fonde tradizione e modernità. I nostri pacchetti includono visite ai templi storici e ai quartieri futuristici di Shibuya.",
-            "santorini": "🏛️ Santorini offre tramonti mozzafiato e architettura unica. Le nostre escursioni includono degustazioni di vino locale e tour delle tipiche case bianche.",
-            "maldive": "🏝️ Le Maldive sono il paradiso tropicale perfetto per una fuga romantica. I nostri resort offrono bungalow sull'acqua e attività subacquee esclusive.",
-            "machu": "🏔️ Machu Picchu è un'esperienza spirituale unica nelle Ande. I nostri tour includono trekking guidati e visite ai siti archeologici più importanti.",
-            "islanda": "❄️ L'Islanda offre paesaggi vulcanici e aurore boreali spettacolari. Le nostre escursioni includono bagni termali e tour dei geyser più famosi.",
-            "prezzo": "💰 I nostri prezzi vanno da €1800 (Santorini) a €3500 (Maldive). Tutti i pacchetti includono volo, hotel 4 stelle e escursioni guidate.",
-            "viaggio": "✈️ Offriamo 5 destinazioni esclusive con pacchetti completi. Ogni viaggio include servizi premium e guide esperte locali per un'esperienza indimenticabile."
-        }
-        
-        for key, response in mock_responses.items():
-            if key in user_message.lower():
-                return {"text": response, "mock": True}
-        
-        return {"text": f"🌍 Grazie per la tua domanda su '{user_message}'. I nostri consulenti sono specializzati in viaggi premium verso destinazioni esclusive. Come posso aiutarti a pianificare la tua prossima avventura?", "mock": True}
+        chat_log.debug("mock_reply", chars=len(user_message))
+        return mock_ai_response(user_message)
+    
+    async def ask_openai() -> dict:
+        try:
+            messages = build_messages(user_message, history)
+            prompt_tokens = prompt_builder.count_messages(messages)
+            response = await llm.complete(messages, **CHAT_PARAMS)
+            prompt_builder.record(prompt_tokens, response.usage)
+            chat_log.debug("llm_prompt", estimated_tokens=prompt_tokens,
+                      provider_tokens=getattr(response.usage, "prompt_tokens", None))
+            
+            return {"text": response.choices[0].message.content.strip(), "mock": False}
+            
+        except QuotaExceeded as e:
+            log.warning("llm_quota_exceeded", error=str(e))
+            return dict(QUOTA_RESPONSE)
+        except LimiterSaturated:
+            # Troppe chiamate in volo: degrada al mock invece di accodare
+            return {**mock_ai_response(user_message), "degraded": True}
+    
+    # La risposta dipende dallo storico: la cache vale solo per il primo messaggio
+    if history:
+        return await ask_openai()
+    
+    # Cache + coalescing: errori (429) e risposte degradate non vengono memorizzati
+    return await response_cache.get_or_compute(
+        user_message, ask_openai,
+        cacheable=lambda r: not r.get("error") and not r.get("degraded")
+    )
+
+async def stream_ai_response(user_message: str, history: list = ()) -> AsyncIterator[str]:
+    """Come get_ai_response ma produce delta di testo (solleva QuotaExceeded)"""
+    if not USE_OPENAI:
+        yield mock_ai_response(user_message)["text"]
+        return
+    
+    cached = None if history else response_cache.get(user_message, count=True)
+    if cached is not None:
+        yield cached["text"]
+        return
+    
+    version = response_cache.version()
+    messages = build_messages(user_message, history)
+    prompt_tokens = prompt_builder.count_messages(messages)
+    prompt_builder.record(prompt_tokens)
+    chat_log.debug("llm_prompt", estimated_tokens=prompt_tokens, stream=True)
     
+    parts = []
     try:
-        client = openai.AsyncOpenAI(api_key=openai.api_key)
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=300,
-            temperature=0.6,
-            presence_penalty=0.3,
-            frequency_penalty=0.1
-        )
+        async for delta in llm.stream(messages, **CHAT_PARAMS):
+            parts.append(delta)
+            yield delta
+    except LimiterSaturated:
+        yield mock_ai_response(user_message)["text"]
+        return
+    
+    text = "".join(parts).strip()
+    if text and not history:
+        response_cache.put(user_message, {"text": text, "mock": False}, version)
+
+def fallback_response(user_text: str) -> str:
+    """Risposte predefinite quando l'AI non è raggiungibile"""
+    return matcher.reply(user_text, FALLBACK_RESPONSES, FALLBACK_DEFAULT)
+
+async def stream_to_websocket(user_text: str, websocket: WebSocket, request_id: str, session: str = None,
+                              user_id: str = None):
+    """Streaming token-by-token: N frame assistant_delta + un assistant_done"""
+    parts = []
+    history = chat_history(session, user_id)
+    try:
+        async for delta in stream_ai_response(user_text, history):
+            parts.append(delta)
+            await manager.send_personal_message({
+                "type": "assistant_delta",
+                "id": request_id,
+                "text": delta
+            }, websocket)
+    except QuotaExceeded:
+        await manager.send_personal_message({**QUOTA_RESPONSE, "id": request_id}, websocket)
+        return
+    except Exception as e:
+        log.warning("ai_fallback", error_class=classify_error(e), error=str(e))
+        if not parts:
+            parts.append(fallback_response(user_text))
+            await manager.send_personal_message({
+                "type": "assistant_delta",
+                "id": request_id,
+                "text": parts[0]
+            }, websocket)
+    
+    text = "".join(parts)
+    if session and text:
+        conversations.append(session, user_text, text)
+    await manager.send_personal_message({
+        "type": "assistant_done",
+        "id": request_id,
+        "text": text
+    }, websocket)
+
+async def answer_chat(user_text: str, message_type: str, websocket: WebSocket, request_id: str, session: str = None,
+                      user_id: str = None):
+    """Risposta AI completa a un messaggio chat (eseguita come task del dispatcher)"""
+    try:
+        ai_response = await get_ai_response(user_text, chat_history(session, user_id))
         
-        return {"text": response.choices[0].message.content.strip(), "mock": False}
+        if ai_response.get("error"):
+            # Gestione quota 429
+            await manager.send_personal_message({**ai_response, "id": request_id}, websocket)
+            return
+        
+        response = ai_response["text"]
         
     except Exception as e:
-        print(f"OpenAI API error: {e}")
-        if "429" in str(e) or "insufficient_quota" in str(e):
-            return {
-                "error": True,
-                "code": 429,
-                "ui": "Credito API esaurito. Modalità demo attiva."
-            }
-        raise e
+        log.warning("ai_fallback", error_class=classify_error(e), error=str(e))
+        response = fallback_response(user_text)
+    
+    if session:
+        conversations.append(session, user_text, response)
+    
+    # PROTOCOLLO SEMPLICE - Invia risposta
+    if message_type == "user":
+        # Formato nuovo
+        await manager.send_personal_message({
+            "type": "assistant",
+            "id": request_id,
+            "text": response
+        }, websocket)
+    else:
+        # Formato legacy
+        await manager.send_personal_message({
+            "message": response
+        }, websocket)
+
+# === HEALTH PROBES (background) ===
+async def probe_openai() -> dict:
+    """Stato OpenAI: passivo dal traffico reale, altrimenti una mini-chiamata"""
+    details = {"mode": "mock", "enabled": USE_OPENAI}
+    if not USE_OPENAI:
+        return {"status": "mock", "ok": True, "details": details}
+    if not openai.api_key:
+        details["error"] = "API key mancante"
+        return {"status": "no_key", "ok": False, "details": details}
+    
+    # Traffico reale recente: nessuna chiamata a pagamento
+    window = time.time() - prober.interval
+    last_error = llm.last_error if llm.last_error and llm.last_error[1] > window else None
+    if last_error and last_error[0] == "quota":
+        details["error"] = "Quota esaurita"
+        return {"status": "quota", "ok": True, "details": details}
+    if llm.last_success_at and llm.last_success_at > window and not last_error:
+        details["last_test"] = "passive"
+        return {"status": "live", "ok": True, "details": details}
+    
+    try:
+        await llm.complete([{"role": "user", "content": "ping"}], attempts=1, max_tokens=1, temperature=0)
+        details["last_test"] = "ok"
+        return {"status": "live", "ok": True, "details": details}
+    except QuotaExceeded:
+        details["error"] = "Quota esaurita"
+        return {"status": "quota", "ok": True, "details": details}
+    except LimiterSaturated:
+        details["last_test"] = "busy"
+        return {"status": "live", "ok": True, "details": details}
+    except Exception as e:
+        details["error"] = str(e)[:100]
+        return {"status": "error", "ok": False, "details": details}
+
+async def probe_globe() -> dict:
+    token = bool(os.getenv("CESIUM_TOKEN"))
+    return {
+        "status": "cesium" if token else "fallback",
+        "ok": True,
+        "details": {
+            "cesium_token": token,
+            "destinations_loaded": len(DESTINATIONS)
+        }
+    }
+
+prober = HealthProber(
+    {"openai": probe_openai, "globe": probe_globe},
+    interval=float(os.getenv("HEALTH_PROBE_INTERVAL", "300")),
+)
 
 # === LIFESPAN SETUP ===
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("🚀 Ares Travel v5.0 - Sistema Completo")
-    print(f"📍 {len(DESTINATIONS)} destinazioni caricate")
-    print("✅ Server pronto!")
+    if USE_OPENAI:
+        await llm.start()
+    await manager.start()
+    await prober.start()
+    homepage_cache.variants()
+    await refresh_pricing()
+    await refresh_recommendations()
+    analytics.seed(load_section("analytics"))
+    analytics.start()
+    system_prompt = prompt_builder.system_prompt()
+    log.info("startup", version="5.0", destinations=len(DESTINATIONS), priced_trips=len(pricing.trips),
+             prompt_tokens=system_prompt.tokens, prompt_budget=prompt_builder.token_budget, openai=USE_OPENAI)
     yield
     # Shutdown - operations when shutting down
-    print("🛑 Sistema fermato")
+    await asyncio.to_thread(analytics.stop)
+    await prober.stop()
+    await manager.stop()
+    await llm.close()
+    log.info("shutdown")
 
 # === APP SETUP ===
 app = FastAPI(
@@ -203,98 +648,164 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Ultimo aggiunto = più esterno: misura anche CORS e gli errori
+app.add_middleware(MetricsMiddleware)
+
+# Texture e asset: URL hashati (python -m ares.assets build) immutabili, Range supportato
+app.mount("/assets", AssetFiles(directory="public/assets", check_dir=False), name="assets")
 
 # === ROUTES ===
 @app.get("/")
-async def homepage():
-    """Homepage con token Cesium injection"""
-    try:
-        with open("public/index.html", "r", encoding="utf-8") as f:
-            html = f.read()
-        
-        # Inject Cesium token
-        cesium_token = os.getenv("CESIUM_TOKEN", "")
-        if cesium_token:
-            html = html.replace("YOUR_CESIUM_TOKEN_HERE", cesium_token)
-            print(f"✅ Token Cesium injected: {cesium_token[:15]}...")
-        
-        return HTMLResponse(html)
-        
-    except FileNotFoundError:
-        return HTMLResponse("""
-        <!DOCTYPE html>
-        <html>
-        <head><title>Ares Travel</title></head>
-        <body>
-            <h1>🚀 Ares Travel</h1>
-            <p>Sistema in costruzione...</p>
-        </body>
-        </html>
-        """)
+async def homepage(request: Request):
+    """Homepage con token Cesium injection (renderizzata una volta, servita da memoria)"""
+    return homepage_cache.response(request)
 
 @app.get("/health")
 async def health_check():
-    """Health check dettagliato per monitoraggio"""
-    # Test WS
-    ws_connections = len(manager.active_connections)
-    ws_status = ws_connections > 0
-    
-    # Test OpenAI dettagliato
-    openai_status = "mock"
-    openai_details = {"mode": "mock", "enabled": USE_OPENAI}
-    
-    if USE_OPENAI:
-        if not openai.api_key:
-            openai_status = "no_key"
-            openai_details["error"] = "API key mancante"
-        else:
-            try:
-                test_response = await get_ai_response("test")
-                if test_response.get("error"):
-                    openai_status = "quota"
-                    openai_details["error"] = "Quota esaurita"
-                else:
-                    openai_status = "live"
-                    openai_details["last_test"] = "ok"
-            except Exception as e:
-                openai_status = "error"
-                openai_details["error"] = str(e)[:100]
-    
-    # Globe status evoluto
-    globe_status = "cesium" if os.getenv("CESIUM_TOKEN") else "fallback"
-    globe_details = {
-        "cesium_token": bool(os.getenv("CESIUM_TOKEN")),
-        "destinations_loaded": len(DESTINATIONS)
-    }
-    
-    # Logging dettagliato
-    print(f"[CHECK] WS {'ok' if ws_status else 'no connections'} ({ws_connections})")
-    if USE_OPENAI:
-        print(f"[CHECK] OpenAI {openai_status}")
-    print(f"[CHECK] Globe {globe_status}")
+    """Health check dettagliato: snapshot dei probe in background (nessuna chiamata upstream)"""
+    ws_connections = manager.total_connections()
+    openai_probe = prober.get("openai")
+    globe_probe = prober.get("globe")
     
     return {
         "status": "ok",
         "timestamp": datetime.now().isoformat(),
         "destinations": len(DESTINATIONS),
         "connections": ws_connections,
-        "ws": ws_status,
-        "globe": globe_status,
-        "globe_details": globe_details,
-        "openai": openai_status,
-        "openai_details": openai_details,
+        "ws": ws_connections > 0,
+        "workers": 1 + len(manager.peers),
+        "pubsub": manager.pubsub.stats(),
+        "ws_queues": manager.stats(),
+        "globe": globe_probe["status"],
+        "globe_details": globe_probe["details"],
+        "openai": openai_probe["status"],
+        "openai_details": openai_probe["details"],
+        "probe_age_s": prober.age,
+        "ai_cache": response_cache.stats(),
+        "llm": llm.stats(),
+        "prompt": prompt_builder.stats(),
+        "pricing": pricing.stats(),
+        "analytics": analytics.stats(),
+        "conversations": conversations.stats(),
+        "recommendations": dict(recommender.stats() if recommender else {"available": False},
+                                notifications=notifications.stats()),
         "version": "5.1"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metriche Prometheus (HTTP per route, WebSocket, LLM, storage)"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/livez")
+async def liveness():
+    """Liveness per load balancer: il processo risponde"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness: 503 finché i probe non sono passati"""
+    snapshot = prober.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
 @app.get("/destinations")
-async def get_destinations():
-    """Destinazioni per globe"""
+async def get_destinations(request: Request):
+    """Destinazioni per globe (bytes precomputati, 304 con If-None-Match)"""
+    # L'ora del server arriva nell'header Date della risposta
+    return cached_response(request, destinations_cache.get())
+
+# === PREZZI DINAMICI ===
+@app.get("/pricing")
+async def get_prices():
+    await refresh_pricing()
+    return {"prices": pricing.prices()}
+
+@app.get("/pricing/{trip_id}")
+async def get_price_history(trip_id: int):
+    """Prezzo corrente, ultimi cambi (ring buffer) e aggregati orari"""
+    await refresh_pricing()
+    history = pricing.history(trip_id)
+    if history is None:
+        return JSONResponse({"error": "Viaggio non trovato"}, status_code=404)
+    return history
+
+# === RACCOMANDAZIONI ===
+@app.get("/recommendations/{user_id}")
+async def get_recommendations(user_id: str):
+    """Top-k precalcolati dell'utente (popolari se sconosciuto) e notifiche attive, in sola lettura"""
+    if not RECOMMEND_BY_USER:
+        return JSONResponse({"error": "Raccomandazioni per utente non abilitate"}, status_code=403)
+    return user_recommendations(user_id)
+
+# === ANALYTICS (dashboard admin) ===
+@app.get("/admin/analytics")
+async def analytics_totals():
+    """Totali per viaggio (flushati + in memoria), senza passare dallo store prenotazioni"""
+    return {"trips": list(analytics.totals().values()), "stats": analytics.stats()}
+
+@app.get("/admin/analytics/{trip_id}")
+async def analytics_series(
+    trip_id: int,
+    metric: str = Query("views", pattern="^(" + "|".join(METRICS) + ")$"),
+    resolution: str = Query("hour", pattern="^(" + "|".join(RESOLUTIONS) + ")$"),
+    hours: int = Query(24, ge=1, le=24 * 365)
+):
+    since = time.time() - hours * 3600
     return {
-        "destinations": DESTINATIONS,
-        "count": len(DESTINATIONS),
-        "server_time": datetime.now().strftime("%H:%M:%S")
+        "trip_id": trip_id,
+        "metric": metric,
+        "resolution": resolution,
+        "series": analytics.series(trip_id, metric, resolution, since=since),
+        "totals": analytics.totals(trip_id).get(trip_id)
     }
 
+# === RICERCA VIAGGI ===
+@app.get("/search")
+async def search_trips(
+    interests: List[str] = Query(None), origin: List[str] = Query(None), month: List[int] = Query(None),
+    q: str = Query(None, max_length=200),
+    min_price: float = Query(None, ge=0), max_price: float = Query(None, ge=0),
+    date_from: str = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"), date_to: str = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    guests: int = Query(1, ge=1, le=20), sort: str = Query("price", pattern="^(price|date)$"),
+    limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)
+):
+    """Ricerca a faccette: AND tra filtri, OR dentro lo stesso filtro, conteggi per faccetta"""
+    # q: testo libero interpretato come in chat ("natura da Milano a ottobre sotto 2500")
+    return search_cache.get().find(
+        q, interests=interests or [], origins=origin or [], months=month or [],
+        min_price=min_price, max_price=max_price, date_from=date_from, date_to=date_to,
+        guests=guests, sort=sort, limit=limit, offset=offset
+    )
+
+# === RICERCA GEOGRAFICA (globe: solo ciò che è visibile) ===
+@app.get("/geo/bbox")
+async def geo_bbox(
+    south: float = Query(..., ge=-90, le=90), west: float = Query(..., ge=-540, le=540),
+    north: float = Query(..., ge=-90, le=90), east: float = Query(..., ge=-540, le=540),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """Elementi nel rettangolo (west > east = attraversa l'antimeridiano)"""
+    items = geo_cache.get().bbox(south, west, north, east, limit=limit)
+    return {"count": len(items), "items": items}
+
+@app.get("/geo/nearest")
+async def geo_nearest(
+    lat: float = Query(..., ge=-90, le=90), lng: float = Query(..., ge=-540, le=540),
+    k: int = Query(10, ge=1, le=100), max_km: float = Query(None, gt=0)
+):
+    """k elementi più vicini al punto (distanza haversine)"""
+    results = geo_cache.get().nearest(lat, lng, k=k, max_km=max_km)
+    return {"results": [dict(item, distance_km=round(d, 1)) for d, item in results]}
+
+@app.get("/geo/clusters")
+async def geo_clusters(
+    zoom: int = Query(..., ge=0, le=16),
+    south: float = Query(-90, ge=-90, le=90), west: float = Query(-180, ge=-540, le=540),
+    north: float = Query(90, ge=-90, le=90), east: float = Query(180, ge=-540, le=540)
+):
+    """Cluster lato server per livello di zoom nel viewport"""
+    return {"zoom": zoom, "clusters": geo_cache.get().clusters(zoom, south, west, north, east)}
+
 @app.get("/api/test-openai")
 async def test_openai():
     """Test diagnostico OpenAI con timing"""
@@ -306,29 +817,30 @@ async def test_openai():
     
     try:
         start_time = time.time()
-        client = openai.AsyncOpenAI(api_key=openai.api_key)
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": "Test rapido, rispondi solo 'OK'"}],
+        await llm.complete(
+            [{"role": "user", "content": "Test rapido, rispondi solo 'OK'"}],
+            attempts=1,
             max_tokens=10,
             temperature=0
         )
         elapsed = int((time.time() - start_time) * 1000)
         
         if elapsed > 1500:
-            print(f"[OpenAI] ⚠️ Test lento: {elapsed}ms")
+            log.warning("openai_test_slow", elapsed_ms=elapsed)
             return {"ok": False, "error": f"Troppo lento ({elapsed}ms)", "response_time": elapsed}
         
-        print(f"[OpenAI] ✅ Test OK in {elapsed}ms")
-        return {"ok": True, "response_time": elapsed, "model": "gpt-3.5-turbo"}
+        log.info("openai_test_ok", elapsed_ms=elapsed)
+        return {"ok": True, "response_time": elapsed, "model": llm.model}
         
+    except LimiterSaturated as e:
+        return {"ok": False, "error": "Limiter saturo", "details": str(e)}
     except Exception as e:
         error_msg = str(e)
-        print(f"[OpenAI] ❌ Test fallito: {error_msg}")
-        
-        if "quota" in error_msg.lower() or "rate_limit" in error_msg.lower():
+        kind = "quota" if isinstance(e, QuotaExceeded) else classify_error(e)
+        log.warning("openai_test_failed", error_class=kind, error=error_msg)
+        if kind in ("quota", "rate_limit"):
             return {"ok": False, "error": "Quota esaurita", "details": error_msg}
-        elif "invalid" in error_msg.lower():
+        elif kind == "auth":
             return {"ok": False, "error": "API key invalida", "details": error_msg}
         else:
             return {"ok": False, "error": "Errore generico", "details": error_msg}
@@ -348,26 +860,40 @@ async def chat_endpoint(message: ChatMessage):
             return ai_response
         return {"response": ai_response["text"]}
     except Exception as e:
-        print(f"❌ AI error: {e}")
-        # Fallback a risposte predefinite
-        if "prezzo" in user_text.lower() or "costo" in user_text.lower() or "economico" in user_text.lower():
-            response = "💰 I nostri viaggi vanno da €1800 (Santorini) a €3500 (Maldive). Quale ti interessa?"
-        elif "tokyo" in user_text.lower():
-            response = "🗾 Tokyo è una destinazione fantastica! Vuoi vedere i dettagli del viaggio?"
-        elif "santorini" in user_text.lower():
-            response = "🏛️ Santorini offre tramonti indimenticabili! Ti interessa prenotare?"
-        elif "maldive" in user_text.lower():
-            response = "🏝️ Le Maldive sono il paradiso tropicale! Posso mostrarti i nostri pacchetti."
-        elif "machu" in user_text.lower() or "peru" in user_text.lower():
-            response = "🏔️ Machu Picchu è un'esperienza mistica! Ti piacerebbe esplorare le Ande?"
-        elif "islanda" in user_text.lower() or "iceland" in user_text.lower():
-            response = "❄️ L'Islanda offre aurore boreali spettacolari! Quando vorresti partire?"
-        elif "viaggio" in user_text.lower() or "viaggi" in user_text.lower():
-            response = "✈️ Perfetto! Abbiamo 5 destinazioni incredibili. Quale preferisci?"
-        else:
-            response = f"🌍 Ho ricevuto: '{user_text}'. Come posso aiutarti con i tuoi viaggi?"
-        
-        return {"response": response}
+        log.warning("ai_fallback", error_class=classify_error(e), error=str(e))
+        return {"response": fallback_response(user_text)}
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage):
+    """Chat HTTP in streaming (Server-Sent Events: delta, done, error)"""
+    user_text = message.text.strip()
+    
+    def sse(event: str, payload: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    async def events():
+        if not user_text:
+            yield sse("done", {"text": "Messaggio vuoto ricevuto"})
+            return
+        parts = []
+        try:
+            async for delta in stream_ai_response(user_text):
+                parts.append(delta)
+                yield sse("delta", {"text": delta})
+        except QuotaExceeded:
+            yield sse("error", dict(QUOTA_RESPONSE))
+            return
+        except Exception as e:
+            log.warning("ai_fallback", error_class=classify_error(e), error=str(e))
+            if not parts:
+                parts.append(fallback_response(user_text))
+                yield sse("delta", {"text": parts[0]})
+        yield sse("done", {"text": "".join(parts)})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -382,13 +908,32 @@ async def websocket_endpoint(websocket: WebSocket):
     
     last_activity = time.time()
     
+    # Le richieste AI girano come task: il loop continua a leggere (ping, cancel)
+    dispatcher = ConnectionDispatcher(max_inflight=WS_MAX_INFLIGHT, max_pending=WS_MAX_PENDING)
+    # Viaggi di cui il client riceve i price_update
+    watching = set()
+    # Memoria della chat: per connessione, o per user_id con CONVERSATION_BY_USER
+    connection_session = session = f"ws:{new_request_id()}"
+    # Utente dichiarato dal client (identify o campo user_id): consigli e contesto chat,
+    # usato solo con RECOMMEND_BY_USER / CONVERSATION_BY_USER
+    user_id = None
+    
+    async def notify_cancelled(request_id: str):
+        await manager.send_personal_message({
+            "type": "assistant_cancelled",
+            "id": request_id
+        }, websocket)
+    
     try:
         while True:
             try:
                 # Timeout 60s per rilevare connessioni morte
                 data = await asyncio.wait_for(websocket.receive_text(), timeout=60.0)
+                WS_MESSAGES.inc(direction="in")
                 msg_data = json.loads(data)
                 last_activity = time.time()
+                if msg_data.get("user_id") and (RECOMMEND_BY_USER or CONVERSATION_BY_USER):
+                    user_id = str(msg_data["user_id"])[:128]
                 
                 # Handle ping/pong keep-alive
                 if msg_data.get("type") == "ping":
@@ -398,57 +943,81 @@ async def websocket_endpoint(websocket: WebSocket):
                     }, websocket)
                     continue
                 
+                # Cancellazione esplicita: {"type": "cancel", "id": "..."} (senza id: tutte)
+                if msg_data.get("type") == "cancel":
+                    dispatcher.cancel(msg_data.get("id"))
+                    continue
+                
+                # Consigli per il globo: {"type": "identify", "user_id": "..."}
+                if msg_data.get("type") == "identify":
+                    if user_id and RECOMMEND_BY_USER:
+                        await manager.send_personal_message({
+                            "type": "recommendations",
+                            **user_recommendations(user_id, notify=True)
+                        }, websocket)
+                    continue
+                
+                # Prezzi live: {"type": "subscribe_prices", "trip_ids": [1, 2]} (senza ids: tutti)
+                if msg_data.get("type") == "subscribe_prices":
+                    await refresh_pricing()
+                    requested = msg_data.get("trip_ids") or list(pricing.trips)
+                    trip_ids = [t for t in requested if isinstance(t, int) and t in pricing.trips]
+                    manager.subscribe(websocket, [price_topic(t) for t in trip_ids])
+                    added = set(trip_ids) - watching
+                    watching |= added
+                    for trip_id in added:
+                        analytics.incr(trip_id, "views")
+                    await update_viewers(added)
+                    # Con un utente noto ogni viaggio guardato aggiorna i suoi top-k
+                    if user_id and RECOMMEND_BY_USER and recommender is not None and msg_data.get("trip_ids"):
+                        schedule_recommendations_refresh()
+                        changed = [recommender.observe(user_id, t, "view_trip") for t in added]
+                        if any(changed):
+                            await manager.send_personal_message({
+                                "type": "recommendations",
+                                **user_recommendations(user_id, notify=True)
+                            }, websocket)
+                    await manager.send_personal_message({
+                        "type": "price_snapshot",
+                        "prices": pricing.prices(trip_ids)
+                    }, websocket)
+                    continue
+                
+                if msg_data.get("type") == "unsubscribe_prices":
+                    removed = watching & set(msg_data.get("trip_ids") or watching)
+                    manager.unsubscribe(websocket, [price_topic(t) for t in removed])
+                    watching -= removed
+                    await update_viewers(removed)
+                    continue
+                
                 # Handle chat messages
                 user_text = msg_data.get("text", "").strip()
                 message_type = msg_data.get("type", "legacy")
                 
                 if user_text:
-                    print(f"💬 Ricevuto: {user_text}")
+                    chat_log.debug("ws_chat_message", type=message_type, chars=len(user_text))
+                    request_id = str(msg_data.get("id") or new_request_id())
+                    if CONVERSATION_BY_USER and user_id:
+                        session = f"user:{user_id}"
                     
-                    # Processa con AI
-                    try:
-                        ai_response = await get_ai_response(user_text)
-                        
-                        if ai_response.get("error"):
-                            # Gestione quota 429
-                            await manager.send_personal_message(ai_response, websocket)
-                            continue
-                        
-                        response = ai_response["text"]
-                        
-                    except Exception as e:
-                        print(f"❌ AI fallback: {e}")
-                        # Fallback logica
-                        if "tokyo" in user_text.lower():
-                            response = "🗾 Tokyo è una destinazione fantastica! Vuoi vedere i dettagli del viaggio?"
-                        elif "santorini" in user_text.lower():
-                            response = "🏛️ Santorini offre tramonti indimenticabili! Ti interessa prenotare?"
-                        elif "maldive" in user_text.lower():
-                            response = "🏝️ Le Maldive sono il paradiso tropicale! Posso mostrarti i nostri pacchetti."
-                        elif "machu" in user_text.lower() or "peru" in user_text.lower():
-                            response = "🏔️ Machu Picchu è un'esperienza mistica! Ti piacerebbe esplorare le Ande?"
-                        elif "islanda" in user_text.lower():
-                            response = "❄️ L'Islanda offre aurore boreali spettacolari! Quando vorresti partire?"
-                        elif "prezzo" in user_text.lower() or "costo" in user_text.lower() or "economico" in user_text.lower():
-                            response = "💰 Santorini €1800 | Tokyo €2500 | Machu Picchu €2200 | Islanda €2800 | Maldive €3500. Quale ti interessa?"
-                        elif "viaggio" in user_text.lower():
-                            response = "✈️ Perfetto! Abbiamo 5 destinazioni incredibili. Clicca sui pin colorati sul globo per esplorare!"
-                        elif "test" in user_text.lower():
-                            response = "🔧 Sistema funzionante! Pronto per pianificare il tuo viaggio da sogno?"
-                        else:
-                            response = f"🌍 Ho ricevuto: '{user_text}'. Come posso aiutarti con i tuoi viaggi?"
+                    # {"replace": true}: il nuovo messaggio annulla le generazioni in corso
+                    if msg_data.get("replace"):
+                        dispatcher.cancel()
                     
-                    # PROTOCOLLO SEMPLICE - Invia risposta
-                    if message_type == "user":
-                        # Formato nuovo
-                        await manager.send_personal_message({
-                            "type": "assistant",
-                            "text": response
-                        }, websocket)
+                    # Streaming opt-in: {"type": "user", "stream": true}
+                    if message_type == "user" and msg_data.get("stream"):
+                        job = partial(stream_to_websocket, user_text, websocket, request_id, session, user_id)
                     else:
-                        # Formato legacy
+                        job = partial(answer_chat, user_text, message_type, websocket, request_id, session, user_id)
+                    try:
+                        dispatcher.submit(request_id, job, on_cancel=notify_cancelled)
+                    except RequestRejected as e:
                         await manager.send_personal_message({
-                            "message": response
+                            "type": "error",
+                            "id": request_id,
+                            "code": e.code,
+                            "message": "Troppe richieste in corso, riprova tra poco" if e.code == "busy"
+                                       else "ID richiesta già in uso"
                         }, websocket)
                 
                 # Handle destination clicks
@@ -468,9 +1037,9 @@ async def websocket_endpoint(websocket: WebSocket):
                             "type": "ping",
                             "server_time": int(current_time * 1000)
                         }, websocket)
-                        print(f"[WS] Keep-alive ping inviato")
+                        chat_log.debug("ws_keepalive_ping")
                     except Exception as e:
-                        print(f"[WS] Errore ping keep-alive: {e}")
+                        log.warning("ws_keepalive_failed", error=str(e))
                         break
                         
             except json.JSONDecodeError:
@@ -480,11 +1049,17 @@ async def websocket_endpoint(websocket: WebSocket):
                 }, websocket)
                 
     except WebSocketDisconnect as e:
-        print(f"❌ WebSocket disconnesso. Code: {e.code}, Reason: {getattr(e, 'reason', 'N/A')}")
+        chat_log.info("ws_closed", code=e.code, reason=getattr(e, "reason", None))
         manager.disconnect(websocket)
     except Exception as e:
-        print(f"❌ WebSocket errore: {e}")
+        log.warning("ws_error", error=str(e))
+        manager.disconnect(websocket)
+    finally:
+        await dispatcher.close()
+        conversations.discard(connection_session)
+        # Il client non guarda più i viaggi a cui era iscritto
         manager.disconnect(websocket)
+        await update_viewers(watching)
 
 # Modernized lifespan events implemented above
 